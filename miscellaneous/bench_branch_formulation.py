@@ -0,0 +1,41 @@
+"""
+Benchmark: branch selection formulations of cp_solver (see add_branch_constraints)
+model build time, number of constraints and solve time for every process/resource file of the offline testsets.
+
+Usage: python -m miscellaneous.bench_branch_formulation [testsets_dir] [instances] [timeout]
+"""
+from src.ra_pst_py.builder import build_rapst
+from src.ra_pst_py.cp_docplex import cp_solver, add_unfixed_instance, add_branch_constraints, BRANCH_FORMULATIONS
+
+from docplex.cp.model import CpoModel
+from pathlib import Path
+import copy
+import sys
+import time
+
+
+def bench(testsets_dir="testsets_final_offline", instances=5, timeout=60):
+    instances, timeout = int(instances), int(timeout)
+    for testset in sorted(Path(testsets_dir).iterdir()):
+        process_file = next((testset / "process").glob("*.xml"))
+        for resource_file in sorted((testset / "resources").glob("*.xml")):
+            ra_pst = build_rapst(process_file, resource_file)
+            schedule = {"instances": [ra_pst.get_ilp_rep(instance_id=f"i{i}") for i in range(instances)]}
+            schedule["resources"] = schedule["instances"][0]["resources"]
+            print(f"{testset.name}/{resource_file.stem}")
+            for formulation in BRANCH_FORMULATIONS:
+                build_schedule = copy.deepcopy(schedule)
+                model = CpoModel()
+                start = time.perf_counter()
+                constraints = 0
+                for ilp_rep in build_schedule["instances"]:
+                    add_unfixed_instance(model, ilp_rep)
+                    constraints += len(add_branch_constraints(model, ilp_rep, formulation))
+                build_time = time.perf_counter() - start
+                result = cp_solver(copy.deepcopy(schedule), log_file="cpo_solver.log", timeout=timeout, branch_formulation=formulation)
+                print(f"    {formulation:12s} build: {build_time*1000:8.2f}ms {constraints:6d} branch constraints | "
+                      f"solve: {result['solution']['computing time']:8.2f}s objective: {result['solution']['objective']} ({result['solution']['solver status']})")
+
+
+if __name__ == "__main__":
+    bench(*sys.argv[1:4])
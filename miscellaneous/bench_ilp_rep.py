@@ -0,0 +1,31 @@
+"""
+Micro-benchmark for RA_PST.get_ilp_rep:
+compact task level precedence vs. the dense (previous) precedence encoding.
+
+Usage: python -m miscellaneous.bench_ilp_rep [testset_dir]
+"""
+from src.ra_pst_py.builder import build_rapst
+
+from pathlib import Path
+import sys
+import time
+
+
+def bench(directory="testsets_final_online/30_generated", repeat=3):
+    directory = Path(directory)
+    process_file = next((directory / "process").glob("*.xml"))
+    for resource_file in sorted((directory / "resources").glob("*.xml")):
+        ra_pst = build_rapst(process_file, resource_file)
+        row = [resource_file.stem]
+        for dense in (False, True):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                ilp_rep = ra_pst.get_ilp_rep(dense_precedence=dense)
+            duration = (time.perf_counter() - start) / repeat
+            edges = sum(len(job["after"]) for job in ilp_rep["jobs"].values())
+            row.append(f"{'dense' if dense else 'compact'}: {duration*1000:8.2f}ms {edges:8d} edges")
+        print(" | ".join(row))
+
+
+if __name__ == "__main__":
+    bench(*sys.argv[1:2])
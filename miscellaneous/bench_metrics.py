@@ -0,0 +1,26 @@
+"""
+Benchmark: RA_PSTMetrics.batch over all resource files of a testset directory.
+
+Usage: python -m miscellaneous.bench_metrics [testset_dir]
+"""
+from src.ra_pst_py.metrics import RA_PSTMetrics
+
+import pathlib
+import sys
+import time
+
+
+def bench(testset_dir="testsets_final_online/30_generated"):
+    testset_dir = pathlib.Path(testset_dir)
+    process_file = sorted((testset_dir / "process").iterdir())[0]
+    resource_files = sorted((testset_dir / "resources").iterdir())
+    start = time.perf_counter()
+    metrics = RA_PSTMetrics.batch(process_file, resource_files)
+    duration = time.perf_counter() - start
+    for resource_file, values in metrics.items():
+        print(f"{resource_file.name[:60]:60s} " + " ".join(f"{key}: {value:8.3f}" for key, value in values.as_dict().items()))
+    print(f"{len(resource_files)} resource files in {duration:.2f}s")
+
+
+if __name__ == "__main__":
+    bench(*sys.argv[1:2])
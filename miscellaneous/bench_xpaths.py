@@ -0,0 +1,41 @@
+"""
+Micro-benchmark: string XPath (element.xpath) vs. precompiled XPath from src.ra_pst_py.xpaths.
+
+Usage: python -m miscellaneous.bench_xpaths [process_file] [resource_file]
+"""
+from src.ra_pst_py import xpaths
+from src.ra_pst_py.builder import build_rapst
+
+import sys
+import timeit
+
+
+def bench(process_file="test_instances/paper_process_short.xml",
+          resource_file="test_instances/offer_resources_many_invalid_branches.xml", number=2000):
+    ra_pst = build_rapst(process_file, resource_file)
+    ns = ra_pst.ns
+    task = ra_pst.get_tasklist()[1]
+    task_id = task.attrib["id"]
+    cases = {
+        "tasklist": (
+            lambda: ra_pst.ra_pst.xpath("(//cpee1:call|//cpee1:manipulate)[not (ancestor::cpee1:children|ancestor::cpee1:allocation)]", namespaces=ns),
+            lambda: xpaths.TASKLIST(ra_pst.ra_pst)),
+        "task by id": (
+            lambda: ra_pst.process.xpath(f"//*[@id='{task_id}'][not(ancestor::cpee1:children) and not(ancestor::cpee1:allocation) and not(ancestor::RA_RPST)]", namespaces=ns),
+            lambda: xpaths.ACTIVE_TASK_BY_ID(ra_pst.process, id=task_id)),
+        "release time": (
+            lambda: task.xpath("cpee1:release_time", namespaces=ns),
+            lambda: xpaths.RELEASE_TIME(task)),
+        "task resource": (
+            lambda: task.xpath("cpee1:children/cpee1:resource", namespaces=ns),
+            lambda: xpaths.TASK_RESOURCE(task)),
+    }
+    for name, (string_xpath, compiled_xpath) in cases.items():
+        assert string_xpath() == compiled_xpath()
+        t_string = timeit.timeit(string_xpath, number=number) / number * 1e6
+        t_compiled = timeit.timeit(compiled_xpath, number=number) / number * 1e6
+        print(f"{name:15s} string: {t_string:8.2f}us  compiled: {t_compiled:8.2f}us  speedup: {t_string/t_compiled:5.2f}x")
+
+
+if __name__ == "__main__":
+    bench(*sys.argv[1:3])
@@ -0,0 +1,178 @@
+from . import utils
+
+import numpy as np
+
+
+class BranchTable:
+    """
+    Compiled, array-backed representation of the branches of an RA_PST.
+    Built once from RA_PST.branches, it holds everything the ILP/CP representation,
+    the metrics and the heuristic need without touching the xml trees again.
+
+    Branches are stored grouped by task in tasklist order, jobs and deletes are stored
+    as flat arrays with offset pointers (CSR layout):
+        branches of task t:     task_branch_ptr[t]:task_branch_ptr[t+1]
+        jobs of branch b:       job_ptr[b]:job_ptr[b+1]   (serialized job order)
+        deletes of branch b:    delete_ptr[b]:delete_ptr[b+1]   (task indices)
+    """
+
+    def __init__(self, task_ids: list, resources: list, resourcelist: list, task_labels: list,
+                 task_branch_ptr: np.ndarray, branch_task: np.ndarray, branch_no: np.ndarray,
+                 branch_valid: np.ndarray, branch_cost: np.ndarray,
+                 job_ptr: np.ndarray, job_resource: np.ndarray, job_duration: np.ndarray,
+                 delete_ptr: np.ndarray, delete_task: np.ndarray):
+        self.task_ids: list[str] = task_ids
+        self.resources: list[str] = resources           # index space of job_resource
+        self.resourcelist: list[str] = resourcelist     # as returned by RA_PST.get_resourcelist
+        self.task_labels: list[str] = task_labels
+        self.task_index: dict[str, int] = {task_id: i for i, task_id in enumerate(task_ids)}
+        self.task_branch_ptr = task_branch_ptr
+        self.branch_task = branch_task
+        self.branch_no = branch_no
+        self.branch_valid = branch_valid
+        self.branch_cost = branch_cost
+        self.job_ptr = job_ptr
+        self.job_resource = job_resource
+        self.job_duration = job_duration
+        self.delete_ptr = delete_ptr
+        self.delete_task = delete_task
+
+    @classmethod
+    def from_ra_pst(cls, ra_pst) -> "BranchTable":
+        """ Compiles the branch table from the branches of an RA_PST """
+        tasklist = ra_pst.get_tasklist()
+        task_ids = [task.attrib["id"] for task in tasklist]
+        task_labels = [utils.get_label(task) for task in tasklist]
+        label_to_tasks = {}
+        for i, label in enumerate(task_labels):
+            label_to_tasks.setdefault(label, []).append(i)
+        resourcelist = ra_pst.get_resourcelist()
+        resources = list(resourcelist)
+        resource_index = {resource: i for i, resource in enumerate(resources)}
+
+        task_branch_ptr = [0]
+        branch_task, branch_no, branch_valid, branch_cost = [], [], [], []
+        job_ptr, job_resource, job_duration = [0], [], []
+        delete_ptr, delete_task = [0], []
+        for t, task_id in enumerate(task_ids):
+            for i, branch in enumerate(ra_pst.branches[task_id]):
+                is_valid = branch.check_validity()
+                branch_task.append(t)
+                branch_no.append(i)
+                branch_valid.append(is_valid)
+                branch_cost.append(branch.get_branch_costs())
+                if is_valid:
+                    jobs, deletes = branch.get_serialized_jobs()
+                    for resource, cost in jobs:
+                        if resource not in resource_index:
+                            resource_index[resource] = len(resources)
+                            resources.append(resource)
+                        job_resource.append(resource_index[resource])
+                        job_duration.append(float(cost))
+                    delete_task.extend(sorted({idx for label in deletes for idx in label_to_tasks.get(label, [])}))
+                job_ptr.append(len(job_resource))
+                delete_ptr.append(len(delete_task))
+            task_branch_ptr.append(len(branch_task))
+
+        return cls(
+            task_ids=task_ids,
+            resources=resources,
+            resourcelist=resourcelist,
+            task_labels=task_labels,
+            task_branch_ptr=np.array(task_branch_ptr, dtype=np.int64),
+            branch_task=np.array(branch_task, dtype=np.int32),
+            branch_no=np.array(branch_no, dtype=np.int32),
+            branch_valid=np.array(branch_valid, dtype=bool),
+            branch_cost=np.array(branch_cost, dtype=np.float64),
+            job_ptr=np.array(job_ptr, dtype=np.int64),
+            job_resource=np.array(job_resource, dtype=np.int32),
+            job_duration=np.array(job_duration, dtype=np.float64),
+            delete_ptr=np.array(delete_ptr, dtype=np.int64),
+            delete_task=np.array(delete_task, dtype=np.int32),
+        )
+
+    @property
+    def num_tasks(self) -> int:
+        return len(self.task_ids)
+
+    @property
+    def num_branches(self) -> int:
+        return len(self.branch_task)
+
+    def get_task_branches(self, task_id: str) -> range:
+        """ Returns the global branch indices of a task """
+        t = self.task_index[task_id]
+        return range(int(self.task_branch_ptr[t]), int(self.task_branch_ptr[t + 1]))
+
+    def get_valid_branches(self, task_id: str) -> list[int]:
+        return [b for b in self.get_task_branches(task_id) if self.branch_valid[b]]
+
+    def get_branch_costs(self, task_id: str) -> np.ndarray:
+        """ Returns the costs of all branches of a task (as Branch.get_branch_costs) """
+        t = self.task_index[task_id]
+        return self.branch_cost[self.task_branch_ptr[t]:self.task_branch_ptr[t + 1]]
+
+    def get_jobs(self, branch_idx: int) -> list[tuple[str, float]]:
+        """ Returns the serialized jobs of a branch as (resource, cost) pairs """
+        start, end = self.job_ptr[branch_idx], self.job_ptr[branch_idx + 1]
+        return [(self.resources[r], float(c)) for r, c in zip(self.job_resource[start:end], self.job_duration[start:end])]
+
+    def get_deletes(self, branch_idx: int) -> list[str]:
+        """ Returns the task ids deleted by a branch """
+        start, end = self.delete_ptr[branch_idx], self.delete_ptr[branch_idx + 1]
+        return [self.task_ids[t] for t in self.delete_task[start:end]]
+
+    def get_valid_counts(self) -> np.ndarray:
+        """ Number of valid branches per task """
+        return np.bincount(self.branch_task[self.branch_valid], minlength=self.num_tasks)
+
+    def get_branch_counts(self) -> np.ndarray:
+        """ Number of branches per task (valid and invalid) """
+        return np.diff(self.task_branch_ptr)
+
+    def get_ilp_branches(self) -> dict:
+        """
+        Returns the valid branches per task in the intermediate format used by RA_PST.get_ilp_rep:
+        {task_id: [{"jobs": [(resource, cost)], "deletes": [task_id], "branch_no": int}]}
+        """
+        branches = {}
+        for t, task_id in enumerate(self.task_ids):
+            branches[task_id] = [
+                {"jobs": self.get_jobs(b), "deletes": self.get_deletes(b), "branch_no": int(self.branch_no[b])}
+                for b in range(self.task_branch_ptr[t], self.task_branch_ptr[t + 1]) if self.branch_valid[b]
+            ]
+        return branches
+
+    def nbytes(self) -> int:
+        """ Memory held by the arrays of the table """
+        return sum(array.nbytes for array in (
+            self.task_branch_ptr, self.branch_task, self.branch_no, self.branch_valid, self.branch_cost,
+            self.job_ptr, self.job_resource, self.job_duration, self.delete_ptr, self.delete_task))
+
+
+class DeletionSavingsTable:
+    """
+    Cheapest branch cost per task, looked up by task label: the savings of a delete change pattern.
+    Built on demand once per RA_PST (instance copies share it), the labels are taken from the
+    tasklist of that RA_PST. Lookups only return tasks that are still in the process of the
+    querying instance (RA_PST.get_process_index), so deleted tasks drop out of the table.
+    """
+
+    def __init__(self, ra_pst):
+        self.ra_pst = ra_pst
+        self.label_tasks: dict[str, list[str]] = {}     # label -> task ids
+        self.min_costs: dict[str, float] = {}           # task id -> cost of the cheapest branch
+        for task in ra_pst.get_tasklist():
+            self.label_tasks.setdefault(utils.get_label(task), []).append(task.attrib["id"])
+
+    def get_min_cost(self, task_id: str) -> float:
+        if task_id not in self.min_costs:
+            if self.ra_pst.branch_table is not None:
+                self.min_costs[task_id] = float(self.ra_pst.branch_table.get_branch_costs(task_id).min())
+            else:
+                self.min_costs[task_id] = sorted([branch.get_branch_costs() for branch in self.ra_pst.branches[task_id]])[0]
+        return self.min_costs[task_id]
+
+    def get_costs(self, label: str, task_index) -> list[float]:
+        """ Cheapest branch costs of the tasks with label that are in task_index (the index of a process) """
+        return [self.get_min_cost(task_id) for task_id in self.label_tasks.get(label, []) if task_id in task_index.by_id]
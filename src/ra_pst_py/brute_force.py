@@ -122,7 +122,7 @@ class BruteForceSearch():
 def find_best_solution(solutions): # branches ,measure, n):
     solution_branches, measure, n = solutions
 
-    dummy_ra_pst = build_rapst("tmp/process.xml", "tmp/resources.xml")
+    dummy_ra_pst = build_rapst("tmp/process.xml", "tmp/resources.xml", cache_dir="tmp/ra_pst_cache")
     best_solutions = [] 
     start, start1 = time.time(), time.time()
     timetrack = []
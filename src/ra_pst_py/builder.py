@@ -1,17 +1,40 @@
 from .core import RA_PST
 from .graphix import TreeGraph
 from .file_parser import parse_process_file, parse_resource_file
+from .cache import RA_PSTCache, cache_key, DEFAULT_MAX_BYTES
 
 
 import json
 import pathlib
 
 
-def build_rapst(process_file, resource_file) -> RA_PST:
-    """Build an RA_PST object from file (str, etree._Element)"""
+def build_rapst(process_file, resource_file, compile_branches:bool=False, cache_dir=None, cache_max_bytes:int=DEFAULT_MAX_BYTES, workers:int=None) -> RA_PST:
+    """Build an RA_PST object from file (str, etree._Element)
+
+    Args:
+        compile_branches (bool): Additionally compile the branches into a BranchTable
+        cache_dir (str, os.PathLike): Directory of the on-disk RA_PST cache. If set, an RA_PST
+            built from identical process and resource content is loaded from the cache.
+        cache_max_bytes (int): Size cap of cache_dir, least recently used entries are evicted
+        workers (int): Build the allocation trees of the tasks in a pool of this many processes
+    """
+    if cache_dir is not None:
+        cache = RA_PSTCache(cache_dir, max_bytes=cache_max_bytes)
+        key = cache_key(process_file, resource_file)
+        ra_pst = cache.get(key)
+        if ra_pst is not None:
+            if compile_branches and ra_pst.branch_table is None:
+                ra_pst.compile_branch_table()
+                cache.put(key, ra_pst)
+            return ra_pst
+
     process_data = parse_process_file(process_file)
     resource_data = parse_resource_file(resource_file)
-    ra_pst = RA_PST(process_data, resource_data)
+    ra_pst = RA_PST(process_data, resource_data, workers=workers)
+    if compile_branches:
+        ra_pst.compile_branch_table()
+    if cache_dir is not None:
+        cache.put(key, ra_pst)
     return ra_pst
 
 
@@ -36,7 +59,7 @@ def show_tree_as_graph(ra_pst, format="png", output_file="graphs/output_graph",
         output_file (str): Path where graphic will be saved
     """
     if type(ra_pst) is RA_PST:
-        tree_xml = ra_pst.ra_pst
+        tree_xml = ra_pst.get_ra_pst_etree()
     else:
         tree_xml = ra_pst
     process_data = parse_process_file(tree_xml)
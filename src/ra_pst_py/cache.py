@@ -0,0 +1,136 @@
+from .core import RA_PST, Branch
+
+from lxml import etree
+from collections import defaultdict
+import hashlib
+import pickle
+import pathlib
+import os
+import uuid
+
+# Bump whenever RA_PST, Branch or BranchTable change in a way that affects the serialized form
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Attributes that hold xml trees and are stored as xml bytes
+_TREE_ATTRIBUTES = ("process", "raw_process", "resource_data", "ra_pst")
+# Attributes that are rebuilt on demand and not stored
+_SKIPPED_ATTRIBUTES = ("allocations", "task_index", "process_index", "resource_index", "branches", "template", "task_skeleton", "metrics", "deletion_savings", "branch_plans")
+
+
+def _input_bytes(source) -> bytes:
+    """ Raw content of a process/resource input (path, xml string or etree._Element) """
+    if isinstance(source, etree._Element):
+        return etree.tostring(source)
+    if isinstance(source, (str, os.PathLike)) and os.path.isfile(source):
+        return pathlib.Path(source).read_bytes()
+    if isinstance(source, bytes):
+        return source
+    return str(source).encode()
+
+
+def cache_key(process_file, resource_file) -> str:
+    """ Content hash of both inputs, any change in either file leads to a new key """
+    digest = hashlib.sha256(f"ra_pst-cache-v{CACHE_VERSION}".encode())
+    for source in (process_file, resource_file):
+        content = _input_bytes(source)
+        digest.update(len(content).to_bytes(8, "little"))
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def dump_ra_pst(ra_pst: RA_PST) -> bytes:
+    """ Versioned serialization of a built RA_PST (trees, branches, branch table) """
+    state = {key: value for key, value in vars(ra_pst).items()
+             if key not in _TREE_ATTRIBUTES and key not in _SKIPPED_ATTRIBUTES}
+    trees = {key: etree.tostring(getattr(ra_pst, key), with_tail=False)
+             for key in _TREE_ATTRIBUTES if getattr(ra_pst, key) is not None}
+    branches = {
+        task_id: [(etree.tostring(branch.node, with_tail=False),
+                   {key: value for key, value in vars(branch).items() if key != "_node"})
+                  for branch in task_branches]
+        for task_id, task_branches in ra_pst.branches.items()
+    }
+    return pickle.dumps({"version": CACHE_VERSION, "state": state, "trees": trees, "branches": branches},
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_ra_pst(data: bytes) -> RA_PST:
+    """ Restores an RA_PST from dump_ra_pst, raises ValueError on a version mismatch """
+    payload = pickle.loads(data)
+    if payload.get("version") != CACHE_VERSION:
+        raise ValueError(f"Cache version {payload.get('version')} does not match {CACHE_VERSION}")
+    ra_pst = RA_PST.__new__(RA_PST)
+    vars(ra_pst).update(payload["state"])
+    for key in _TREE_ATTRIBUTES:
+        setattr(ra_pst, key, etree.fromstring(payload["trees"][key]) if key in payload["trees"] else None)
+    ra_pst.allocations = dict()
+    ra_pst.task_index = None
+    ra_pst.process_index = None
+    ra_pst.resource_index = None
+    ra_pst.template = None
+    ra_pst.task_skeleton = None
+    ra_pst.metrics = None
+    ra_pst.deletion_savings = None
+    ra_pst.branch_plans = {}
+    ra_pst.id = str(uuid.uuid1())
+    ra_pst.branches = defaultdict(list)
+    for task_id, task_branches in payload["branches"].items():
+        for node, branch_state in task_branches:
+            branch = Branch.__new__(Branch)
+            vars(branch).update(branch_state)
+            branch._node = etree.fromstring(node)
+            ra_pst.branches[task_id].append(branch)
+    return ra_pst
+
+
+class RA_PSTCache:
+    """
+    Content addressed on-disk cache of built RA_PSTs.
+    One file per (process, resource) content hash, evicted least recently used
+    once the directory grows over max_bytes.
+    """
+
+    def __init__(self, cache_dir: os.PathLike, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def get_path(self, key: str) -> pathlib.Path:
+        return self.cache_dir / f"{key}.rapst"
+
+    def get(self, key: str) -> RA_PST | None:
+        path = self.get_path(key)
+        try:
+            data = path.read_bytes()
+            ra_pst = load_ra_pst(data)
+        except FileNotFoundError:
+            return None
+        except (ValueError, pickle.UnpicklingError, EOFError, etree.XMLSyntaxError):
+            # Outdated or broken entry
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)  # mark as recently used
+        return ra_pst
+
+    def put(self, key: str, ra_pst: RA_PST) -> None:
+        path = self.get_path(key)
+        tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(dump_ra_pst(ra_pst))
+        os.replace(tmp_path, path)  # atomic for concurrent workers
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        for path in self.cache_dir.glob("*.rapst"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
@@ -1,4 +1,6 @@
 from . import utils 
+from . import xpaths
+from .task_index import TaskIndex
 
 import os
 from lxml import etree
@@ -15,6 +17,13 @@ class ChangeOperation():
         self.ra_pst = ra_pst
         self.ns = {'cpee1': list(ra_pst.nsmap.values())[0]}
         self.to_del_label=[]
+        self.task_index: TaskIndex = None
+
+    def get_task_index(self, process) -> TaskIndex:
+        """ Returns the task index of process, shared with the other owners of the tree (see TaskIndex.for_tree) """
+        if self.task_index is None or self.task_index.root is not process:
+            self.task_index = TaskIndex.for_tree(process)
+        return self.task_index
 
     def ChangeOperationFactory(self,process, core_task, task, branch, cptype, earliest_possible_start=None):
         localizer = {
@@ -23,20 +32,22 @@ class ChangeOperation():
             "delete": Delete
         }
         change_op = localizer[cptype](self.ra_pst)
-        return change_op.apply(process, core_task, task, branch, earliest_possible_start)
+        change_op.task_index = self.task_index
+        result = change_op.apply(process, core_task, task, branch, earliest_possible_start)
+        self.task_index = change_op.task_index
+        return result
 
     def get_proc_task(self, process, core_task, all:bool=False, full_rapst:bool=False):
 
         if full_rapst:
-            proc_tasks = list(filter(lambda x: utils.get_label(etree.tostring(
-                core_task)) == utils.get_label(etree.tostring(x)), process.xpath("//*[self::cpee1:call or self::cpee1:manipulate]", namespaces=self.ns)))
+            core_label = utils.get_label(core_task)
+            proc_tasks = list(filter(lambda x: core_label == utils.get_label(x), xpaths.ALL_TASKS(process)))
             return proc_tasks
 
-        proc_tasks = process.xpath(
-            f"//*[@id='{core_task.attrib['id']}'][not(ancestor::cpee1:changepattern)][not(ancestor::cpee1:allocation)][not(ancestor::cpee1:children)]", namespaces=self.ns)
+        proc_tasks = self.get_task_index(process).get_by_id(core_task.attrib['id'])
         if len(proc_tasks) != 1:
-            proc_tasks = list(filter(lambda x: utils.get_label(etree.tostring(
-                core_task)) == utils.get_label(etree.tostring(x)), proc_tasks))
+            core_label = utils.get_label(core_task)
+            proc_tasks = list(filter(lambda x: core_label == utils.get_label(x), proc_tasks))
             if len(proc_tasks) > 1:
                 raise ProcessError(f"Task identifier + label is not unique for task \
                                    {utils.get_label(etree.tostring(core_task)), core_task.attrib}")
@@ -472,7 +483,6 @@ class ChangeOperation():
 class Insert(ChangeOperation):
     def apply(self, process, core_task: etree.Element, task: etree.Element, branch, earliest_possible_start):
         invalid = False
-        process = copy.deepcopy(process)
         # core_task = task.xpath("/*")[0]
         proc_task = self.get_proc_task(process, core_task)
 
@@ -481,6 +491,7 @@ class Insert(ChangeOperation):
         task.attrib["id"] = new_id
         task = copy.deepcopy(task)
 
+        task_index = self.get_task_index(process)
         match task.attrib["direction"]:
             case "before":
                 proc_task.addprevious(task)
@@ -489,12 +500,15 @@ class Insert(ChangeOperation):
             case "parallel":
                 proc_task_parent = proc_task.xpath("parent::*")[0]
                 new_parent = CpeeElements().parallel()
+                moved_task = copy.deepcopy(proc_task)
                 new_parent.xpath("cpee1:parallel_branch", namespaces=self.ns)[
-                    0].append(copy.deepcopy(proc_task))
+                    0].append(moved_task)
                 new_parent.xpath("cpee1:parallel_branch", namespaces=self.ns)[
                     1].append(task)
                 proc_task.addnext(new_parent)
                 proc_task_parent.remove(proc_task)
+                task_index.replace(proc_task, moved_task)
+        task_index.add(task)
 
         branchtask = copy.deepcopy(task)
         task = self.get_proc_task(process, task)
@@ -547,8 +561,7 @@ class Delete(ChangeOperation):
                 # TODO:
                 # Check if Task is in process
                 # Delete Task from Process Tree
-                proc = process.xpath(
-                    "//*[not(ancestor::changepattern) and not(ancestor::cpee1:allocation) and not(ancestor::cpee1:children)]", namespaces=self.ns)
+                proc = xpaths.PROCESS_TASKS(process)
                 try:
                     to_del_label = utils.get_label(
                         etree.tostring(task)).lower()
@@ -562,7 +575,7 @@ class Delete(ChangeOperation):
                     try:
                         # with open("new_x.xml", "wb") as f:
                         #    f.write(etree.tostring(x))
-                        if to_del_label == utils.get_label(etree.tostring(x)).lower():
+                        if to_del_label == utils.get_label(x).lower():
                             pos_deletes.append(
                                 x.xpath("@id", namespaces=self.ns)[0])
 
@@ -581,18 +594,18 @@ class Delete(ChangeOperation):
                     invalid = True
                     return process, invalid
 
-                to_dels = process.xpath(
-                    f"//*[@id='{to_del_id}'][not(ancestor::changepattern) and not(ancestor::cpee1:allocation)and not(ancestor::cpee1:children)]", namespaces=self.ns)
+                to_dels = self.get_task_index(process).get_by_id(to_del_id)
 
                 # TODO Delete Cascade: if to_del has change patterns in allocation, they need to be deleted as well.
                 to_del = to_dels[0]
                 to_del_parent = to_del.xpath("parent::*")[0]
                 to_del_parent.remove(to_del)
+                self.get_task_index(process).remove(to_del)
 
                 # Delete Cascade:
                 for to_del2 in to_del.xpath("cpee1:allocation/resource/resprofile/cpee1:children/*", namespaces=self.ns):
                     to_del2.attrib["type"], to_del2.attrib["direction"] = task.attrib["type"], task.attrib["direction"]
-                    process, invalid = Delete().apply(process, core_task, to_del2)
+                    process, invalid = Delete(self.ra_pst).apply(process, core_task, to_del2, branch, earliest_possible_start)
 
         return process, invalid
 
@@ -612,6 +625,7 @@ class Replace(ChangeOperation):
 
         # proc_task = self.get_proc_task(process, to_replace)
         proc_task.xpath("parent::*")[0].replace(proc_task, task)
+        self.get_task_index(process).replace(proc_task, task)
 
         try:
             if task.xpath("cpee1:children/*", namespaces=self.ns):
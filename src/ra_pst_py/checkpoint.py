@@ -0,0 +1,121 @@
+import copy
+import json
+import os
+
+
+class CheckpointJournal:
+    """
+    Progress of a Simulator run that survives a crash or a killed job.
+    Every committed step appends one line with the changed schedule instances to the journal,
+    every compact_every steps the journal is compacted into a snapshot of the whole schedule:
+        <path>.journal   JSON lines {"step", "arrivals", "instances": {schedule idx: ilp_rep}, "schedule": {...}}
+        <path>.snapshot  {"step", "arrivals", "schedule"}, replaced atomically
+    arrivals are the schedule indices of the instances that are allocated for good,
+    schedule holds the entries besides "instances" (resources, objective, solution).
+    A torn last journal line (crash while writing it) is ignored on load.
+    fsync: sync every journal line and snapshot to disk, not only flush it to the os
+    """
+
+    def __init__(self, path: str, compact_every: int = 10, fsync: bool = False):
+        if compact_every < 1:
+            raise ValueError("compact_every must be at least 1")
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.snapshot_path = f"{path}.snapshot"
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.step = 0
+        self.arrivals: set[int] = set()
+        self.steps_since_snapshot = 0
+        self._instances: list[dict] = []   # committed schedule["instances"]
+        self._schedule: dict = {}          # committed entries besides "instances"
+
+    def reset(self):
+        """ Starts a new run, removes the journal and snapshot of a previous one """
+        for file_path in (self.journal_path, self.snapshot_path):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        self.step = 0
+        self.arrivals = set()
+        self.steps_since_snapshot = 0
+        self._instances = []
+        self._schedule = {}
+
+    def commit(self, schedule: dict, arrivals=(), dirty=None) -> bool:
+        """
+        Records the current schedule and the newly finished arrivals as the next step.
+        dirty: schedule indices of the instances changed since the last commit (None: all),
+        instances beyond the committed ones are always recorded.
+        Returns True if the step compacted the journal into a snapshot.
+        """
+        instances = schedule["instances"]
+        dirty = range(len(instances)) if dirty is None else set(dirty) | set(range(len(self._instances), len(instances)))
+        changed = {i: copy.deepcopy(instances[i]) for i in sorted(dirty)}
+        entries = {key: copy.deepcopy(value) for key, value in schedule.items() if key != "instances"}
+        self._apply(changed, entries)
+        self.step += 1
+        self.arrivals.update(arrivals)
+        self.steps_since_snapshot += 1
+        if self.steps_since_snapshot >= self.compact_every:
+            self.compact()
+            return True
+        line = {"step": self.step, "arrivals": sorted(arrivals), "instances": changed, "schedule": entries}
+        with open(self.journal_path, "a") as f:
+            f.write(json.dumps(line) + "\n")
+            self._sync(f)
+        return False
+
+    def compact(self):
+        """ Writes the committed schedule as snapshot and empties the journal """
+        snapshot = {"step": self.step, "arrivals": sorted(self.arrivals), "schedule": {"instances": self._instances, **self._schedule}}
+        with open(f"{self.snapshot_path}.tmp", "w") as f:
+            json.dump(snapshot, f)
+            self._sync(f)
+        os.replace(f"{self.snapshot_path}.tmp", self.snapshot_path)
+        # Journal lines up to self.step are in the snapshot, a crash before truncating is harmless
+        open(self.journal_path, "w").close()
+        self.steps_since_snapshot = 0
+
+    def load(self) -> dict:
+        """ Restores the committed state from snapshot and journal, returns the schedule (None without checkpoint) """
+        if not os.path.exists(self.snapshot_path) and not os.path.exists(self.journal_path):
+            return None
+        self.step, self.arrivals, self._instances, self._schedule = 0, set(), [], {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                snapshot = json.load(f)
+            self.step = snapshot["step"]
+            self.arrivals = set(snapshot["arrivals"])
+            self._apply(dict(enumerate(snapshot["schedule"].pop("instances"))), snapshot["schedule"])
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    if entry["step"] <= self.step:
+                        continue
+                    self._apply({int(i): ilp_rep for i, ilp_rep in entry["instances"].items()}, entry["schedule"])
+                    self.step = entry["step"]
+                    self.arrivals.update(entry["arrivals"])
+        self.steps_since_snapshot = 0
+        # Continue with a compacted state, a torn line must not stay in front of new ones
+        self.compact()
+        return self.get_schedule()
+
+    def get_schedule(self) -> dict:
+        return {"instances": copy.deepcopy(self._instances), **copy.deepcopy(self._schedule)}
+
+    def _apply(self, instances: dict, entries: dict):
+        for i, ilp_rep in sorted(instances.items()):
+            if i < len(self._instances):
+                self._instances[i] = ilp_rep
+            else:
+                self._instances.append(ilp_rep)
+        self._schedule = entries
+
+    def _sync(self, f):
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
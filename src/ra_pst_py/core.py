@@ -1,6 +1,11 @@
 # Import modules
 from . import utils
+from . import xpaths
 from src.ra_pst_py.change_operations import ChangeOperationError, ChangeOperation
+from src.ra_pst_py.branch_table import BranchTable, DeletionSavingsTable
+from src.ra_pst_py.task_index import TaskIndex
+from src.ra_pst_py.resource_index import ResourceIndex
+from src.ra_pst_py.metrics import RA_PSTMetrics
 
 # Import external packages
 from lxml import etree
@@ -9,8 +14,7 @@ import warnings
 import copy
 import math
 import numpy as np
-import statistics
-import itertools
+import multiprocessing as mp
 from collections import defaultdict
 
 
@@ -20,9 +24,15 @@ class RA_PST:
     self.allocation: dict of {task:TaskAllocation} pairs
     self.solutions: list of all found solutions
     self.ra_pst: The RA-pst as CPEE-Tree. build through self.get_ra_pst
+    self.branch_table: optional compiled form of self.branches. build through self.compile_branch_table
+    self.task_index: id/label lookup of the tasks in self.ra_pst. build through self.get_task_index
+    self.process_index: id/label lookup of the tasks in self.process. build through self.get_process_index
+    self.workers: number of processes used to build the allocation trees (None: serial)
+    self.template: the RA_PST a copy-on-write instance copy was made from (see get_instance_copy), None otherwise.
+        The self.ra_pst of a copy only holds the process tasks, get_ra_pst_etree/get_ra_pst_str return the template's full tree
     """
 
-    def __init__(self, process: etree._Element, resource: etree._Element):
+    def __init__(self, process: etree._Element, resource: etree._Element, workers: int = None):
         self.id: str = str(uuid.uuid1())
         self.process: etree._Element = process  # The ra_pst process xml
         self.raw_process: etree._Element = copy.copy(process)
@@ -33,52 +43,123 @@ class RA_PST:
         self.ra_pst: etree._Element = None
         self.solver = None
         self.branches: dict[list[Branch]] = defaultdict(list)
+        self.workers = workers
         self.build_ra_pst()
         self.set_branches()
         self.transformed_items = []
         self.problem_size = None
         self.flex_factor = None
+        self.branch_table: BranchTable = None
+        self.task_index: TaskIndex = None
+        self.process_index: TaskIndex = None
+        self.resource_index: ResourceIndex = None
+        self.template: RA_PST = None  # set on copy-on-write instance copies, see get_instance_copy
+        self.task_skeleton: etree._Element = None
+        self.metrics: RA_PSTMetrics = None
+        self.deletion_savings: DeletionSavingsTable = None
+        self.branch_plans: dict = {}  # compiled heuristic.BranchPlan per (task id, branch no), shared with instance copies
 
     def get_ra_pst_str(self) -> str:
-        if not self.ra_pst:
-            self.build_ra_pst()
-        return etree.tostring(self.ra_pst)
+        "Returns the full RA-PST as string (the template's tree for instance copies)"
+        return etree.tostring(self.get_ra_pst_etree())
 
     def get_ra_pst_etree(self) -> str:
+        "Returns the full RA-PST tree incl. the allocation trees (the template's tree for instance copies)"
+        if getattr(self, "template", None) is not None:
+            return self.template.get_ra_pst_etree()
         if self.ra_pst is None:
             self.build_ra_pst()
         return self.ra_pst
 
+    def get_allocation_tree(self) -> etree._Element:
+        "Returns the full RA-PST tree incl. the allocation trees (the template's tree for instance copies)"
+        return self.get_ra_pst_etree()
+
+    def get_instance_copy(self) -> "RA_PST":
+        """
+        Copy-on-write copy of self for one instance.
+        Resource data, raw process, allocations, branch table and the branch nodes are shared with self.
+        Private are the process, the branch lists (shallow Branch copies, see Branch.shared_copy)
+        and self.ra_pst, which only holds the process tasks without their allocation trees.
+        The full tree stays available through get_allocation_tree().
+        """
+        if self.ra_pst is None:
+            self.build_ra_pst()
+        if getattr(self, "task_skeleton", None) is None:
+            self.task_skeleton = copy.deepcopy(self.ra_pst)
+            for task in xpaths.TASKLIST(self.task_skeleton):
+                for children in task.findall(f"{{{xpaths.CPEE1}}}children"):
+                    task.remove(children)
+        self.get_deletion_savings_table()   # shared with the copy
+        instance_copy = copy.copy(self)
+        instance_copy.template = self
+        instance_copy.task_skeleton = None
+        instance_copy.process = copy.deepcopy(self.process)
+        instance_copy.ra_pst = copy.deepcopy(self.task_skeleton)
+        instance_copy.branches = defaultdict(list, {
+            task_id: [branch.shared_copy() for branch in branches] for task_id, branches in self.branches.items()
+        })
+        instance_copy.solutions = list()
+        instance_copy.transformed_items = list()
+        instance_copy.task_index = None
+        instance_copy.process_index = None
+        return instance_copy
+
     def get_tasklist(self, attribute: str = None) -> list:
         "Returns list of all Task-Ids in self.ra_pst"
-        tasklist = self.ra_pst.xpath(
-            "(//cpee1:call|//cpee1:manipulate)[not (ancestor::cpee1:children|ancestor::cpee1:allocation)]",
-            namespaces=self.ns,
-        )
+        tasklist = xpaths.TASKLIST(self.ra_pst)
         if not attribute:
             return tasklist
         else:
             return [task.attrib[f"{attribute}"] for task in tasklist]
 
+    def get_task_index(self) -> TaskIndex:
+        "Returns the id/label index of the tasks in self.ra_pst, shared with the change operations on it"
+        if self.task_index is None or self.task_index.root is not self.ra_pst:
+            self.task_index = TaskIndex.for_tree(self.ra_pst)
+        return self.task_index
+
+    def get_process_index(self) -> TaskIndex:
+        "Returns the id/label index of the tasks in self.process, shared with the change operations on it"
+        if getattr(self, "process_index", None) is None or self.process_index.root is not self.process:
+            self.process_index = TaskIndex.for_tree(self.process)
+        return self.process_index
+
+    def get_resource_index(self, resource_data: etree._Element = None) -> ResourceIndex:
+        "Returns the ResourceIndex of resource_data (default: self.resource_data)"
+        resource_data = self.resource_data if resource_data is None else resource_data
+        if getattr(self, "resource_index", None) is None or self.resource_index.resource_data is not resource_data:
+            self.resource_index = ResourceIndex(resource_data)
+        return self.resource_index
+
     def get_resourcelist(self) -> list:
         "Returns list of all Resource-IDs in self.resource_data"
         tree = self.resource_data
-        resources = tree.xpath(
-            "//resource[not(descendant::cpee1:changepattern)]", namespaces=self.ns
-        )
+        resources = xpaths.RESOURCES_WITHOUT_CHANGEPATTERN(tree)
         return [resource.attrib["id"] for resource in resources]
 
     def get_first_release_time(self) -> int:
         " Returns release time of first task "
         first_task = self.get_tasklist()[0]
         # find release_time of first_task
-        release_time_element = first_task.xpath("descendant::cpee1:release_time", namespaces=self.ns)
+        release_time_element = xpaths.RELEASE_TIME_DESCENDANT(first_task)
         if release_time_element:
             return int(release_time_element[0].text)
         else: 
             return None
     
+    def compile_branch_table(self) -> BranchTable:
+        """
+        Compiles self.branches into a BranchTable (flat NumPy arrays).
+        Once compiled, get_ilp_rep, get_problem_size and get_flex_factor read from the table.
+        """
+        if self.branch_table is None:
+            self.branch_table = BranchTable.from_ra_pst(self)
+        return self.branch_table
+
     def get_problem_size(self) -> int:
+        if self.branch_table is not None:
+            return math.prod(int(count) for count in self.branch_table.get_valid_counts())
         branches = [
                 len([branch for branch in branches if branch.check_validity()])
                 for taskId, branches in self.branches.items()
@@ -90,6 +171,18 @@ class RA_PST:
         """ Returns self.branches as dict"""
         return self.branches
     
+    def get_metrics(self) -> RA_PSTMetrics:
+        "Returns the memoized RA_PSTMetrics (flex factor, entropy, resource tightness, avg cost)"
+        if getattr(self, "metrics", None) is None:
+            self.metrics = RA_PSTMetrics.from_ra_pst(self)
+        return self.metrics
+
+    def get_deletion_savings_table(self) -> DeletionSavingsTable:
+        "Returns the DeletionSavingsTable, shared with the instance copies"
+        if getattr(self, "deletion_savings", None) is None:
+            self.deletion_savings = DeletionSavingsTable(self)
+        return self.deletion_savings
+
     def get_flex_factor(self):
         """
         Describes the flexibility possible within the RA-PST. 
@@ -100,73 +193,36 @@ class RA_PST:
             self.flex_factor: 
         """
         if self.flex_factor is None:
-            sum_branches = len([branch for task_branches in self.branches.values() for branch in task_branches  if branch.check_validity()])
-            no_of_tasks = len(self.get_tasklist())
-
-            # unevenness_factor = stand. dev. of branches / mean(no of branches)
-            mean_branches = sum_branches/no_of_tasks
-            std_branches = np.std([len(branches) for task, branches in self.branches.items()])
-            unevenness = std_branches/mean_branches if mean_branches > 0 else 0
-
-            self.flex_factor = mean_branches * (1 - unevenness)
-
+            self.flex_factor = self.get_metrics().flex_factor
         return self.flex_factor
     
     def get_enthropy(self):
-        entropy_per_task = {}
-        for task, branches in self.branches.items():
-            costs_per_branch = [branch.get_branch_costs() for branch in branches if branch.check_validity(ra_pst=self)]
-            inverted_costs = 1/np.array(costs_per_branch)
-            probabilities = inverted_costs / inverted_costs.sum()
-            entropy_per_task[task] = -np.sum(probabilities * np.log(probabilities))
-    
-        return np.mean(list(entropy_per_task.values()))
+        return self.get_metrics().entropy
     
     def get_resource_tightness(self):
-        """"as"""
-        resource_list = self.get_resourcelist()
-        resource_tree = self.resource_data
-        resource_dict = {}
-        
-        all_available_tasks = []
-        # Tasks in RA-PST:
-        for branches_p_task in self.branches.values():
-            all_available_tasks.extend([branch.get_tasklist() for branch in branches_p_task])
-        all_available_tasks = list(itertools.chain(*all_available_tasks))
-        all_available_tasks = [utils.get_label(task) for task in all_available_tasks]
-        all_available_tasks = list(set(all_available_tasks))
-        for resource in resource_list:
-            resource_dict[resource] = {}
-            resource_dict[resource]["costs"] = [float(cost) for cost in resource_tree.xpath(f"resource[@id='{resource}']/resprofile/measures/cost/text()", namespaces=self.ns)]
-            resource_dict[resource]["tasks"] = list(set(resource_tree.xpath(f"resource[@id='{resource}']/resprofile/@task", namespaces=self.ns)))
-            resource_dict[resource]["task_proportion"] = len(resource_dict[resource]["tasks"]) / len(all_available_tasks)
-
-        std_costs = np.std([statistics.mean(values["costs"]) for key,values  in resource_dict.items()])
-        mean_costs = statistics.mean([statistics.mean(values["costs"]) for key,values  in resource_dict.items()])
-        cost_uniform = 1-(std_costs / mean_costs) if mean_costs > 0 else 0
-                      
-
-        probabilities = [values["task_proportion"] for resource, values in resource_dict.items()]
-        entropy = -sum(p * np.log(p) for p in probabilities if p > 0)
-        max_entropy = np.log(len(resource_list))
-        usage_distribution = entropy/max_entropy if max_entropy > 0 else 0
-
-        resource_flexibility = cost_uniform * usage_distribution
-        return resource_flexibility
+        return self.get_metrics().resource_tightness
     
     def get_avg_cost(self):
-        costs = [int(cost) for cost in self.ra_pst.xpath("//cpee1:cost/text()", namespaces=self.ns)]
-        return statistics.mean(costs) if len(costs) > 0 else 0 
+        return self.get_metrics().avg_cost
 
-    def get_ilp_rep(self, instance_id = 'i1') -> dict:
+    def get_ilp_rep(self, instance_id = 'i1', dense_precedence:bool = False) -> dict:
         """
         Transforms information from RA-PST into a dictionary format suitable for an ILP model.
+        Runs in O(jobs): precedence is encoded at task level, each task waits for the previous
+        task group (the previous task, extended backwards over tasks that can be deleted).
+        Inside a branch the jobs are chained ("chain": True).
+        For backward compatibility the job level "after" lists are still emitted:
+            - first job of a branch: last job of every branch of the previous task group
+            - other jobs: the previous job of the branch
+        With dense_precedence=True, "after" holds the last job of every previously
+        emitted branch (previous quadratic format).
         Returns:
         {   
             "id": instanceId
             "tasks": {
                 taskId: {
-                    "branches": [branchId]
+                    "branches": [branchId],
+                    "after": [taskId]
                 }
             },
             "resources": [resourceId],
@@ -175,7 +231,8 @@ class RA_PST:
                     "task": taskId,
                     "jobs": [jobId],
                     "deletes": [taskId],
-                    "branchCost": cost
+                    "branchCost": cost,
+                    "chain": True
                 }
             },
             "jobs": {
@@ -190,62 +247,57 @@ class RA_PST:
             }
         }
         """
-        # Get resourcelist from RA_PST
-        resourcelist = self.get_resourcelist()
-
-        # Creates defaultdict(lists) for the allocation branches.
-        # allocations represented as jobs, precedence inside the branch is from left to right:
-        # One task = {task1: [{jobs: [(resource, cost),...], deletes:["id"] }, {jobs:[...], deletes:[]}]}
-        branches = defaultdict(list)
-        for key, values in self.branches.items():
-            for i, branch in enumerate(values):
-                # TODO branch.serialize_jobs
-                if branch.check_validity():
-                    jobs, deletes = branch.get_serialized_jobs(attribute="id")
-
-                    # find task id by label for deletes:
-                    tasklist = self.get_tasklist()
-                    deletes = list(
-                        {
-                            task.attrib["id"]
-                            for task in tasklist
-                            if utils.get_label(task) in deletes
-                        }
-                    )
-                    branches[key].append(
-                        {"jobs": jobs, "deletes": deletes, "branch_no": i}
-                    )
-        # Get tasklist from RA_PST
-        tasklist = self.get_tasklist(attribute="id")
+        if self.branch_table is not None:
+            resourcelist = self.branch_table.resourcelist
+            branches = self.branch_table.get_ilp_branches()
+            tasklist = self.branch_table.task_ids
+        else:
+            resourcelist, branches, tasklist = self._get_ilp_branches_from_xml()
 
-        temp = {"tasks": tasklist, "resources": resourcelist, "branches": branches}
         release_time = self.get_first_release_time()
-        task_release_dict = {}
-        if release_time is not None:
-            task_release_dict[tasklist[0]] = release_time
+        default_release = release_time if release_time is not None else 0
         # Different ilp format
         result = {
             "tasks": {},
-            "resources": temp["resources"],
+            "resources": resourcelist,
             "branches": {},
             "jobs": {},
         }
-        for task in temp["tasks"]:
-            result["tasks"][f'{instance_id}-{task}'] = {"branches": []}
-            for branch in temp["branches"][task]:
-                branchId = f'{instance_id}-{task}-{len(result["branches"])}'
-                result["tasks"][f'{instance_id}-{task}']["branches"].append(branchId)
+        # Tasks that might be deleted by any branch can not close the precedence chain
+        deletable = {task for task_branches in branches.values() for branch in task_branches for task in branch["deletes"]}
+
+        emitted_last_jobs = []      # last job of every emitted branch (dense_precedence)
+        task_last_jobs = {}         # {taskId: [last job of each branch]}
+        task_ids = []
+        for task in tasklist:
+            instance_task = f'{instance_id}-{task}'
+            # previous task group: walk back until a task that can not be deleted
+            task_after = []
+            for previous in reversed(task_ids):
+                task_after.append(previous)
+                if previous not in deletable:
+                    break
+            task_ids.append(task)
+            group_last_jobs = [job for previous in task_after for job in task_last_jobs[previous]]
+            result["tasks"][instance_task] = {
+                "branches": [],
+                "after": [f'{instance_id}-{previous}' for previous in task_after],
+            }
+            task_last_jobs[task] = []
+            branch_last_jobs = []
+            for branch in branches[task]:
+                branchId = f'{instance_task}-{len(result["branches"])}'
+                result["tasks"][instance_task]["branches"].append(branchId)
 
                 newBranch = {
-                    "task": f'{instance_id}-{task}',
+                    "task": instance_task,
                     "jobs": [],
                     "deletes": [f"{instance_id}-{element}" for element in branch["deletes"]],
                     "branch_no": branch["branch_no"],
                     "branchCost": 0,
-                    "release_time": release_time if release_time is not None else 0 
+                    "release_time": default_release,
+                    "chain": True
                 }
-                if task in task_release_dict.keys():
-                    newBranch["release_time"] = task_release_dict[task]
                 previousJob = None
                 for job in branch["jobs"]:
                     newJob = {
@@ -253,26 +305,71 @@ class RA_PST:
                         "resource": job[0],
                         "cost": float(job[1]),
                         "after": [],
-                        "release_time": release_time if release_time is not None else 0, 
+                        "release_time": default_release, 
                         "start": None,
                         "selected": False
                     }
-                    if previousJob is not None:
+                    if dense_precedence:
+                        if previousJob is not None:
+                            newJob["after"].append(previousJob)
+                        newJob["after"].extend(emitted_last_jobs)
+                        newJob["after"].extend(branch_last_jobs)
+                    elif previousJob is not None:
                         newJob["after"].append(previousJob)
-                    for b in result["branches"].values():
-                        newJob["after"].append(b["jobs"][-1])
+                    else:
+                        newJob["after"].extend(group_last_jobs)
                     newBranch["branchCost"] += float(job[1])
-                    if task in task_release_dict.keys():
-                        newJob["release_time"] = task_release_dict[task] 
                     jobId = f'{instance_id}-{branchId}-{len(result["jobs"])}'
                     newBranch["jobs"].append(jobId)
                     result["jobs"][jobId] = newJob
                     previousJob = jobId
                 result["branches"][branchId] = newBranch
+                if newBranch["jobs"]:
+                    task_last_jobs[task].append(newBranch["jobs"][-1])
+                    branch_last_jobs.append(newBranch["jobs"][-1])
+            emitted_last_jobs.extend(branch_last_jobs)
         result["release_time"] = release_time
         result["instanceId"] = instance_id
         return result
 
+    def _get_ilp_branches_from_xml(self) -> tuple[list, dict, list]:
+        """
+        Serializes the valid branches directly from the branch trees.
+        Returns (resourcelist, branches, tasklist) as used by get_ilp_rep
+        """
+        # Get resourcelist from RA_PST
+        resourcelist = self.get_resourcelist()
+
+        # Creates defaultdict(lists) for the allocation branches.
+        # allocations represented as jobs, precedence inside the branch is from left to right:
+        # One task = {task1: [{jobs: [(resource, cost),...], deletes:["id"] }, {jobs:[...], deletes:[]}]}
+        tasklist = self.get_tasklist()
+        label_to_ids = defaultdict(list)
+        for task in tasklist:
+            label_to_ids[utils.get_label(task)].append(task.attrib["id"])
+
+        branches = defaultdict(list)
+        for key, values in self.branches.items():
+            for i, branch in enumerate(values):
+                # TODO branch.serialize_jobs
+                if branch.check_validity():
+                    jobs, deletes = branch.get_serialized_jobs(attribute="id")
+
+                    # find task id by label for deletes:
+                    deletes = list(
+                        {
+                            task_id
+                            for label in deletes
+                            for task_id in label_to_ids.get(label, [])
+                        }
+                    )
+                    branches[key].append(
+                        {"jobs": jobs, "deletes": deletes, "branch_no": i}
+                    )
+        # Get tasklist from RA_PST
+        tasklist = [task.attrib["id"] for task in tasklist]
+        return resourcelist, branches, tasklist
+
     def save_ra_pst(self, path: str):
         """
         Saves etree as xml file in path
@@ -293,11 +390,36 @@ class RA_PST:
         tasks = self.process.xpath(
             "//cpee1:call|//cpee1:manipulate", namespaces=self.ns
         )
+        if getattr(self, "workers", None) is not None and self.workers > 1 and len(tasks) > 1:
+            self.allocate_process_parallel(tasks)
+            return
         for task in tasks:
             allocation = TaskAllocation(self, etree.tostring(task))
             allocation.allocate_task(None, self.resource_data)
             self.allocations[task.xpath("@id")[0]] = allocation
 
+    def allocate_process_parallel(self, tasks: list) -> None:
+        """
+        Builds the allocation trees of tasks in a pool of self.workers processes.
+        Task and resource xml are shipped serialized, the trees are merged back
+        in task order so the result equals the serial build.
+        """
+        task_xmls = [etree.tostring(task) for task in tasks]
+        with mp.Pool(
+            processes=min(self.workers, len(tasks)),
+            initializer=_init_allocation_worker,
+            initargs=(etree.tostring(self.resource_data), self.ns),
+        ) as pool:
+            results = pool.map(_allocate_task_worker, task_xmls, chunksize=1)
+
+        for task, task_xml, (status, tree_xml, open_delete) in zip(tasks, task_xmls, results):
+            if status == "error":
+                raise ResourceError(etree.fromstring(tree_xml))
+            allocation = TaskAllocation(self, task_xml)
+            allocation.intermediate_trees.append(etree.fromstring(tree_xml))
+            allocation.open_delete = open_delete
+            self.allocations[task.xpath("@id")[0]] = allocation
+
     def build_ra_pst(self) -> None:
         """
         Build the RA-pst from self.allocations
@@ -327,6 +449,10 @@ class RA_PST:
         tasklist = self.get_tasklist()
         for task in tasklist:
             self.set_branches_for_task(task)
+        # set_branches_for_task prunes the branch nodes in place, the validity is final once all branches are built
+        for branches in self.branches.values():
+            for branch in branches:
+                branch.check_validity()
 
     def set_branches_for_task(self, node, branch=None):
         # node = anchor_task
@@ -500,8 +626,7 @@ class TaskAllocation(RA_PST):
             return self.intermediate_trees[0]
         etree.SubElement(root, f"{{{self.ns['cpee1']}}}children")
         etree.register_namespace("ra_pst", self.ns["ra_pst"])
-        res_xml = copy.deepcopy(resource_data)
-        self.add_resources_as_children(root, res_xml)
+        self.add_resources_as_children(root, self.parent.get_resource_index(resource_data))
 
         # Check invalidity, raise error if a process task has no available resource
         if (
@@ -570,27 +695,13 @@ class TaskAllocation(RA_PST):
                         )
         return root
 
-    def add_resources_as_children(self, root, res_xml):
-        # Iterate through all resources
-        for resource in res_xml.xpath("*"):
-            # Delete non fitting profiles
-            for profile in resource.xpath("resprofile"):
-                etree.SubElement(profile, f"{{{self.ns['cpee1']}}}children")
-                if not (
-                    utils.get_label(etree.tostring(root).lower())
-                    == profile.attrib["task"].lower()
-                    and (
-                        profile.attrib["role"]
-                        in utils.get_allowed_roles(etree.tostring(root))
-                        if len(utils.get_allowed_roles(etree.tostring(root))) > 0
-                        else True
-                    )
-                ):
-                    resource.remove(profile)
-
-            # Add Resource if it has fitting profiles
-            if len(resource.xpath("resprofile", namespaces=self.ns)) > 0:
-                root.xpath("cpee1:children", namespaces=self.ns)[0].append(resource)
+    def add_resources_as_children(self, root, resource_index: ResourceIndex):
+        # Add copies of all resources with profiles fitting label and roles of root
+        label = utils.get_label(root)
+        roles = [role.text for role in xpaths.ROLES(root)]
+        children = root.xpath("cpee1:children", namespaces=self.ns)[0]
+        for resource in resource_index.get_resources(label, roles, f"{{{self.ns['cpee1']}}}children"):
+            children.append(resource)
 
     def get_tasks_of_changepatterns(self, changepattern, ex_branch):
         # cp_tasks = [element for element in changepattern.xpath(".//*") if element.tag in self.task_elements]  # deprecated
@@ -613,7 +724,13 @@ class TaskAllocation(RA_PST):
 
 
 class Branch:
+    # Hits/misses of the cached validity over all branches, see check_validity
+    validity_stats = {"hits": 0, "misses": 0}
+    # True while self.node is shared with the template branch, see shared_copy
+    node_shared = False
+
     def __init__(self, node: etree._Element):
+        self._validity = None
         self.node = node
         self.is_valid = True
         self.ns = {
@@ -621,6 +738,45 @@ class Branch:
             "allo": "http://cpee.org/ns/allocation",
         }
 
+    @property
+    def node(self) -> etree._Element:
+        return self._node
+
+    @node.setter
+    def node(self, node: etree._Element):
+        # A new node invalidates the cached validity and is private to this branch
+        self._node = node
+        self._validity = None
+        self.node_shared = False
+
+    def invalidate(self):
+        "Resets the cached validity, needed after mutating self.node in place"
+        self._validity = None
+
+    def shared_copy(self) -> "Branch":
+        "Shallow copy that shares self.node until get_node_for_update is called, the validity is computed once for all copies"
+        if self._validity is None:
+            self.check_validity()
+        branch = copy.copy(self)
+        branch.node_shared = True
+        return branch
+
+    def get_node_for_update(self) -> etree._Element:
+        "Returns self.node for in-place changes, a shared node is copied first"
+        if self.node_shared:
+            self._node = copy.deepcopy(self._node)  # same content, cached validity stays valid
+            self.node_shared = False
+        return self._node
+
+    @classmethod
+    def get_validity_stats(cls) -> dict:
+        return dict(cls.validity_stats)
+
+    @classmethod
+    def reset_validity_stats(cls):
+        cls.validity_stats["hits"] = 0
+        cls.validity_stats["misses"] = 0
+
     def get_serialized_jobs(self, attribute: str = None) -> list:
         """
         Returns the tasks in a branch as jobs (resource, cost) pair.
@@ -633,13 +789,8 @@ class Branch:
         try:
             tasklist = self.get_tasklist()
             task = tasklist.pop(0)
-            resource = task.xpath(
-                "descendant::cpee1:resource[not(parent::cpee1:resources)][1]",
-                namespaces=self.ns,
-            )[0]
-            cost = resource.xpath("descendant::cpee1:cost[1]", namespaces=self.ns)[
-                0
-            ].text
+            resource = xpaths.FIRST_RESOURCE(task)[0]
+            cost = xpaths.FIRST_COST(resource)[0].text
 
             jobs = [(resource.attrib["id"], cost)]
             deletes = []
@@ -648,13 +799,8 @@ class Branch:
                 if task.attrib["type"] == "delete":
                     deletes.append(task.attrib["label"])
                     continue
-                resource = task.xpath(
-                    "descendant::cpee1:resource[not(parent::cpee1:resources)][1]",
-                    namespaces=self.ns,
-                )[0]
-                cost = resource.xpath("descendant::cpee1:cost[1]", namespaces=self.ns)[
-                    0
-                ].text
+                resource = xpaths.FIRST_RESOURCE(task)[0]
+                cost = xpaths.FIRST_COST(resource)[0].text
                 if task.attrib["direction"] == "before":
                     jobs.insert(current_position, (resource.attrib["id"], cost))
 
@@ -708,10 +854,19 @@ class Branch:
         return jobs
     
     def get_branch_costs(self, attribute:str = "cost"):
-        attributes_list = self.node.xpath(f"//cpee1:resprofile/cpee1:measures/cpee1:{attribute}", namespaces = self.ns)
+        attributes_list = xpaths.BRANCH_COSTS(self.node) if attribute == "cost" else xpaths.branch_measures(attribute)(self.node)
         return sum([float(element.text) for element in attributes_list])
 
     def check_validity(self, ra_pst:RA_PST=None) -> bool:
+        """
+        Returns whether the branch is valid. The result is cached until self.node is replaced
+        or self.invalidate() is called. Checks against an ra_pst are not cached.
+        """
+        if ra_pst is None and self._validity is not None:
+            Branch.validity_stats["hits"] += 1
+            self.is_valid = self._validity
+            return self.is_valid
+        Branch.validity_stats["misses"] += 1
         #TODO if delete task does not exist become invalid.
         self.is_valid = True
         empty_children = self.node.xpath(
@@ -731,6 +886,8 @@ class Branch:
             else:
                 self.is_valid = False
                 continue
+        if ra_pst is None:
+            self._validity = self.is_valid
         return self.is_valid
 
     def apply_to_process(
@@ -870,7 +1027,7 @@ class Branch:
 
         # Allocate resource to anchor task
         if self.node.xpath("cpee1:children/*", namespaces=ns):
-            task = utils.get_process_task(instance.ra_pst.ra_pst, self.node, ns=ns)
+            task = utils.get_process_task(instance.ra_pst.ra_pst, self.node, ns=ns, task_index=instance.ra_pst.get_task_index())
             change_operation.add_res_allocation(task, self.node)
             tasks.pop(0)
 
@@ -921,10 +1078,7 @@ class Branch:
 
     def get_tasklist(self, attribute=None):
         "Returns list of all Task-Ids in self.ra_pst"
-        tasklist = self.node.xpath(
-            "(//cpee1:call|//cpee1:manipulate)[not(ancestor::cpee1:changepattern|ancestor::cpee1:allocation)]",
-            namespaces=self.ns,
-        )
+        tasklist = xpaths.BRANCH_TASKLIST(self.node)
         if not attribute:
             return tasklist
         else:
@@ -942,3 +1096,27 @@ class ResourceError(Exception):
         self.task = task
         self.message = message.format(utils.get_label(etree.tostring(self.task)))
         super().__init__(self.message)
+
+
+# Process pool helpers for RA_PST.allocate_process_parallel
+_worker_parent: RA_PST = None
+
+
+def _init_allocation_worker(resource_xml: bytes, ns: dict):
+    """ Parses the resource data once per worker """
+    global _worker_parent
+    _worker_parent = RA_PST.__new__(RA_PST)
+    _worker_parent.process = None
+    _worker_parent.ns = ns
+    _worker_parent.resource_data = etree.fromstring(resource_xml)
+    _worker_parent.resource_index = None
+
+
+def _allocate_task_worker(task_xml: bytes) -> tuple:
+    """ Builds the allocation tree of one task, returns (status, xml, open_delete) """
+    allocation = TaskAllocation(_worker_parent, task_xml)
+    try:
+        tree = allocation.allocate_task(None, _worker_parent.resource_data)
+    except ResourceError as e:
+        return "error", etree.tostring(e.task), False
+    return "ok", etree.tostring(tree), allocation.open_delete
@@ -1,4 +1,8 @@
 from docplex.cp.model import *
+from src.ra_pst_py import utils
+from collections import defaultdict
+import functools
+import inspect
 import json
 import gurobipy as gp
 from gurobipy import GRB
@@ -7,9 +11,222 @@ from gurobipy import GRB
 #context.solver.local.execfile = '/opt/ibm/ILOG/CPLEX_Studio2211/cpoptimizer/bin/x86-64_linux/cpoptimizer'
 
 
-def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", timeout=100, break_symmetries:bool=False, sigma:int=0):
+def remove_model_variables(ra_psts:dict):
     """
-    ra_pst_json input format:
+    Removes the model variables a solver added to the schedule (job intervals, branch variables of a master problem).
+    They are not JSON serializable and must not stay in the schedule after a failed or infeasible solve.
+    """
+    for ra_pst in ra_psts["instances"]:
+        for job in ra_pst["jobs"].values():
+            job.pop("interval", None)
+        for branch in ra_pst["branches"].values():
+            if isinstance(branch.get("selected"), gp.Var):
+                del branch["selected"]
+
+
+def removes_model_variables(solver):
+    """ Decorator of the solvers: a schedule dict given as ra_pst_json keeps no model variables, also if the solve raises """
+    signature = inspect.signature(solver)
+
+    @functools.wraps(solver)
+    def wrapper(*args, **kwargs):
+        ra_pst_json = signature.bind(*args, **kwargs).arguments["ra_pst_json"]
+        try:
+            return solver(*args, **kwargs)
+        finally:
+            if isinstance(ra_pst_json, dict):
+                remove_model_variables(ra_pst_json)
+    return wrapper
+
+
+def add_unfixed_instance(model:CpoModel, ra_pst:dict) -> list:
+    """
+    Adds an optional interval variable (job["interval"]) per job of an unfixed instance and the precedence constraints.
+    Returns the added constraints.
+    """
+    min_time = 0
+    # Create optional interval variables for each job
+    for jobId, job in ra_pst["jobs"].items():
+        job["interval"] = model.interval_var(name=jobId, optional=True, size=int(job["cost"]))
+
+        # Start time must be > than release time if a release time for instance is given
+        if job["release_time"]:
+            min_time = job["release_time"]
+        job["interval"].set_start_min(min_time)
+
+    # Precedence constraints
+    constraints = []
+    for jobId, job in ra_pst["jobs"].items():
+        for jobId2 in job["after"]:
+            constraints.append(end_before_start(ra_pst["jobs"][jobId2]["interval"], ra_pst["jobs"][jobId]["interval"]))
+    model.add(constraints)
+    return constraints
+
+
+BRANCH_FORMULATIONS = ("pairwise", "grouped", "alternative")
+
+
+def add_branch_constraints(model:CpoModel, ra_pst:dict, formulation:str="grouped") -> list:
+    """
+    Branch selection of an unfixed instance: one branch per task (unless deleted), all jobs of a branch present together.
+    formulation:
+        pairwise:    exclusivity constraint per branch over all branches of its task and the branches deleting it (posted once per branch)
+        grouped:     the same exclusivity constraint posted once per task
+        alternative: a span interval per branch over its jobs and an optional interval per task that is an alternative of its branches,
+                     the task interval or one branch deleting the task is present
+    """
+    if formulation not in BRANCH_FORMULATIONS:
+        raise ValueError(f"Unknown branch formulation {formulation}, expected one of {BRANCH_FORMULATIONS}")
+    # Branches of a task and branches deleting it, in branch order
+    task_group = defaultdict(list)
+    if formulation != "pairwise":
+        for branchId, branch in ra_pst["branches"].items():
+            for task in dict.fromkeys([branch["task"]] + branch["deletes"]):
+                task_group[task].append(branchId)
+    branch_spans = {}
+    constraints = []
+    for branchId, branch in ra_pst["branches"].items():
+        if formulation == "pairwise":
+            independent_branches = []
+            for branch_2_id, branch_2 in ra_pst["branches"].items():
+                if branch_2["task"] == branch["task"] or branch["task"] in branch_2["deletes"]:
+                    independent_branches.append(branch_2_id)
+            # master_model.add(sum([ra_pst["branches"][b_id]["selected"] for b_id in independent_branches]) == 1)
+            constraints.append(sum([presence_of(ra_pst["jobs"][ra_pst["branches"][b_id]["jobs"][0]]["interval"]) for b_id in independent_branches]) == 1)
+        elif formulation == "grouped" and branch["task"] in task_group:
+            independent_branches = task_group.pop(branch["task"])
+            constraints.append(sum([presence_of(ra_pst["jobs"][ra_pst["branches"][b_id]["jobs"][0]]["interval"]) for b_id in independent_branches]) == 1)
+        elif formulation == "alternative":
+            branch_spans[branchId] = interval_var(name=f"branch_{branchId}", optional=True)
+            constraints.append(span(branch_spans[branchId], [ra_pst["jobs"][jobId]["interval"] for jobId in branch["jobs"]]))
+        branch_jobs = []
+        for jobId in branch["jobs"]:
+            if len(branch_jobs) > 0:
+                constraints.append(equal(presence_of(ra_pst["jobs"][jobId]["interval"]), presence_of(ra_pst["jobs"][branch_jobs[-1]]["interval"])))
+            branch_jobs.append(jobId)
+    if formulation == "alternative":
+        for task, group in task_group.items():
+            task_branches = [b_id for b_id in group if ra_pst["branches"][b_id]["task"] == task]
+            if not task_branches: continue
+            task_interval = interval_var(name=f"task_{task}", optional=True)
+            constraints.append(alternative(task_interval, [branch_spans[b_id] for b_id in task_branches]))
+            constraints.append(presence_of(task_interval) + sum([presence_of(branch_spans[b_id]) for b_id in group if b_id not in task_branches]) == 1)
+    model.add(constraints)
+    return constraints
+
+
+def get_frozen_jobs(ra_psts:dict, sigma:int=0) -> tuple[set, int]:
+    """
+    Rolling horizon: selected jobs of fixed instances that end (plus sigma) before the earliest release time of the
+    unfixed instances can not interact with them and need no interval variable.
+    Returns the frozen jobIds and their latest end (constant part of the makespan).
+    Jobs of fixed instances only move later within their windows and precede no job that is kept,
+    so dropping them changes neither the feasible schedules nor the objective.
+    """
+    release_times = [job.get("release_time") or 0 for ra_pst in ra_psts["instances"] if not ra_pst.get("fixed", False)
+                     for job in ra_pst["jobs"].values()]
+    frozen, frozen_end = set(), 0
+    if not release_times:
+        return frozen, frozen_end
+    horizon = min(release_times)
+    for ra_pst in ra_psts["instances"]:
+        if not ra_pst.get("fixed", False):
+            continue
+        for jobId, job in ra_pst["jobs"].items():
+            if job["selected"] and job["start"] is not None:
+                end_hr = int(job["start"]) + int(job["cost"])
+                if end_hr + sigma <= horizon:
+                    frozen.add(jobId)
+                    frozen_end = max(frozen_end, end_hr)
+    return frozen, frozen_end
+
+
+def get_instance_fingerprint(ra_pst:dict) -> tuple:
+    """ Structure and release time of an instance without its ids, equal fingerprints have interchangeable jobs in the same order """
+    task_index = {taskId: i for i, taskId in enumerate(ra_pst["tasks"])}
+    branch_index = {branchId: i for i, branchId in enumerate(ra_pst["branches"])}
+    job_index = {jobId: i for i, jobId in enumerate(ra_pst["jobs"])}
+    jobs = tuple((job["resource"], job["cost"], job.get("release_time"), branch_index[job["branch"]],
+                  tuple(job_index[jobId] for jobId in job["after"])) for job in ra_pst["jobs"].values())
+    branches = tuple((task_index[branch["task"]], tuple(job_index[jobId] for jobId in branch["jobs"]),
+                      tuple(sorted(str(task_index.get(taskId, taskId)) for taskId in branch["deletes"]))) for branch in ra_pst["branches"].values())
+    return ra_pst.get("release_time"), jobs, branches
+
+
+def get_symmetry_classes(ra_psts:dict) -> list[list[int]]:
+    """ Indices of the unfixed instances with equal fingerprints, classes of at least two instances """
+    classes = defaultdict(list)
+    for i, ra_pst in enumerate(ra_psts["instances"]):
+        if not ra_pst.get("fixed", False):
+            classes[get_instance_fingerprint(ra_pst)].append(i)
+    return [instances for instances in classes.values() if len(instances) > 1]
+
+
+def add_symmetry_breaking(model:CpoModel, ra_psts:dict) -> list[list[int]]:
+    """
+    Identical instances can swap their schedules, the instances of a symmetry class are ordered by their first start
+    (earliest start of the jobs without predecessor). Needs the job intervals, returns the symmetry classes.
+    """
+    symmetry_classes = get_symmetry_classes(ra_psts)
+    model.add(get_symmetry_constraints(ra_psts, symmetry_classes))
+    return symmetry_classes
+
+
+def get_symmetry_constraints(ra_psts:dict, symmetry_classes:list[list[int]]) -> list:
+    """ Constraints of add_symmetry_breaking for the given symmetry classes """
+    constraints = []
+    for instances in symmetry_classes:
+        first_starts = [min([start_of(job["interval"], INTERVAL_MAX) for job in ra_psts["instances"][i]["jobs"].values() if not job["after"]])
+                        for i in instances]
+        for first_start, next_first_start in zip(first_starts, first_starts[1:]):
+            constraints.append(first_start <= next_first_start)
+    return constraints
+
+
+def add_solution_info(ra_psts:dict, result):
+    """ Solution metadata of the last instance and of the schedule, the computing time adds up over the solves """
+    intervals = [job for ra_pst in ra_psts["instances"] for job in ra_pst["jobs"].values() if job["selected"]]
+    solve_details = result.get_solver_infos()
+    total_interval_length = sum([element["cost"] for element in intervals])
+
+    # Metadata per instance:
+    ra_psts["instances"][-1]["solution"] = {
+            "objective": result.get_objective_value(),
+            "optimality gap": solve_details.get('RelativeOptimalityGap', 'N/A'),
+            "computing time": solve_details.get('TotalTime', 'N/A'),
+            "solver status": result.get_solve_status(),
+            "branches": solve_details.get('NumberOfBranches', 'N/A'),
+            "propagations": solve_details.get('NumberOfPropagations','N/A'),
+            "total interval length": total_interval_length,
+            "lower_bound" : result.get_objective_bound()
+        }
+
+
+    if "solution" in ra_psts.keys():
+        computing_time = ra_psts["solution"]["computing time"] + solve_details.get('TotalTime', 'N/A')
+    else:
+        computing_time = solve_details.get('TotalTime', 'N/A')
+    ra_psts["solution"] = {
+        "objective": result.get_objective_value(),
+        "optimality gap": solve_details.get('RelativeOptimalityGap', 'N/A'),
+        "lower_bound" : result.get_objective_bound(),
+        "computing time": computing_time,
+        "solver status": result.get_solve_status(),
+        "branches": solve_details.get('NumberOfBranches', 'N/A'),
+        "propagations": solve_details.get('NumberOfPropagations','N/A'),
+        "total interval length": total_interval_length
+        #"objective_no_symmetry_breaking": result.get_objective_value() - alpha * sum([interval.get_size()[0] * presence_of(interval) for interval in job_intervals])
+    }
+    # TODO maybe add resource usage
+
+
+@removes_model_variables
+def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", timeout=100, break_symmetries:bool=False, sigma:int=0, rolling_horizon:bool=True, branch_formulation:str="grouped"):
+    """
+    rolling_horizon: no interval variables for jobs of fixed instances that end before the new instances arrive (see get_frozen_jobs)
+    branch_formulation: constraints of the branch selection, see add_branch_constraints
+    break_symmetries: order identical unfixed instances by their first start, see add_symmetry_breaking
+    ra_pst_json (JSON file path or the loaded dict, see utils.load_schedule) input format:
     {
         "resources": [resourceId],
         "instances": [
@@ -42,12 +259,10 @@ def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", ti
         ]
     }
     """
-    with open(ra_pst_json, "r") as f:
-        ra_psts = json.load(f)
+    ra_psts = utils.load_schedule(ra_pst_json)
     
     if warm_start_json:
-        with open(warm_start_json, "r") as f:
-            warm_start_ra_psts = json.load(f)
+        warm_start_ra_psts = utils.load_schedule(warm_start_json)
     
     # Fix taskIds for deletes: 
     for i, instance in enumerate(ra_psts["instances"]):
@@ -59,15 +274,15 @@ def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", ti
     #-----------------------------------------------------------------------------
 
     model = CpoModel()
+    frozen_jobs, frozen_end = get_frozen_jobs(ra_psts, sigma) if rolling_horizon else (set(), 0)
     job_intervals = []
     fixed_intervals = 0
 
     for ra_pst in ra_psts["instances"]:
-        min_time = 0
         if ra_pst["fixed"]:
             # Create fixed intervals for selected jobs:
             for jobId, job in ra_pst["jobs"].items():
-                if job["selected"]:
+                if job["selected"] and jobId not in frozen_jobs:
                     job["interval"] = model.interval_var(name=jobId, optional=False, size=int(job["cost"]))
                     # print(f'Add job {jobId}')
                     
@@ -84,54 +299,36 @@ def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", ti
                     # TODO figure out if this should be part of the objective or not
                     job_intervals.append(job["interval"])
 
-        else:
-            # Create optional interval variables for each job
+            # Precedence constraints
             for jobId, job in ra_pst["jobs"].items():
-                job["interval"] = model.interval_var(name=jobId, optional=True, size=int(job["cost"]))
-
-                # Start time must be > than release time if a release time for instance is given
-                if job["release_time"]:
-                    min_time = job["release_time"]
-                job["interval"].set_start_min(min_time)
-                job_intervals.append(job["interval"])
-
-        # Precedence constraints
-        for jobId, job in ra_pst["jobs"].items():
-            for jobId2 in job["after"]:
-                if ra_pst["fixed"]:
-                    if ra_pst["jobs"][jobId]["selected"] & ra_pst["jobs"][jobId2]["selected"]:
+                for jobId2 in job["after"]:
+                    if "interval" in ra_pst["jobs"][jobId] and "interval" in ra_pst["jobs"][jobId2]:
                         model.add(end_before_start(ra_pst["jobs"][jobId2]["interval"], ra_pst["jobs"][jobId]["interval"]))
-                else:    
-                    model.add(end_before_start(ra_pst["jobs"][jobId2]["interval"], ra_pst["jobs"][jobId]["interval"]))
+
+        else:
+            add_unfixed_instance(model, ra_pst)
+            job_intervals.extend(job["interval"] for job in ra_pst["jobs"].values())
                     
      # No overlap between jobs on the same resource   
     for r in ra_psts["resources"]:
         resource_intervals = []
         for ra_pst in ra_psts["instances"]:
             if ra_pst["fixed"]:
-                resource_intervals.extend([job["interval"] for job in ra_pst["jobs"].values() if (job["resource"] == r and job["selected"])])
+                resource_intervals.extend([job["interval"] for job in ra_pst["jobs"].values() if (job["resource"] == r and "interval" in job)])
             else:
                 resource_intervals.extend([job["interval"] for job in ra_pst["jobs"].values() if job["resource"] == r])
         if len(resource_intervals) > 0:
             model.add(no_overlap(resource_intervals))
     
 
-    model.add(minimize(max([end_of(interval) for interval in job_intervals])))
+    # Frozen jobs only add their latest end to the makespan
+    model.add(minimize(max([end_of(interval) for interval in job_intervals] + ([frozen_end] if frozen_jobs else []))))
 
     for ra_pst in ra_psts["instances"]:
         if ra_pst["fixed"]: continue
-        for branchId, branch in ra_pst["branches"].items():
-            independent_branches = []
-            for branch_2_id, branch_2 in ra_pst["branches"].items():
-                if branch_2["task"] == branch["task"] or branch["task"] in branch_2["deletes"]:
-                    independent_branches.append(branch_2_id)
-            # master_model.add(sum([ra_pst["branches"][b_id]["selected"] for b_id in independent_branches]) == 1)
-            model.add(sum([presence_of(ra_pst["jobs"][ra_pst["branches"][b_id]["jobs"][0]]["interval"]) for b_id in independent_branches]) == 1)
-            branch_jobs = []
-            for jobId in branch["jobs"]:
-                if len(branch_jobs) > 0:
-                    model.add(equal(presence_of(ra_pst["jobs"][jobId]["interval"]), presence_of(ra_pst["jobs"][branch_jobs[-1]]["interval"])))
-                branch_jobs.append(jobId)
+        add_branch_constraints(model, ra_pst, branch_formulation)
+    if break_symmetries:
+        symmetry_classes = add_symmetry_breaking(model, ra_psts)
 
     if warm_start_json:
         starting_solution = CpoModelSolution()
@@ -144,8 +341,10 @@ def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", ti
                         starting_solution.add_interval_var_solution(interval_var, start=warm_start_job["start"], end= warm_start_job["start"] + warm_start_job["cost"], size=warm_start_job["cost"], presence= warm_start_job["selected"])
                     else:
                         starting_solution.add_interval_var_solution(interval_var, start=warm_start_job["start"], end=None, size=warm_start_job["cost"], presence= warm_start_job["selected"])
-        if len(starting_solution.get_all_var_solutions()) != len(model.get_all_variables())-fixed_intervals:
-            raise ValueError(f"Solution size <{len(starting_solution.get_all_var_solutions())}> does not match model size <{len(model.get_all_variables())-fixed_intervals}>")
+        # Job intervals of the unfixed instances, span and task intervals of the alternative formulation follow from them
+        unfixed_jobs = sum(len(ra_pst["jobs"]) for ra_pst in ra_psts["instances"] if not ra_pst["fixed"])
+        if len(starting_solution.get_all_var_solutions()) != unfixed_jobs:
+            raise ValueError(f"Solution size <{len(starting_solution.get_all_var_solutions())}> does not match model size <{unfixed_jobs}>")
         model.set_starting_point(starting_solution)
 
     with open(log_file, "w") as f:
@@ -153,7 +352,6 @@ def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", ti
 
     if result.get_solve_status() == "Infeasible":
         raise ValueError("Infeasible model")
-    intervals = []
     for ra_pst in ra_psts["instances"]:
         if not ra_pst["fixed"]:
             for jobId, job in ra_pst["jobs"].items():
@@ -170,49 +368,18 @@ def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", ti
                     job["start"] = itv.get_start()
                     del job["interval"]
         ra_pst["fixed"] = True
-    
-        for jobId, job in ra_pst["jobs"].items():
-            if job["selected"]:
-                intervals.append(job)
-    
-    solve_details = result.get_solver_infos()
-    total_interval_length = sum([element["cost"] for element in intervals])
 
-    # Metadata per instance:
-    ra_psts["instances"][-1]["solution"] = {
-            "objective": result.get_objective_value(),
-            "optimality gap": solve_details.get('RelativeOptimalityGap', 'N/A'),
-            "computing time": solve_details.get('TotalTime', 'N/A'),
-            "solver status": result.get_solve_status(),
-            "branches": solve_details.get('NumberOfBranches', 'N/A'),
-            "propagations": solve_details.get('NumberOfPropagations','N/A'),
-            "total interval length": total_interval_length,
-            "lower_bound" : result.get_objective_bound()
-        }
-
-
-    if "solution" in ra_psts.keys():
-        computing_time = ra_psts["solution"]["computing time"] + solve_details.get('TotalTime', 'N/A')
-    else:
-        computing_time = solve_details.get('TotalTime', 'N/A')
-    ra_psts["solution"] = {
-        "objective": result.get_objective_value(),
-        "optimality gap": solve_details.get('RelativeOptimalityGap', 'N/A'),
-        "lower_bound" : result.get_objective_bound(),
-        "computing time": computing_time,
-        "solver status": result.get_solve_status(),
-        "branches": solve_details.get('NumberOfBranches', 'N/A'),
-        "propagations": solve_details.get('NumberOfPropagations','N/A'),
-        "total interval length": total_interval_length
-        #"objective_no_symmetry_breaking": result.get_objective_value() - alpha * sum([interval.get_size()[0] * presence_of(interval) for interval in job_intervals])
-    }
-    # TODO maybe add resource usage
+    add_solution_info(ra_psts, result)
+    if break_symmetries:
+        ra_psts["solution"]["symmetry classes"] = len(symmetry_classes)
     return ra_psts
 
     
-def cp_solver_scheduling_only(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", timeout=100, break_symmetries:bool=False, sigma:int=0):
+@removes_model_variables
+def cp_solver_scheduling_only(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", timeout=100, break_symmetries:bool=False, sigma:int=0, rolling_horizon:bool=True):
     """ Only schedules predfined configurations [Config+ILP]
-    ra_pst_json input format:
+    rolling_horizon: no interval variables for jobs of fixed instances that end before the new instances arrive (see get_frozen_jobs)
+    ra_pst_json (JSON file path or the loaded dict, see utils.load_schedule) input format:
     {
         "resources": [resourceId],
         "instances": [
@@ -245,12 +412,10 @@ def cp_solver_scheduling_only(ra_pst_json, warm_start_json=None, log_file = "cpo
         ]
     }
     """
-    with open(ra_pst_json, "r") as f:
-        ra_psts = json.load(f)
+    ra_psts = utils.load_schedule(ra_pst_json)
     
     if warm_start_json:
-        with open(warm_start_json, "r") as f:
-            warm_start_ra_psts = json.load(f)
+        warm_start_ra_psts = utils.load_schedule(warm_start_json)
     
     # Fix taskIds for deletes: 
     for i, instance in enumerate(ra_psts["instances"]):
@@ -265,6 +430,7 @@ def cp_solver_scheduling_only(ra_pst_json, warm_start_json=None, log_file = "cpo
     #-----------------------------------------------------------------------------
 
     model = CpoModel()
+    frozen_jobs, frozen_end = get_frozen_jobs(ra_psts, sigma) if rolling_horizon else (set(), 0)
     job_intervals = []
     selected_jobs = []
     fixed_intervals = 0
@@ -275,7 +441,7 @@ def cp_solver_scheduling_only(ra_pst_json, warm_start_json=None, log_file = "cpo
         if ra_pst["fixed"]:
             # Create fixed intervals for selected jobs:
             for jobId, job in ra_pst["jobs"].items():
-                if job["selected"]:
+                if job["selected"] and jobId not in frozen_jobs:
                     job["interval"] = model.interval_var(name=jobId, optional=False, size=int(job["cost"]))
                     # print(f'Add job {jobId}')
                     
@@ -318,7 +484,7 @@ def cp_solver_scheduling_only(ra_pst_json, warm_start_json=None, log_file = "cpo
             for jobId2 in job["after"]:
                 if jobId2 in selected_jobs:
                     if ra_pst["fixed"]:
-                        if ra_pst["jobs"][jobId]["selected"] & ra_pst["jobs"][jobId2]["selected"]:
+                        if "interval" in ra_pst["jobs"][jobId] and "interval" in ra_pst["jobs"][jobId2]:
                             model.add(end_before_start(ra_pst["jobs"][jobId2]["interval"], ra_pst["jobs"][jobId]["interval"]))
                     else:    
                         model.add(end_before_start(ra_pst["jobs"][jobId2]["interval"], ra_pst["jobs"][jobId]["interval"]))
@@ -329,7 +495,7 @@ def cp_solver_scheduling_only(ra_pst_json, warm_start_json=None, log_file = "cpo
         resource_intervals = []
         for ra_pst in ra_psts["instances"]:
             if ra_pst["fixed"]:
-                resource_intervals.extend([job["interval"] for job in ra_pst["jobs"].values() if (job["resource"] == r and job["selected"])])
+                resource_intervals.extend([job["interval"] for job in ra_pst["jobs"].values() if (job["resource"] == r and "interval" in job)])
             else:
                 resource_intervals.extend([job["interval"] for job in ra_pst["jobs"].values() if job["resource"] == r if "interval" in job.keys()])
         if len(resource_intervals) > 0:
@@ -339,7 +505,7 @@ def cp_solver_scheduling_only(ra_pst_json, warm_start_json=None, log_file = "cpo
     # model.add(no_overlap(job["interval"] for job in ra_pst["jobs"].values() if job["resource"] == r) for r in ra_pst["resources"])
     alpha = 0
     # Objective
-    model.add(minimize(max([end_of(interval) for interval in job_intervals]) + alpha * sum([interval.get_size()[0] * presence_of(interval) for interval in job_intervals])))
+    model.add(minimize(max([end_of(interval) for interval in job_intervals] + ([frozen_end] if frozen_jobs else [])) + alpha * sum([interval.get_size()[0] * presence_of(interval) for interval in job_intervals])))
 
     with open(log_file, "w") as f:
         result = model.solve(FailLimit=100000000, TimeLimit=timeout, log_output=f)
@@ -403,6 +569,172 @@ def cp_solver_scheduling_only(ra_pst_json, warm_start_json=None, log_file = "cpo
     return ra_psts
 
 
+class CPSession:
+    """
+    Online cp_solver that keeps one CpoModel across arrivals (single instance CP).
+    solve() takes the schedule with the new unfixed instance(s) appended and only adds their variables and
+    constraints, the instances solved before are not encoded again:
+        sigma == 0: the selected jobs of fixed instances are a busy profile per resource (forbid_extent on the new jobs)
+        sigma > 0:  the selected jobs of fixed instances stay interval variables, their start windows follow the last solution,
+                    which is also the starting point of the next solve. With rolling_horizon the jobs that can no longer
+                    move into the new instances (see get_frozen_jobs) are folded into the busy profiles.
+    Fixed instances that the session has not seen yet (e.g. a resumed schedule) are added the same way.
+    rolling_horizon, branch_formulation, break_symmetries: as in cp_solver
+    """
+
+    def __init__(self, sigma:int=0, timeout=100, log_file="cpo_solver.log", rolling_horizon:bool=True,
+                 branch_formulation:str="grouped", break_symmetries:bool=False):
+        self.sigma = sigma
+        self.timeout = timeout
+        self.log_file = log_file
+        self.rolling_horizon = rolling_horizon
+        self.branch_formulation = branch_formulation
+        self.break_symmetries = break_symmetries
+        self.model = CpoModel()
+        self.known_instances = 0                    # instances of the schedule that are in the model, advanced by a successful solve
+        self.fixed_instances: set[int] = set()      # instances added by add_fixed_instance
+        self.fixed_intervals: dict[tuple, CpoIntervalVar] = {}  # (instance idx, jobId) -> interval of a fixed job (sigma > 0)
+        self.fixed_constraints: dict[tuple, list] = defaultdict(list)  # (instance idx, jobId) -> precedences of its fixed interval
+        self.profiles: dict[str, CpoStepFunction] = {}          # resource -> 0 where fixed jobs are scheduled (sigma == 0 or frozen)
+        self.fixed_end = 0                          # latest end of the jobs in the profiles
+        self.instance_constraints: dict[int, list] = {}          # constraints of the unfixed instances
+        self.resource_constraints: list = []        # no_overlap, forbid_extent, symmetry breaking and objective of the last solve
+
+    def get_profile(self, resource:str) -> CpoStepFunction:
+        if resource not in self.profiles:
+            self.profiles[resource] = CpoStepFunction(name=f"busy_{resource}")
+            self.profiles[resource].set_value(INTERVAL_MIN, INTERVAL_MAX, 100)
+        return self.profiles[resource]
+
+    def add_fixed_instance(self, i:int, ra_pst:dict):
+        """ Adds the selected jobs of a solved instance, as busy profile (sigma == 0) or as interval variables """
+        self.fixed_instances.add(i)
+        for jobId, job in ra_pst["jobs"].items():
+            if not job["selected"]:
+                continue
+            if self.sigma == 0 and job["start"] is not None:
+                self.add_to_profile(job)
+            else:
+                self.fixed_intervals[(i, jobId)] = interval_var(name=jobId, optional=False, size=int(job["cost"]))
+        for jobId, job in ra_pst["jobs"].items():
+            for jobId2 in job["after"]:
+                if (i, jobId) in self.fixed_intervals and (i, jobId2) in self.fixed_intervals:
+                    constraint = end_before_start(self.fixed_intervals[(i, jobId2)], self.fixed_intervals[(i, jobId)])
+                    self.model.add(constraint)
+                    self.fixed_constraints[(i, jobId)].append(constraint)
+                    self.fixed_constraints[(i, jobId2)].append(constraint)
+
+    def add_to_profile(self, job:dict):
+        start, end = int(job["start"]), int(job["start"]) + int(job["cost"])
+        self.get_profile(job["resource"]).set_value(start, end, 0)
+        self.fixed_end = max(self.fixed_end, end)
+
+    def freeze_jobs(self, ra_psts:dict):
+        """ Folds the fixed intervals of the jobs behind the rolling horizon (see get_frozen_jobs) into the busy profiles """
+        frozen_jobs, _ = get_frozen_jobs(ra_psts, self.sigma)
+        frozen = [(i, jobId) for i, jobId in self.fixed_intervals if jobId in frozen_jobs]
+        constraints = []
+        for i, jobId in frozen:
+            self.add_to_profile(ra_psts["instances"][i]["jobs"][jobId])
+            del self.fixed_intervals[(i, jobId)]
+            constraints.extend(self.fixed_constraints.pop((i, jobId), []))
+        if constraints:
+            self.model.remove(constraints)
+
+    @removes_model_variables
+    def solve(self, ra_pst_json) -> dict:
+        """
+        Schedules the unfixed instances of ra_pst_json (path or dict, see cp_solver), returns the schedule with all instances fixed.
+        If the solve fails, the constraints of the unfixed instances leave the model again and a later solve retries them.
+        """
+        ra_psts = utils.load_schedule(ra_pst_json)
+        instances = ra_psts["instances"]
+        for instance in instances:
+            if "fixed" not in instance.keys():
+                instance["fixed"] = False
+        new_instances = [i for i in range(self.known_instances, len(instances)) if not instances[i]["fixed"]]
+        for i in range(self.known_instances, len(instances)):
+            if instances[i]["fixed"] and i not in self.fixed_instances:
+                self.add_fixed_instance(i, instances[i])
+        if self.rolling_horizon and self.fixed_intervals:
+            self.freeze_jobs(ra_psts)
+        symmetry_classes = get_symmetry_classes(ra_psts) if self.break_symmetries else []
+        try:
+            result = self.solve_new_instances(ra_psts, new_instances, symmetry_classes)
+        except BaseException:
+            for i in new_instances:
+                self.model.remove(self.instance_constraints.pop(i, []))
+            self.model.remove(self.resource_constraints)
+            self.resource_constraints = []
+            raise
+        self.known_instances = len(instances)
+        for (i, jobId), interval in self.fixed_intervals.items():
+            instances[i]["jobs"][jobId]["start"] = result.get_var_solution(interval).get_start()
+        for i in new_instances:
+            for job in instances[i]["jobs"].values():
+                itv = result.get_var_solution(job["interval"])
+                job["selected"] = itv.is_present()
+                job["start"] = itv.get_start()
+                del job["interval"]
+            instances[i]["fixed"] = True
+            # The solved instance is fixed from now on
+            self.model.remove(self.instance_constraints.pop(i))
+            self.add_fixed_instance(i, instances[i])
+
+        add_solution_info(ra_psts, result)
+        if self.break_symmetries:
+            ra_psts["solution"]["symmetry classes"] = len(symmetry_classes)
+        return ra_psts
+
+    def solve_new_instances(self, ra_psts:dict, new_instances:list[int], symmetry_classes:list[list[int]]):
+        """ Adds the unfixed instances and the resource constraints of this solve to the model and solves it """
+        instances = ra_psts["instances"]
+        for i in new_instances:
+            self.instance_constraints[i] = (add_unfixed_instance(self.model, instances[i])
+                                            + add_branch_constraints(self.model, instances[i], self.branch_formulation))
+
+        # Start windows of the fixed jobs around their last start
+        starting_solution = CpoModelSolution()
+        for (i, jobId), interval in self.fixed_intervals.items():
+            job = instances[i]["jobs"][jobId]
+            if job["start"] is not None:
+                start_hr = int(job["start"])
+                end_hr = int(job["start"]) + int(job["cost"])
+                interval.set_start_min(start_hr)
+                interval.set_start_max(start_hr + self.sigma)
+                interval.set_end_min(end_hr)
+                interval.set_end_max(end_hr + self.sigma)
+                starting_solution.add_interval_var_solution(interval, presence=True, start=start_hr, end=end_hr, size=int(job["cost"]))
+        if starting_solution.get_all_var_solutions():
+            self.model.set_starting_point(starting_solution)
+
+        # Resource constraints and objective over the current intervals
+        self.model.remove(self.resource_constraints)
+        self.resource_constraints = []
+        resource_intervals = defaultdict(list)
+        for (i, jobId), interval in self.fixed_intervals.items():
+            resource_intervals[instances[i]["jobs"][jobId]["resource"]].append(interval)
+        for i in new_instances:
+            for job in instances[i]["jobs"].values():
+                resource_intervals[job["resource"]].append(job["interval"])
+                if job["resource"] in self.profiles:
+                    self.resource_constraints.append(forbid_extent(job["interval"], self.profiles[job["resource"]]))
+        for intervals in resource_intervals.values():
+            self.resource_constraints.append(no_overlap(intervals))
+        ends = [end_of(interval) for intervals in resource_intervals.values() for interval in intervals]
+        if self.profiles:
+            ends.append(self.fixed_end)
+        self.resource_constraints.append(minimize(max(ends)))
+        self.resource_constraints.extend(get_symmetry_constraints(ra_psts, symmetry_classes))
+        self.model.add(self.resource_constraints)
+
+        with open(self.log_file, "w") as f:
+            result = self.model.solve(TimeLimit=self.timeout, log_output=f)
+        if result.get_solve_status() == "Infeasible":
+            raise ValueError("Infeasible model")
+        return result
+
+
 if __name__ == "__main__":
     file = "cp_rep_test.json"    
     print("Start")
@@ -1,5 +1,6 @@
 from docplex.cp.model import *
-import json
+from src.ra_pst_py import utils
+from src.ra_pst_py.cp_docplex import get_frozen_jobs, get_symmetry_classes, removes_model_variables
 import random
 from math import comb
 
@@ -7,9 +8,10 @@ import gurobipy as gp
 from gurobipy import GRB
 
 
+@removes_model_variables
 def cp_solver_decomposed_monotone_cuts(ra_pst_json, TimeLimit = None):
     """
-    ra_pst_json input format:
+    ra_pst_json (JSON file path or the loaded dict, see utils.load_schedule) input format:
     {
         "resources": [resourceId],
         "instances": [
@@ -42,8 +44,7 @@ def cp_solver_decomposed_monotone_cuts(ra_pst_json, TimeLimit = None):
         ]
     }
     """
-    with open(ra_pst_json, "r") as f:
-        ra_psts = json.load(f)
+    ra_psts = utils.load_schedule(ra_pst_json)
 
     # Fix taskIds for deletes: 
     for i, instance in enumerate(ra_psts["instances"]):
@@ -124,9 +125,11 @@ def cp_solver_decomposed_monotone_cuts(ra_pst_json, TimeLimit = None):
     return ra_psts
 
 
+@removes_model_variables
 def cp_solver_decomposed_strengthened_cuts(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", TimeLimit=100, break_symmetries:bool=False, sigma:int=0):
     """
-    ra_pst_json input format:
+    break_symmetries: order identical unfixed instances by their branch choice in the master problem and by their first start in the subproblem
+    ra_pst_json (JSON file path or the loaded dict, see utils.load_schedule) input format:
     {
         "resources": [resourceId],
         "instances": [
@@ -159,8 +162,7 @@ def cp_solver_decomposed_strengthened_cuts(ra_pst_json, warm_start_json=None, lo
         ]
     }
     """
-    with open(ra_pst_json, "r") as f:
-        ra_psts = json.load(f)
+    ra_psts = utils.load_schedule(ra_pst_json)
 
     # Fix taskIds for deletes: 
     for i, instance in enumerate(ra_psts["instances"]):
@@ -185,6 +187,12 @@ def cp_solver_decomposed_strengthened_cuts(ra_pst_json, warm_start_json=None, lo
     upper_bound = big_number
 
     master_model, z, E, Q, Y = ilp_masterproblem(ra_psts, upper_bound)
+    symmetry_classes = get_symmetry_classes(ra_psts) if break_symmetries else []
+    for instances in symmetry_classes:
+        # Identical instances can swap their configurations, order them by the positions of their selected branches
+        branch_keys = [gp.quicksum(k * branch["selected"] for k, branch in enumerate(ra_psts["instances"][i]["branches"].values())) for i in instances]
+        for branch_key, next_branch_key in zip(branch_keys, branch_keys[1:]):
+            master_model.addConstr(branch_key <= next_branch_key)
 
     best_schedule = None
     best_jobs = None
@@ -250,7 +258,7 @@ def cp_solver_decomposed_strengthened_cuts(ra_pst_json, warm_start_json=None, lo
                             full_resource_lb = subproblem_lb
                 if not added_cut: break
 
-            schedule, all_jobs = cp_subproblem(ra_psts, selected_branches_extended, lower_bound=full_resource_lb, sigma=sigma)
+            schedule, all_jobs = cp_subproblem(ra_psts, selected_branches_extended, lower_bound=full_resource_lb, sigma=sigma, symmetry_classes=symmetry_classes)
             # Solved subproblem: Set new upper bound
             if schedule.get_objective_value() <= upper_bound:
                 upper_bound = schedule.get_objective_value()
@@ -308,6 +316,8 @@ def cp_solver_decomposed_strengthened_cuts(ra_pst_json, warm_start_json=None, lo
         "computing time" : computing_time, 
         "total interval length" : sum(total_branch_costs)
     }
+    if break_symmetries:
+        ra_psts["solution"]["symmetry classes"] = len(symmetry_classes)
                 
     print(f"Lower bound: {lower_bound}, upper bound: {upper_bound}. Gap {100*(upper_bound-lower_bound)/upper_bound:.2f}%")
     return ra_psts
@@ -414,13 +424,19 @@ def ilp_masterproblem(ra_psts, upper_bound):
     return master_model, z, E, Q, Y
 
 
-def cp_subproblem(ra_psts, branches, lower_bound=0, sigma:int=0):
+def cp_subproblem(ra_psts, branches, lower_bound=0, sigma:int=0, rolling_horizon:bool=True, symmetry_classes:list=()):
+    """
+    rolling_horizon: jobs of fixed instances that end before the unfixed instances arrive are not part of the model (see get_frozen_jobs)
+    symmetry_classes: identical instances (see get_symmetry_classes), the ones with the same configuration are ordered by their first start
+    """
     #print("start subproblem")
     # Solve sub-problem
     resource_jobs = {resource: [] for resource in ra_psts["resources"]}
     all_jobs = []
+    frozen_jobs, frozen_end = get_frozen_jobs(ra_psts, sigma) if rolling_horizon else (set(), 0)
     subproblem_model = CpoModel(name="subproblem")
-    for ra_pst in ra_psts["instances"]:
+    first_jobs = {}
+    for i, ra_pst in enumerate(ra_psts["instances"]):
         instance_jobs = []
         previous_branch_jobs = []
         instance_cost = 0
@@ -428,6 +444,7 @@ def cp_subproblem(ra_psts, branches, lower_bound=0, sigma:int=0):
             # print(f'branch {branchId}: {int(branch["selected"].x)}')
             if not branchId in branches: continue
             for jobId in branch["jobs"]:
+                if jobId in frozen_jobs: continue
                 interval_var = subproblem_model.interval_var(name=jobId, optional=False, size=int(ra_pst["jobs"][jobId]["cost"]))
                 if "release_time" in ra_pst["jobs"][jobId].keys():
                     interval_var.set_start_min(ra_pst["jobs"][jobId]["release_time"])
@@ -447,12 +464,19 @@ def cp_subproblem(ra_psts, branches, lower_bound=0, sigma:int=0):
                 all_jobs.append(interval_var)
                 instance_cost += int(ra_pst["jobs"][jobId]["cost"])
                 instance_jobs.append(interval_var)
-        subproblem_model.add(no_overlap(instance_jobs))
+        if instance_jobs:
+            subproblem_model.add(no_overlap(instance_jobs))
+            first_jobs[i] = instance_jobs[0]
+    for instances in symmetry_classes:
+        for i, i_next in zip(instances, instances[1:]):
+            configuration = [k for k, branchId in enumerate(ra_psts["instances"][i]["branches"]) if branchId in branches]
+            if configuration == [k for k, branchId in enumerate(ra_psts["instances"][i_next]["branches"]) if branchId in branches]:
+                subproblem_model.add(start_of(first_jobs[i]) <= start_of(first_jobs[i_next]))
     
     # No overlap between jobs on the same resource
     subproblem_model.add(no_overlap(resource_jobs[resource]) for resource in ra_psts["resources"] if len(resource_jobs[resource]) > 1)
     # Objective
-    makespan = max(end_of(interval) for interval in all_jobs)
+    makespan = max([end_of(interval) for interval in all_jobs] + ([frozen_end] if frozen_jobs else []))
     subproblem_model.add(makespan >= lower_bound)
     subproblem_model.add(minimize(makespan))
     # Solve model
@@ -1,12 +1,16 @@
-from src.ra_pst_py import utils
+from src.ra_pst_py import utils, xpaths
 from src.ra_pst_py.core import Branch, RA_PST
 from src.ra_pst_py.builder import build_rapst, show_tree_as_graph
+from src.ra_pst_py.timeline import ResourceTimeline
 from lxml import etree
 import numpy as np
 from collections import defaultdict
 import warnings
 import os
+import copy
 import json
+import time
+import random
 from abc import ABC, abstractmethod
 from enum import StrEnum
 
@@ -23,6 +27,39 @@ class CPDirction_Enum(StrEnum):
     ANY = "any"
     REPLACE = "replace"    
 
+def get_deletion_savings(ra_pst:RA_PST, label:str) -> float:
+    """
+    Savings of deleting the task with label: the negative cost of its cheapest branch, 0 if no such task exists.
+    """
+    min_deletion_savings = ra_pst.get_deletion_savings_table().get_costs(label, ra_pst.get_process_index())
+    if len(min_deletion_savings) > 1:
+        warnings.warn("More than one task available to be deleted. Your process has multiple tasks with the same name")
+    if min_deletion_savings:
+        return -float(min(min_deletion_savings))
+    return float(0)
+
+def get_forward_deletes(ra_pst:RA_PST, task_id:str, labels:list[str]) -> tuple[set, bool]:
+    """
+    Splits the labels to delete into the ones of tasks after task_id in the process
+    and returns (forward labels, True if a label belongs to a previous task).
+    """
+    if not labels:
+        return set(), False
+    tasklist = ra_pst.get_tasklist()
+    task_position = [i for i, task in enumerate(tasklist) if task.attrib["id"] == task_id][0]
+    forward_deletes = set()
+    backwards_delete = False
+    for label in labels:
+        for i, delete_task in enumerate(tasklist):
+            if utils.get_label(delete_task) != label:
+                continue
+            if i > task_position:
+                forward_deletes.add(label)
+            else:
+                warnings.warn("Previous tasks can not be deleted from the process")
+                backwards_delete = True
+    return forward_deletes, backwards_delete
+
 class TaskNode():
     def __init__(self, task, initialize:bool=True):
         self.task:etree._Element = task
@@ -42,20 +79,20 @@ class TaskNode():
         self.resource:str = self.get_resource()
     
     def get_release_time(self):
-        return float(self.task.xpath("cpee1:release_time", namespaces=self.ns)[0])
+        return float(xpaths.RELEASE_TIME(self.task)[0])
     
     def get_duration(self):
         attrib = "cost"
-        return float(self.task.xpath(f"cpee1:children/cpee1:resource/cpee1:resprofile/cpee1:measures/cpee1:{attrib}", namespaces=self.ns)[0].text)
+        return float(xpaths.measure(attrib)(self.task)[0].text)
 
     def get_resource(self):
-        return (self.task.xpath("cpee1:children/cpee1:resource", namespaces=self.ns)[0].attrib["id"])
+        return (xpaths.TASK_RESOURCE(self.task)[0].attrib["id"])
     
     def get_namespace(self):
         return {"cpee1": list(self.task.nsmap.values())[0]}
 
     def set_change_patterns(self):
-        children = self.task.xpath("cpee1:children/cpee1:resource/cpee1:resprofile/cpee1:children/*", namespaces=self.ns)
+        children = xpaths.TASK_RESPROFILE_CHILDREN(self.task)
         self.change_patterns = [CpTaskNode(child) for child in children]
     
     def set_release_time(self, release_time):
@@ -81,71 +118,33 @@ class TaskNode():
             child.add_all_times_to_branch()
     
     def get_interval(self, ra_pst:RA_PST) -> tuple:
-        starts = self.task.xpath("//cpee1:expected_start/text()", namespaces=self.ns)
+        starts = xpaths.ALL_EXPECTED_STARTS(self.task)
         starts = sorted([float(start) for start in starts])
-        ends = self.task.xpath("//cpee1:expected_end/text()", namespaces=self.ns)
+        ends = xpaths.ALL_EXPECTED_ENDS(self.task)
         ends = sorted([float(end) for end in ends])
         
         # Find all <cpee1:expected_delete> nodes
-        # find self.task in ra_pst: 
-        task = [task for task in ra_pst.get_tasklist() if task.attrib["id"] == self.task.attrib["id"]][0]
-        nodes_to_delete = self.task.xpath("//cpee1:expected_delete/parent::*", namespaces=self.ns)
-        nodes_to_delete_ra_pst = []
-        for node in nodes_to_delete:
-            nodes_to_delete_ra_pst.extend([delete_task for delete_task in ra_pst.get_tasklist() if utils.get_label(delete_task) == utils.get_label(node)])
-        
-        filtered_deletes = []
-        for delete_task in nodes_to_delete_ra_pst:
-            if ra_pst.get_tasklist().index(delete_task) > ra_pst.get_tasklist().index(task):
-                filtered_deletes.append(utils.get_label(delete_task))
-            else:
-                warnings.warn("Previous tasks can not be deleted from the process")
-                self.backwards_delete = True
+        nodes_to_delete = xpaths.ALL_EXPECTED_DELETES(self.task)
+        filtered_deletes, backwards_delete = get_forward_deletes(
+            ra_pst, self.task.attrib["id"], [utils.get_label(node) for node in nodes_to_delete])
+        if backwards_delete:
+            self.backwards_delete = True
 
-        nodes_to_delete = sorted([float(delete_task.xpath("cpee1:expected_delete/text()", namespaces=self.ns)[0]) for delete_task in nodes_to_delete if utils.get_label(delete_task) in filtered_deletes])
+        nodes_to_delete = sorted([float(xpaths.EXPECTED_DELETE_TEXT(delete_task)[0]) for delete_task in nodes_to_delete if utils.get_label(delete_task) in filtered_deletes])
         return (starts[0], ends[-1] - starts[0], sum(nodes_to_delete),  ends[-1])
         
-    def set_earliest_start(self, schedule_dict:dict) -> None:
+    def set_earliest_start(self, timeline:ResourceTimeline) -> None:
         """
         Finds best availabe timeslot for one task of an RA-PST.
         """
-        earliest_start = np.inf
-        earliest_finish = np.inf
-        timeslot_matrix = self.get_timeslot_matrix(schedule_dict)
-        possible_slots = np.argwhere(np.diff(timeslot_matrix) >= self.duration)
-        if possible_slots.size > 0:
-            for slot in possible_slots:
-                earliest_slot = float(timeslot_matrix[slot[0]][0])
-                if earliest_slot+self.duration < earliest_finish and earliest_slot >= float(self.release_time):
-                    earliest_start = earliest_slot
-                    earliest_finish = earliest_slot+self.duration
-                elif timeslot_matrix[slot[0]][1] == np.inf and earliest_start == np.inf:
-                    earliest_start = self.release_time
-                    earliest_finish = earliest_slot+self.duration
-        else:
-            raise ValueError("No timeslot found")
-        #print(f" Best start: {earliest_start}, on resource {allocated_resource}")
-        self.earliest_start = earliest_start
+        self.earliest_start = timeline.earliest_start(self.resource, self.release_time, self.duration)
     
-    def get_timeslot_matrix(self, schedule_dict:dict):
-        if not schedule_dict:
-            return np.array([[self.release_time, np.inf]])
-        matrix = []
-        jobs_on_resource = []
-        # Match selected Jobs and resources
-        for instance in schedule_dict["instances"]:
-            jobs_on_resource.extend([job for jobId, job in instance["jobs"].items() if job["selected"] and job["resource"] == self.resource])
-        for block in jobs_on_resource:
-            if float(block["start"]) + float(block["cost"]) >= self.release_time:
-                matrix.append([block["start"], block["start"] + block["cost"]])
-        matrix.sort()
-        matrix.append([np.inf, 0])
-        if matrix:
-            return np.roll(np.array(matrix), 1) 
-        else:
-            return np.array([[self.release_time, np.inf]])
+    def get_timeslot_matrix(self, timeline:ResourceTimeline):
+        return timeline.get_timeslot_matrix(self.resource, self.release_time)
         
-    def calculate_finish_time(self, schedule_dict:dict, ra_pst:RA_PST, backwards_delete:bool=False):
+    def calculate_finish_time(self, timeline:ResourceTimeline | dict, ra_pst:RA_PST, backwards_delete:bool=False):
+        if not isinstance(timeline, ResourceTimeline):
+            timeline = ResourceTimeline.from_schedule(timeline)
 
         self.set_change_patterns()
         if self.change_patterns:
@@ -154,18 +153,18 @@ class TaskNode():
                     if child_task_node.cp_direction == CPDirction_Enum.BEFORE:
                         # Insert Before
                         child_task_node.set_release_time(self.release_time)
-                        child_task_node.calculate_finish_time(schedule_dict, ra_pst)
+                        child_task_node.calculate_finish_time(timeline, ra_pst)
                         child_fin = [child_node.earliest_start + child_node.duration for child_node in child_task_node.change_patterns]
                         child_task_node_finish = child_fin.append(child_task_node.earliest_start + child_task_node.duration)
                         child_task_node_finish = max(child_fin)
                         self.set_release_time(child_task_node_finish)
-                        self.set_earliest_start(schedule_dict)
+                        self.set_earliest_start(timeline)
 
                     elif child_task_node.cp_direction == CPDirction_Enum.AFTER:
                         # Insert After
-                        self.set_earliest_start(schedule_dict)
+                        self.set_earliest_start(timeline)
                         child_task_node.set_release_time(self.earliest_start + self.duration)
-                        child_task_node.calculate_finish_time(schedule_dict, ra_pst)
+                        child_task_node.calculate_finish_time(timeline, ra_pst)
                     elif child_task_node.cp_direction == CPDirction_Enum.PARALLEL:
                         # Insert Parallel
                         pass
@@ -174,16 +173,8 @@ class TaskNode():
                     # DELETE Task
                     # TODO calc_minimum deletion savings
                     warnings.warn("The direction of the delete is any, for taskwise allocation, previous tasks can not be deleted from the process")
-                    self.set_earliest_start(schedule_dict)
-                    affected_tasks= [ra_pst_task for ra_pst_task in ra_pst.get_tasklist() if child_task_node.task.attrib["label"] == utils.get_label(ra_pst_task)]
-                    if len(affected_tasks) > 1:
-                        warnings.warn("More than one task available to be deleted. Your process has multiple tasks with the same name")
-                    min_deletion_savings = []
-                    for affected_task in affected_tasks:
-                        branches = ra_pst.branches[affected_task.attrib["id"]]
-                        min_deletion_savings.append(sorted([branch.get_branch_costs() for branch in branches])[0])
-                    if min_deletion_savings:
-                        child_task_node.deletion_savings = -float(sorted(min_deletion_savings)[0])
+                    self.set_earliest_start(timeline)
+                    child_task_node.deletion_savings = get_deletion_savings(ra_pst, child_task_node.task.attrib["label"])
                     child_task_node.duration = 0.0
                     child_task_node.earliest_start = 0.0
 
@@ -203,7 +194,7 @@ class TaskNode():
         else:
             # Find earliest timeslot in schedule and set it
             self.check_release_time()
-            self.set_earliest_start(schedule_dict)
+            self.set_earliest_start(timeline)
 
         return self
 
@@ -225,46 +216,239 @@ class CpTaskNode(TaskNode):
             return CPDirction_Enum(self.task.attrib["direction"])
 
 
+class BranchPlan():
+    """
+    Slot queries of one branch in the order of TaskNode.calculate_finish_time, compiled once per branch.
+    The finish times are kept in a value vector [-inf, release time, 0.0, finish of query 0, ...],
+    the release time of each query is the max over sources, indices into this vector.
+    Raises NotImplementedError for change patterns without a batch evaluation (parallel, replace).
+    """
+    NEG_INF, RELEASE, ZERO, OFFSET = 0, 1, 2, 3
+
+    def __init__(self, node:etree._Element):
+        self.resources: list[str] = []
+        self.durations: list[float] = []
+        self.sources: list[list[int]] = []
+        # Final query of the task and each insert, their times are written to the branch
+        self.written: list[int] = []
+        # (label attribute, utils label) of the delete change patterns
+        self.deletes: list[tuple[str, str]] = []
+        self._compile(TaskNode(node), [self.RELEASE])
+
+    def _query(self, task_node:TaskNode, sources:list[int]) -> int:
+        self.resources.append(task_node.resource)
+        self.durations.append(task_node.duration)
+        self.sources.append(list(sources))
+        return len(self.resources) - 1
+
+    def _compile(self, task_node:TaskNode, release:list[int]) -> tuple[int, list[int]]:
+        """ Adds the queries of task_node, returns its final query and the finish values of its change patterns """
+        task_node.set_change_patterns()
+        child_finishes = []
+        if not task_node.change_patterns:
+            query = self._query(task_node, release)
+        for child in task_node.change_patterns:
+            if child.cp_type == CPType_Enum.INSERT and child.cp_direction == CPDirction_Enum.BEFORE:
+                child_query, grandchild_finishes = self._compile(child, release)
+                release = grandchild_finishes + [self.OFFSET + child_query]
+                query = self._query(task_node, release)
+                child_finishes.append(self.OFFSET + child_query)
+            elif child.cp_type == CPType_Enum.INSERT and child.cp_direction == CPDirction_Enum.AFTER:
+                query = self._query(task_node, release)
+                child_query, _ = self._compile(child, [self.OFFSET + query])
+                child_finishes.append(self.OFFSET + child_query)
+            elif child.cp_type == CPType_Enum.DELETE:
+                query = self._query(task_node, release)
+                self.deletes.append((child.task.attrib["label"], utils.get_label(child.task)))
+                child_finishes.append(self.ZERO)
+            else:
+                raise NotImplementedError(f"No batch evaluation for {child.cp_type} {child.cp_direction}")
+        self.written.append(query)
+        return query, child_finishes
+
+    @classmethod
+    def evaluate(cls, plans:list['BranchPlan'], release_time:float, timeline:ResourceTimeline) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Earliest starts and finish values of all queries of plans against timeline.
+        The i-th query of all plans is placed in one vectorized call per resource.
+        """
+        n_queries = max(len(plan.resources) for plan in plans)
+        values = np.full((len(plans), cls.OFFSET + n_queries), -np.inf)
+        values[:, cls.RELEASE] = release_time
+        values[:, cls.ZERO] = 0.0
+        starts = np.full((len(plans), n_queries), np.nan)
+        for query in range(n_queries):
+            rows = np.array([i for i, plan in enumerate(plans) if query < len(plan.resources)])
+            width = max(len(plans[i].sources[query]) for i in rows)
+            sources = np.array([plans[i].sources[query] + [cls.NEG_INF] * (width - len(plans[i].sources[query])) for i in rows])
+            release_times = values[rows[:, None], sources].max(axis=1)
+            durations = np.array([plans[i].durations[query] for i in rows])
+            resources = np.array([plans[i].resources[query] for i in rows])
+            for resource in dict.fromkeys(resources.tolist()):
+                mask = resources == resource
+                starts[rows[mask], query] = timeline.earliest_starts(resource, release_times[mask], durations[mask])
+            values[rows, cls.OFFSET + query] = starts[rows, query] + durations
+        return starts, values
+
+    def evaluate_one(self, release_time:float, timeline:ResourceTimeline) -> tuple[list[float], list[float]]:
+        """ Scalar BranchPlan.evaluate for a single plan """
+        values = [-np.inf, release_time, 0.0]
+        starts = []
+        for resource, duration, sources in zip(self.resources, self.durations, self.sources):
+            starts.append(timeline.earliest_start(resource, max(values[source] for source in sources), duration))
+            values.append(starts[-1] + duration)
+        return starts, values
+
+    def get_interval(self, starts:list[float], values:list[float]) -> tuple[float, float, float]:
+        """ (first start, makespan, last end) of the written queries, as TaskNode.get_interval """
+        first_start = min(starts[query] for query in self.written)
+        last_end = max(values[self.OFFSET + query] for query in self.written)
+        return first_start, last_end - first_start, last_end
+
+
 class TaskAllocator():
+    # Below this number of branches the branches of a task are evaluated one by one
+    MIN_VECTORIZED_BRANCHES = 12
 
-    def __init__(self, ra_pst:RA_PST,  change_operation):
+    def __init__(self, ra_pst:RA_PST,  change_operation, batch:bool = True):
+        """
+        batch: evaluate the branches of a task together (see allocate_task_batch),
+        otherwise every branch is propagated through its TaskNode
+        """
         self.ra_pst = ra_pst
         self.ns = ra_pst.ns
         self.change_operation = change_operation
+        self.batch = batch
+        # Random tie-breaking: with rng, a random branch within tie_tolerance * duration of the best one is chosen
+        self.rng: random.Random = None
+        self.tie_tolerance: float = 0.0
 
-    def allocate_task(self, task:etree._Element, schedule_filepath:os.PathLike | str) -> tuple[Branch, tuple]:
+    def allocate_task(self, task:etree._Element, schedule_filepath:os.PathLike | str, timeline:ResourceTimeline = None, branch_no:int = None) -> tuple[Branch, tuple]:
         """
         Allocates a task to a resource and propagate through ra_pst
+        timeline: busy intervals of the current schedule, read from schedule_filepath if not given
+        branch_no: allocate this branch of the task instead of the earliest finishing one
         """
-        if os.path.getsize(schedule_filepath) > 0:
-            with open(schedule_filepath, "r") as f:
-                schedule_dict = json.load(f)
-        else:
-            schedule_dict = {}
+        if timeline is None:
+            if os.path.getsize(schedule_filepath) > 0:
+                with open(schedule_filepath, "r") as f:
+                    schedule_dict = json.load(f)
+            else:
+                schedule_dict = {}
+            timeline = ResourceTimeline.from_schedule(schedule_dict)
+        if branch_no is not None:
+            branch = self.ra_pst.branches[task.attrib['id']][branch_no]
+            _, interval = self.propagate_branch(branch, task, timeline)
+            return branch, interval
+        if self.batch:
+            return self.allocate_task_batch(task, timeline)
         branches = self.ra_pst.branches[task.attrib['id']]
         finish_times = []
         for branch in branches:
             #TODO create etree._Element release_time for each task in branch and set time to release_time
             if branch.check_validity():
-                task_node = TaskNode(branch.node)
-                branch_release = task.xpath("cpee1:release_time", namespaces=self.ns)[0].text
-                task_node.set_release_time(float(branch_release))
-                task_node.calculate_finish_time(schedule_dict, self.ra_pst)
-                task_node.add_all_times_to_branch()
-                branch.node = task_node.task    # Update branch node
-                interval = task_node.get_interval(self.ra_pst)
+                task_node, interval = self.propagate_branch(branch, task, timeline)
                 if not task_node.backwards_delete:
                     finish_times.append((branch, interval))
 
         if not finish_times:
             raise ValueError("No valid branch for this task")
-        finish_times.sort(key=lambda x: sum(x[1][0:3]))
         #print(finish_times)
-        return finish_times[0]
+        return self.select_branch(finish_times)
+
+    def select_branch(self, finish_times:list[tuple]) -> tuple:
+        """
+        Entry of finish_times [(branch, interval, ...)] with the earliest finish incl. deletion savings,
+        the first one on ties. With self.rng a random one of the near-equal entries.
+        """
+        finish_times.sort(key=lambda x: sum(x[1][0:3]))
+        if self.rng is None:
+            return finish_times[0]
+        bound = sum(finish_times[0][1][0:3]) + self.tie_tolerance * finish_times[0][1][1]
+        return self.rng.choice([x for x in finish_times if sum(x[1][0:3]) <= bound])
+
+    def propagate_branch(self, branch:Branch, task:etree._Element, timeline:ResourceTimeline) -> tuple[TaskNode, tuple]:
+        """ Calculates the times of branch and writes them into the branch node """
+        task_node = TaskNode(branch.get_node_for_update())
+        branch_release = xpaths.RELEASE_TIME(task)[0].text
+        task_node.set_release_time(float(branch_release))
+        task_node.calculate_finish_time(timeline, self.ra_pst)
+        task_node.add_all_times_to_branch()
+        branch.node = task_node.task    # Update branch node
+        return task_node, task_node.get_interval(self.ra_pst)
+
+    def get_branch_plan(self, task_id:str, branch_no:int, branch:Branch) -> BranchPlan | None:
+        """ Compiled plan of a branch, None if it has to be propagated through its TaskNode """
+        # The plan only depends on the branch structure and is shared with the copy-on-write copies of the RA_PST
+        plans = getattr(self.ra_pst, "branch_plans", None)
+        if plans is None:
+            plans = self.ra_pst.branch_plans = {}
+        if (task_id, branch_no) not in plans:
+            try:
+                plans[(task_id, branch_no)] = BranchPlan(branch.node)
+            except NotImplementedError:
+                plans[(task_id, branch_no)] = None
+        return plans[(task_id, branch_no)]
+
+    def get_plan_savings(self, task_id:str, plan:BranchPlan, deletion_savings:dict) -> float | None:
+        """
+        Summed savings of the forward deletes of plan as in TaskNode.get_interval, None if plan deletes a previous task.
+        deletion_savings: get_deletion_savings per label, filled on demand
+        """
+        expected_deletes = []
+        for label, delete_label in plan.deletes:
+            if label not in deletion_savings:
+                deletion_savings[label] = get_deletion_savings(self.ra_pst, label)
+            if deletion_savings[label] < 0:
+                expected_deletes.append((delete_label, deletion_savings[label]))
+        forward_deletes, backwards_delete = get_forward_deletes(
+            self.ra_pst, task_id, [delete_label for delete_label, _ in expected_deletes])
+        if backwards_delete:
+            return None
+        return sum(sorted(savings for delete_label, savings in expected_deletes if delete_label in forward_deletes))
+
+    def allocate_task_batch(self, task:etree._Element, timeline:ResourceTimeline) -> tuple[Branch, tuple]:
+        """
+        Same selection as allocate_task, but the finish times of all valid branches are computed
+        together through BranchPlan.evaluate. Only the selected branch gets its times written.
+        """
+        task_id = task.attrib['id']
+        release_time = float(xpaths.RELEASE_TIME(task)[0].text)
+        valid = [(branch_no, branch) for branch_no, branch in enumerate(self.ra_pst.branches[task_id]) if branch.check_validity()]
+        plans = {branch_no: self.get_branch_plan(task_id, branch_no, branch) for branch_no, branch in valid}
+        batch_nos = [branch_no for branch_no, _ in valid if plans[branch_no] is not None]
+        if len(batch_nos) >= self.MIN_VECTORIZED_BRANCHES:
+            starts, values = BranchPlan.evaluate([plans[branch_no] for branch_no in batch_nos], release_time, timeline)
+            times = {branch_no: (starts[row].tolist(), values[row].tolist()) for row, branch_no in enumerate(batch_nos)}
+        else:
+            # NumPy overhead outweighs the gain for a few branches
+            times = {branch_no: plans[branch_no].evaluate_one(release_time, timeline) for branch_no in batch_nos}
+
+        deletion_savings = {}
+        finish_times = []
+        for branch_no, branch in valid:
+            plan = plans[branch_no]
+            if plan is None:
+                task_node, interval = self.propagate_branch(branch, task, timeline)
+                if not task_node.backwards_delete:
+                    finish_times.append((branch, interval, True))
+                continue
+            savings = self.get_plan_savings(task_id, plan, deletion_savings)
+            if savings is None:
+                continue
+            first_start, makespan, last_end = plan.get_interval(*times[branch_no])
+            finish_times.append((branch, (first_start, makespan, savings, last_end), False))
+
+        if not finish_times:
+            raise ValueError("No valid branch for this task")
+        branch, interval, propagated = self.select_branch(finish_times)
+        if not propagated:
+            _, interval = self.propagate_branch(branch, task, timeline)
+        return branch, interval
     
     def set_release_times(self, branch, task):
         # TODO get all tasks in branch and set release_time to task.release_time
-        release_time = task.xpath("cpee1:release_time", namespaces=self.ns)[0].text
+        release_time = xpaths.RELEASE_TIME(task)[0].text
         tasks = branch.get_tasklist()
         for branch_task in tasks:
             child = etree.SubElement(branch_task, f"{{{self.ns['cpee1']}}}release_time")
@@ -317,7 +501,7 @@ class TaskAllocator():
         Propagation through branch needed.
         """
         to_del_time = float(0)
-        next_change_patterns = task.xpath("cpee1:children/cpee1:resource/cpee1:resprofile/cpee1:changepattern", namespaces=self.ns)
+        next_change_patterns = xpaths.TASK_CHANGEPATTERNS(task)
         if not next_change_patterns:
             #release_time_element = task.xpath("cpee1:release_time", namespaces=self.ns)[0]
             #resource_element = task.xpath("cpee1:children/cpee1:resource", namespaces=self.ns)[0]
@@ -330,8 +514,7 @@ class TaskAllocator():
             return start_element, earliest_start, duration, to_del_time
 
         else:
-            next_children = task.xpath(
-                "cpee1:children/cpee1:resource/cpee1:resprofile/cpee1:children/*", namespaces=self.ns)
+            next_children = xpaths.TASK_RESPROFILE_CHILDREN(task)
             for child in next_children:
                 change_pattern_type = child.xpath("@type")[0]
                 try:
@@ -349,8 +532,7 @@ class TaskAllocator():
                             task=child, schedule_dict=schedule_dict)
                         #child.xpath("cpee1:expectedready", namespaces=self.ns)[
                         #    0].text = times_tuple[0].text
-                        task.xpath("cpee1:release_time", namespaces=self.ns)[
-                            0].text = str(earliest_start + duration)
+                        xpaths.RELEASE_TIME(task)[0].text = str(earliest_start + duration)
                        
                         # find times for tree_node
                         allocated_resource, earliest_start, duration = self.find_best_resource(task, schedule_dict)
@@ -388,10 +570,10 @@ class TaskAllocator():
 
                         # Set earliest possible starttime on both tasks Anchor and Inserted.
                         # Recurse further down if needed
-                        anchor = task.xpath("cpee1:release_time", namespaces=self.ns)[0]
+                        anchor = xpaths.RELEASE_TIME(task)[0]
                         start_element, earliest_start, duration, to_del_time = self.calculate_finish_time(
                                                     task=child,schedule_dict=schedule_dict)
-                        child_node = child.xpath("cpee1:release_time", namespaces=self.ns)[0]
+                        child_node = xpaths.RELEASE_TIME(child)[0]
                         if float(anchor.text) < float(earliest_start):
                             anchor.text = str(earliest_start)
                         else:
@@ -426,21 +608,16 @@ class TaskAllocator():
                                 delete_element = etree.SubElement(proc_task, f"{{{self.ns['cpee1']}}}to_delete")
                                 self.change_operation.to_del_label.append(utils.get_label(etree.tostring(proc_task)))
                             
-                            label = utils.get_label(etree.tostring(task))
-                            tasks_ra_pst = self.ra_pst.get_tasklist()
-                            to_del_tasks_ra_pst = [task for task in tasks_ra_pst if utils.get_label(etree.tostring(task)) == label]
-                            for to_del_task in to_del_tasks_ra_pst:
-                                branches = self.ra_pst.branches[to_del_task.attrib["id"]]
-                                min_deletion_savings.append(sorted([branch.get_branch_costs() for branch in branches])[0])
-                                # TODO how to store this value
+                            label = utils.get_label(task)
+                            min_deletion_savings.extend(self.ra_pst.get_deletion_savings_table().get_costs(label, self.ra_pst.get_process_index()))
                             
 
-                        cp_element = new_child.xpath("cpee1:children/cpee1:resource/cpee1:resprofile/cpee1:changepattern", namespaces=self.ns)[0]
-                        new_child.xpath("cpee1:children/cpee1:resource/cpee1:resprofile", namespaces=self.ns)[0].remove(cp_element)
+                        cp_element = xpaths.TASK_CHANGEPATTERNS(new_child)[0]
+                        xpaths.TASK_RESPROFILE(new_child)[0].remove(cp_element)
 
                         start_element, earliest_start, duration, to_del_time = self.calculate_finish_time(
                             task=new_child, schedule_dict=schedule_dict)
-                        task.xpath("cpee1:release_time", namespaces=self.ns)[0].text = str(earliest_start)
+                        xpaths.RELEASE_TIME(task)[0].text = str(earliest_start)
                         to_del_time = 0
                         if min_deletion_savings:
                             to_del_time = -float(sorted(min_deletion_savings)[0])
@@ -463,7 +640,7 @@ class TaskAllocator():
                     # return to branch
                     return start_element, earliest_start, duration, to_del_time
             
-            if task.xpath("descendant::cpee1:changepattern/@type", namespaces=self.ns)[0] == "delete":
+            if xpaths.CHANGEPATTERN_TYPES(task)[0] == "delete":
                 # set values for task and resource
                 allocated_resource, earliest_start, duration = self.find_best_resource(task, schedule_dict)
                 start_element = etree.SubElement(task, f"{{{self.ns['cpee1']}}}expected_start")
@@ -474,11 +651,11 @@ class TaskAllocator():
                 return start_element, earliest_start, duration, to_del_time
             else:
                 print("Invalid branch, no time")
-                inval_child = task.xpath("descendant::cpee1:children[not(child::*)]", namespaces=self.ns)[0]
+                inval_child = xpaths.EMPTY_CHILDREN(task)[0]
                 parent = inval_child.xpath("parent::*")[0]
                 exp_ready_element = etree.SubElement(parent, f"{{{self.ns['cpee1']}}}release_time")
-                exp_ready_element.text = task.xpath("cpee1:release_time", namespaces=self.ns)[0].text
-                min_exp_ready = task.xpath("cpee1:release_time", namespaces=self.ns)[0].text
+                exp_ready_element.text = xpaths.RELEASE_TIME(task)[0].text
+                min_exp_ready = xpaths.RELEASE_TIME(task)[0].text
                 start_element, end_element = etree.SubElement(task, f"{{{self.ns['cpee1']}}}expected_start"), etree.SubElement(task, f"{{{self.ns['cpee1']}}}expected_end")
                 start_element.text, end_element.text = min_exp_ready, min_exp_ready
                 start_element, end_element = etree.SubElement(parent, f"{{{self.ns['cpee1']}}}expected_start"), etree.SubElement(parent, f"{{{self.ns['cpee1']}}}expected_end")
@@ -493,24 +670,168 @@ class TaskAllocator():
     def get_timeslot_matrix(self, release_time:float, resource_name:str, schedule_dict:dict):
         if not schedule_dict:
             return np.array([[release_time, np.inf]])
-        
-        matrix = []
-        jobs_on_resource = []
-
-        # Match selected Jobs and resources
-        for instance in schedule_dict["instances"]:
-            jobs_on_resource.extend([job for jobId, job in instance["jobs"].items() if job["selected"] and job["resource"] == resource_name])
-        for block in jobs_on_resource:
-            if float(block["start"]) + float(block["cost"]) >= release_time:
-                matrix.append([block["start"], block["start"] + block["cost"]])
-        matrix.sort()
-        matrix.append([np.inf, 0])
-        if matrix:
-            return np.roll(np.array(matrix), 1) 
-        else:
-            return np.array([[release_time, np.inf]])
+        return ResourceTimeline.from_schedule(schedule_dict).get_timeslot_matrix(resource_name, release_time)
     
 
+
+class BeamState():
+    """ Partial allocation of an instance in BeamSearch """
+    def __init__(self, timeline:ResourceTimeline, release_time:float, score:float, savings:float = 0.0,
+                 choices:dict = None, deleted:frozenset = frozenset(), position:int = 0, greedy:bool = False):
+        self.timeline = timeline            # schedule timeline incl. the jobs of the chosen branches
+        self.release_time = release_time    # release time of the next task
+        self.score = score                  # finish time + deletion savings
+        self.savings = savings
+        self.choices: dict[str, int] = choices if choices is not None else {}  # task id -> branch no
+        self.deleted = deleted              # labels of the deleted tasks
+        self.position = position            # position of the next task in the tasklist
+        self.greedy = greedy                # allocation of allocate_task, always kept in the beam
+
+
+class BeamSearch():
+    """
+    Beam search over the branches of the remaining tasks of one instance.
+    Keeps the width best partial allocations per task step, scored by finish time plus
+    deletion savings as TaskNode.get_interval, and the greedy allocation of allocate_task.
+    Of the complete allocations the earliest finishing one is returned.
+    Branches are evaluated through their BranchPlans, branches without a plan (parallel, replace)
+    are propagated through a TaskNode of a copy of the branch like in allocate_task.
+    Stops after time_budget seconds, the best partial allocation is returned then.
+    """
+    def __init__(self, allocator:TaskAllocator, width:int = 4, time_budget:float = 0.05):
+        if width < 1:
+            raise ValueError("width must be at least 1")
+        self.allocator = allocator
+        self.width = width
+        self.time_budget = time_budget
+        self.candidates: dict[str, list[tuple]] = {}
+        self.deadline: float = None
+
+    def get_candidates(self, task:etree._Element) -> list[tuple[int, BranchPlan, float, set]]:
+        """
+        (branch no, plan, deletion savings, deleted labels) of the valid branches of task,
+        (branch no, None, None, None) for a branch without a plan
+        """
+        task_id = task.attrib["id"]
+        if task_id not in self.candidates:
+            deletion_savings = {}
+            self.candidates[task_id] = []
+            for branch_no, branch in enumerate(self.allocator.ra_pst.branches[task_id]):
+                if not branch.check_validity():
+                    continue
+                plan = self.allocator.get_branch_plan(task_id, branch_no, branch)
+                if plan is None:
+                    self.candidates[task_id].append((branch_no, None, None, None))
+                    continue
+                savings = self.allocator.get_plan_savings(task_id, plan, deletion_savings)
+                if savings is not None:
+                    self.candidates[task_id].append((branch_no, plan, savings, {label for _, label in plan.deletes}))
+        return self.candidates[task_id]
+
+    def get_next_position(self, tasks:list[etree._Element], state:BeamState) -> int | None:
+        for position in range(state.position, len(tasks)):
+            if utils.get_label(tasks[position]) not in state.deleted:
+                return position
+        return None
+
+    def propagate(self, task:etree._Element, branch_no:int, state:BeamState) -> tuple | None:
+        """
+        Scalar evaluation of a branch without a plan: (deletion savings, deleted labels, jobs, first start, makespan)
+        as propagate_branch on a copy of the branch node, None if the branch deletes a previous task.
+        jobs: (resource, start, end) of the allocated tasks
+        """
+        branch = self.allocator.ra_pst.branches[task.attrib["id"]][branch_no]
+        task_node = TaskNode(copy.deepcopy(branch.node))
+        task_node.set_release_time(state.release_time)
+        task_node.calculate_finish_time(state.timeline, self.allocator.ra_pst)
+        task_node.add_all_times_to_branch()
+        first_start, makespan, savings, _ = task_node.get_interval(self.allocator.ra_pst)
+        if task_node.backwards_delete:
+            return None
+        deleted, jobs, nodes = set(), [], [task_node]
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.change_patterns)
+            if node.cp_type == CPType_Enum.DELETE:
+                deleted.add(utils.get_label(node.task))
+            elif node.earliest_start is not None:
+                jobs.append((node.resource, node.earliest_start, node.earliest_start + node.duration))
+        return savings, deleted, jobs, first_start, makespan
+
+    def expand(self, state:BeamState, tasks:list[etree._Element]) -> list[tuple[float, BeamState, tuple]] | None:
+        """ Children (score, parent, step) of state, step is None for a finished state, None after the deadline """
+        position = self.get_next_position(tasks, state)
+        candidates = self.get_candidates(tasks[position]) if position is not None else []
+        if not candidates:
+            return [(state.score, state, None)]
+        children = []
+        for branch_no, plan, savings, deleted in candidates:
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                return None
+            if plan is None:
+                propagated = self.propagate(tasks[position], branch_no, state)
+                if propagated is None:
+                    continue
+                savings, deleted, jobs, first_start, makespan = propagated
+                children.append((state.savings + (first_start + makespan + savings), state,
+                                 (tasks[position].attrib["id"], position, branch_no, None, savings, deleted, None, jobs, first_start + makespan)))
+                continue
+            starts, values = plan.evaluate_one(state.release_time, state.timeline)
+            first_start, makespan, _ = plan.get_interval(starts, values)
+            children.append((state.savings + (first_start + makespan + savings), state,
+                             (tasks[position].attrib["id"], position, branch_no, plan, savings, deleted, starts, values, first_start + makespan)))
+        return children
+
+    def get_child(self, score:float, state:BeamState, step:tuple, greedy:bool = False) -> BeamState:
+        if step is None:
+            return state
+        task_id, position, branch_no, plan, savings, deleted, starts, values, release_time = step
+        timeline = state.timeline.copy()
+        if plan is None:
+            # jobs of a propagated branch instead of the values of a plan
+            for resource, start, end in values:
+                timeline.add(resource, start, end)
+        else:
+            for query in plan.written:
+                # times as written to and read back from the branch
+                start = starts[query]
+                timeline.add(plan.resources[query], start, start + (values[BranchPlan.OFFSET + query] - start))
+        return BeamState(timeline, release_time, score, state.savings + savings, {**state.choices, task_id: branch_no},
+                         state.deleted | deleted, position + 1, greedy)
+
+    def search(self, tasks:list[etree._Element], release_time:float, timeline:ResourceTimeline) -> dict[str, int]:
+        """
+        Branch choices {task id: branch no} for tasks, starting at release_time on timeline.
+        Tasks without a choice (time budget exceeded) are left to allocate_task.
+        """
+        self.deadline = time.perf_counter() + self.time_budget
+        beam = [BeamState(timeline, release_time, score=release_time, greedy=True)]
+        while time.perf_counter() < self.deadline:
+            children = []
+            for state in beam:
+                state_children = self.expand(state, tasks)
+                if state_children is None:
+                    break
+                children.extend(state_children)
+            if state_children is None:
+                # deadline within the expansion, the current beam is kept
+                break
+            if all(step is None for _, _, step in children):
+                break
+            # the first child of the greedy state is the one allocate_task chooses
+            greedy = min((child for child in children if child[1].greedy), key=lambda child: child[0], default=None)
+            children.sort(key=lambda child: child[0])
+            selected = children[:self.width]
+            if greedy is not None and not any(child is greedy for child in selected):
+                selected[-1] = greedy
+            beam = [self.get_child(*child, greedy=child is greedy) for child in selected]
+        # The finish time of a complete allocation already contains its deletions
+        finished = [state for state in beam if self.get_next_position(tasks, state) is None]
+        if finished:
+            return min(finished, key=lambda state: state.release_time).choices
+        return beam[0].choices
+
+
 if __name__ == "__main__":
     ra_pst = build_rapst(process_file="testsets/testset1/process/process_short.xml", resource_file="testsets/testset1/resources/1_skill_short.xml")
     show_tree_as_graph(ra_pst)
@@ -527,4 +848,3 @@ if __name__ == "__main__":
     etree.indent(tree, space="\t", level=0)
     tree.write("test.xml")
     print(task_node.get_interval())
-    
\ No newline at end of file
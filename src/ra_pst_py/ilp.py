@@ -1,12 +1,12 @@
 import gurobipy as gp
 from gurobipy import GRB
-import json
+from src.ra_pst_py import utils
 
 
 def configuration_ilp(ra_pst_json):
     """
     Construct the ILP fromulation from a JSON object to the Gurobi model
-    ra_pst_json input format:
+    ra_pst_json (JSON file path or the loaded dict, see utils.load_schedule) input format:
     {
         "tasks": { 
             taskId: {
@@ -33,8 +33,7 @@ def configuration_ilp(ra_pst_json):
         }
     }
     """
-    with open(ra_pst_json) as f:
-        ra_pst = json.load(f)
+    ra_pst = utils.load_schedule(ra_pst_json)
 
     if "instances" in ra_pst.keys():
         ra_pst = ra_pst["instances"][0]
@@ -83,7 +82,7 @@ def configuration_ilp(ra_pst_json):
 def scheduling_ilp(ra_pst_json):
     """
     Construct the ILP fromulation from a JSON object to the Gurobi model
-    ra_pst_json input format:
+    ra_pst_json (JSON file path or the loaded dict, see utils.load_schedule) input format:
     {
         "tasks": { 
             taskId: {
@@ -110,8 +109,7 @@ def scheduling_ilp(ra_pst_json):
         }
     }
     """
-    with open(ra_pst_json) as f:
-        ra_pst = json.load(f)
+    ra_pst = utils.load_schedule(ra_pst_json)
 
     model = gp.Model('RA-PST scheduling')
 
@@ -160,7 +158,7 @@ def scheduling_ilp(ra_pst_json):
 def combined_ilp(ra_pst_json):
     """
     Construct the ILP fromulation from a JSON object to the Gurobi model
-    ra_pst_json input format:
+    ra_pst_json (JSON file path or the loaded dict, see utils.load_schedule) input format:
     {
         "tasks": { 
             taskId: {
@@ -187,8 +185,7 @@ def combined_ilp(ra_pst_json):
         }
     }
     """
-    with open(ra_pst_json) as f:
-        ra_pst = json.load(f)
+    ra_pst = utils.load_schedule(ra_pst_json)
 
     model = gp.Model('RA-PST optimization')
 
@@ -1,8 +1,10 @@
 from src.ra_pst_py.change_operations import ChangeOperation
 from src.ra_pst_py.heuristic import TaskAllocator
 from src.ra_pst_py.core import RA_PST, Branch
+from src.ra_pst_py.timeline import ResourceTimeline
 
 from . import utils 
+from . import xpaths
 
 import numpy as np
 from pathlib import Path
@@ -32,6 +34,15 @@ class Instance():
         self.release_time:int = release_time
         self.add_release_time(release_time=release_time)
 
+    @classmethod
+    def from_template(cls, ra_pst:RA_PST, branches_to_apply:dict = None, schedule=None, id=None, release_time:int = None) -> "Instance":
+        """
+        Creates an instance on a copy-on-write copy of ra_pst (see RA_PST.get_instance_copy)
+        instead of a deepcopy. ra_pst itself is not modified and can be reused for further instances.
+        """
+        branches_to_apply = {} if branches_to_apply is None else branches_to_apply
+        return cls(ra_pst.get_instance_copy(), branches_to_apply, schedule=schedule, id=id, release_time=release_time)
+
     def add_release_time(self, release_time:float):
         """ """
         task1 = self.ra_pst.get_tasklist()[0]
@@ -43,16 +54,23 @@ class Instance():
         """Returns the RA-PST of the instance as dict for an ILP or CP"""
         return self.ra_pst.get_ilp_rep(instance_id=self.id)
 
+    def get_task_index(self):
+        """ Returns the id/label index of the tasks of the instance process """
+        return self.change_op.get_task_index(self.ra_pst.process)
+
     def get_all_valid_branches_list(self) -> list:
         branches = []
         for key, values in self.ra_pst.branches.items():
             branches.extend([branch for branch in values if branch.check_validity()])
         return branches
 
-    def allocate_next_task(self, schedule_filepath:os.PathLike) -> Branch:
-        """ Allocate next task in ra_pst based on earliest finish time heuristic"""
+    def allocate_next_task(self, schedule_filepath:os.PathLike, timeline:ResourceTimeline = None, branch_no:int = None) -> Branch:
+        """
+        Allocate next task in ra_pst based on earliest finish time heuristic
+        branch_no: allocate this branch of the task instead (e.g. chosen by a BeamSearch)
+        """
 
-        best_branch, times = self.allocator.allocate_task(self.current_task, schedule_filepath=schedule_filepath)
+        best_branch, times = self.allocator.allocate_task(self.current_task, schedule_filepath=schedule_filepath, timeline=timeline, branch_no=branch_no)
         times = times[0:2]
         task_id = self.current_task.attrib["id"]
         branch_no = self.ra_pst.branches[task_id].index(best_branch)
@@ -65,13 +83,14 @@ class Instance():
             cp_type = task.attrib["type"] if "type" in list(task.attrib.keys()) else None
             if cp_type == "delete":
                 continue
-            if task.xpath("cpee1:children/descendant::cpee1:changepattern", namespaces=self.ns):
-                if task.xpath("cpee1:children/descendant::cpee1:changepattern", namespaces=self.ns)[0].attrib["type"] == "replace":
+            change_patterns = xpaths.TASK_CHANGEPATTERN_DESCENDANTS(task)
+            if change_patterns:
+                if change_patterns[0].attrib["type"] == "replace":
                     continue
                 
-            resource = task.xpath("cpee1:children/cpee1:resource", namespaces=self.ns)[0].attrib["id"]
-            start_time = task.xpath("cpee1:expected_start", namespaces=self.ns)[0].text
-            end_time = task.xpath("cpee1:expected_end", namespaces=self.ns)[0].text
+            resource = xpaths.TASK_RESOURCE(task)[0].attrib["id"]
+            start_time = xpaths.EXPECTED_START(task)[0].text
+            end_time = xpaths.EXPECTED_END(task)[0].text
             duration = float(end_time) - float(start_time)
             
             #self.allocator.add_task((self, task, start_time), resource, duration, branch_no, schedule_filepath)
@@ -86,20 +105,30 @@ class Instance():
         if self.current_task == "end":
             self.optimal_process = self.ra_pst.process
             return best_branch
-        if self.current_task.xpath("cpee1:release_time", namespaces=self.ns):
-            self.current_task.xpath("cpee1:release_time", namespaces=self.ns)[0].text = str(sum(times))
+        release_time = xpaths.RELEASE_TIME(self.current_task)
+        if release_time:
+            release_time[0].text = str(sum(times))
         else:
             child = etree.SubElement(self.current_task, f"{{{self.ns['cpee1']}}}release_time")
             child.text = str(sum(times))
         return best_branch
     
+    def get_remaining_tasks(self) -> list:
+        """ The current and all following tasks of the instance that are not deleted from the process """
+        if self.current_task == "end":
+            return []
+        task_index = self.get_task_index()
+        tasklist = self.ra_pst.get_tasklist()
+        position = [task.attrib["id"] for task in tasklist].index(self.current_task.attrib["id"])
+        return [task for task in tasklist[position:] if task_index.get_by_id(task.attrib["id"])]
+
     def apply_single_branch(self, task, branch):
         if self.optimal_process is not None:
             raise ValueError("All tasks have already been allocated")
         task_id = task.attrib["id"]
-        current_time = task.xpath("cpee1:release_time", namespaces=self.ns)
+        current_time = xpaths.RELEASE_TIME(task)
         delete=False
-        if branch.node.xpath("//*[@type='delete']"):
+        if xpaths.DELETE_TYPE(branch.node):
             #self.delayed_deletes.append((branch, task, current_time))
             delete = False
         self.ra_pst.process = branch.apply_to_process(
@@ -159,7 +188,7 @@ class Instance():
                 self.applied_branches[task_id] = branch_no
                 
                 delete=False
-                if branch.node.xpath("//*[@type='delete']"):
+                if xpaths.DELETE_TYPE(branch.node):
                     self.delayed_deletes.append((branch, task, current_time))
                     delete = True
                 #TODO add branch invalidities on branch building!
@@ -173,7 +202,7 @@ class Instance():
             else:
                 for branch, task, current_time in self.delayed_deletes:
                     # TODO fix deleted task time propagation
-                    if self.ra_pst.process.xpath(f"//*[@id='{task.attrib['id']}'][not(ancestor::cpee1:children) and not(ancestor::cpee1:allocation) and not(ancestor::RA_RPST)]", namespaces=self.ns):
+                    if self.get_task_index().get_by_id(task.attrib['id']):
                         self.ra_pst.process = branch.apply_to_process(
                             self.change_op.ra_pst, solution=self, earliest_possible_start=current_time, change_op=self.change_op)  # apply delays
                         self.change_op.ra_pst = self.ra_pst.process
@@ -188,7 +217,7 @@ class Instance():
             "//*[self::cpee1:call or self::cpee1:manipulate][not(ancestor::cpee1:changepattern) and not(ancestor::cpee1:allocation)and not(ancestor::cpee1:children)]", namespaces=self.ns)
 
         for task in tasks:
-            if not task.xpath("cpee1:allocation/*", namespaces=self.ns):
+            if not xpaths.ALLOCATION_CHILDREN(task):
                 self.invalid = True
                 break
 
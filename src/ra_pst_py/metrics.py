@@ -0,0 +1,128 @@
+from . import utils
+from .branch_table import BranchTable
+
+import numpy as np
+import os
+
+
+class RA_PSTMetrics:
+    """
+    Problem metrics of an RA_PST computed in one pass over NumPy arrays:
+        flex_factor:        mean valid branches per task * (1 - unevenness)
+        entropy:            mean entropy of the inverted branch costs per task
+        resource_tightness: cost uniformity of the resources * usage distribution
+        avg_cost:           mean of all costs in the allocation tree
+    Branch costs and validity come from the BranchTable, the resource file is read once
+    into a resource x task label incidence matrix.
+    Use RA_PST.get_metrics() for the memoized metrics of one RA_PST.
+    Computing the metrics does not compile the BranchTable of the RA_PST (see RA_PST.compile_branch_table).
+    """
+
+    def __init__(self, flex_factor: float, entropy: float, resource_tightness: float, avg_cost: float):
+        self.flex_factor = flex_factor
+        self.entropy = entropy
+        self.resource_tightness = resource_tightness
+        self.avg_cost = avg_cost
+
+    @classmethod
+    def from_ra_pst(cls, ra_pst) -> "RA_PSTMetrics":
+        table = ra_pst.branch_table if ra_pst.branch_table is not None else BranchTable.from_ra_pst(ra_pst)
+        return cls(
+            flex_factor=cls.compute_flex_factor(table),
+            entropy=cls.compute_entropy(table),
+            resource_tightness=cls.compute_resource_tightness(ra_pst, table),
+            avg_cost=cls.compute_avg_cost(ra_pst),
+        )
+
+    @classmethod
+    def batch(cls, process_file: os.PathLike, resource_files: list, cache_dir: os.PathLike = None) -> dict:
+        """
+        Metrics of the RA_PSTs of one process with each of resource_files.
+        Returns {resource_file: RA_PSTMetrics}, cache_dir is passed to build_rapst.
+        """
+        from .builder import build_rapst
+        metrics = {}
+        for resource_file in resource_files:
+            ra_pst = build_rapst(process_file, resource_file, cache_dir=cache_dir)
+            metrics[resource_file] = ra_pst.get_metrics()
+        return metrics
+
+    @staticmethod
+    def compute_flex_factor(table) -> float:
+        """
+        Flex_factor = (sum_branches/no_of_tasks) * (1-unevenness)
+        unevenness = standard_deviaton branches per task / mean of branches per task
+        """
+        mean_branches = int(table.branch_valid.sum()) / table.num_tasks
+        std_branches = np.std(table.get_branch_counts())
+        unevenness = std_branches / mean_branches if mean_branches > 0 else 0
+        return float(mean_branches * (1 - unevenness))
+
+    @staticmethod
+    def compute_entropy(table) -> float:
+        """ Entropy per task over p = (1/cost) / sum(1/cost) of its valid branches, averaged over tasks """
+        valid_tasks = table.branch_task[table.branch_valid]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inverted_costs = 1 / table.branch_cost[table.branch_valid]
+            totals = np.bincount(valid_tasks, weights=inverted_costs, minlength=table.num_tasks)
+            probabilities = inverted_costs / totals[valid_tasks]
+            entropy_per_task = np.bincount(valid_tasks, weights=-probabilities * np.log(probabilities),
+                                           minlength=table.num_tasks)
+        return float(np.mean(entropy_per_task))
+
+    @staticmethod
+    def compute_resource_tightness(ra_pst, table) -> float:
+        """
+        cost_uniform = 1 - std/mean of the mean cost per resource
+        usage_distribution = normalized entropy of the share of task labels each resource offers
+        """
+        resource_list = table.resourcelist
+        resource_ids = list(dict.fromkeys(resource_list))
+
+        # Task labels of all branches (valid and invalid)
+        available_labels = {utils.get_label(task) for branches in ra_pst.branches.values()
+                            for branch in branches for task in branch.get_tasklist()}
+
+        # One pass over the resource file: summed costs and offered labels per resource id
+        position = {resource_id: i for i, resource_id in enumerate(resource_ids)}
+        cost_sum = np.zeros(len(resource_ids))
+        cost_count = np.zeros(len(resource_ids))
+        offered = []  # (resource position, label) pairs
+        labels = {}
+        for resource in ra_pst.resource_data.iterchildren("resource"):
+            i = position.get(resource.attrib.get("id"))
+            if i is None:
+                continue
+            for profile in resource.iterchildren("resprofile"):
+                offered.append((i, labels.setdefault(profile.attrib["task"], len(labels))))
+                for cost in profile.xpath("measures/cost/text()"):
+                    cost_sum[i] += float(cost)
+                    cost_count[i] += 1
+        incidence = np.zeros((len(resource_ids), len(labels)), dtype=bool)
+        if offered:
+            rows, columns = np.array(offered).T
+            incidence[rows, columns] = True
+
+        mean_costs = cost_sum / cost_count
+        mean_of_means = np.mean(mean_costs)
+        cost_uniform = 1 - (np.std(mean_costs) / mean_of_means) if mean_of_means > 0 else 0
+
+        probabilities = incidence.sum(axis=1) / len(available_labels)
+        probabilities = probabilities[probabilities > 0]
+        entropy = -np.sum(probabilities * np.log(probabilities))
+        max_entropy = np.log(len(resource_list))
+        usage_distribution = entropy / max_entropy if max_entropy > 0 else 0
+        return float(cost_uniform * usage_distribution)
+
+    @staticmethod
+    def compute_avg_cost(ra_pst) -> float:
+        costs = np.array(ra_pst.get_allocation_tree().xpath("//cpee1:cost/text()", namespaces=ra_pst.ns), dtype=np.float64)
+        return float(costs.mean()) if len(costs) > 0 else 0
+
+    def as_dict(self) -> dict:
+        return {
+            "flex_factor": self.flex_factor,
+            "enthropy": self.entropy,
+            "resource_tightness": self.resource_tightness,
+            "avg_cost": self.avg_cost,
+        }
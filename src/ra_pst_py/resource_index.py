@@ -0,0 +1,52 @@
+from lxml import etree
+
+import copy
+from collections import defaultdict
+
+
+class ResourceIndex:
+    """
+    Index over a resource file, built once per file.
+    Maps the (lower case) task label of a resprofile to the resources offering it,
+    so an allocation only copies the resources and profiles that match a task
+    instead of the whole resource file.
+    """
+
+    def __init__(self, resource_data: etree._Element):
+        self.resource_data = resource_data
+        self.resources: list[etree._Element] = list(resource_data.xpath("*"))
+        # {task label: [(resource position, [profiles for the label])]}
+        self.profiles: dict[str, list[tuple[int, list[etree._Element]]]] = defaultdict(list)
+        for position, resource in enumerate(self.resources):
+            by_label = defaultdict(list)
+            for profile in resource.xpath("resprofile"):
+                label = profile.attrib["task"].lower()
+                by_label[label].append(profile)
+            for label, profiles in by_label.items():
+                self.profiles[label].append((position, profiles))
+
+    def get_resources(self, label: str, roles: list, children_tag: str) -> list[etree._Element]:
+        """
+        Returns copies of all resources with profiles for the task label and one of roles
+        (all roles if roles is empty). Only matching profiles are copied, each one gets an
+        empty children_tag element for the next allocation level.
+        """
+        resources = []
+        for position, profiles in self.profiles.get(label.lower(), []):
+            matching = [profile for profile in profiles if not roles or profile.attrib["role"] in roles]
+            if not matching:
+                continue
+            resource = self.resources[position]
+            new_resource = etree.Element(resource.tag, resource.attrib, nsmap=resource.nsmap)
+            new_resource.text, new_resource.tail = resource.text, resource.tail
+            for child in resource:
+                if child.tag == "resprofile":
+                    if not any(child is profile for profile in matching):
+                        continue
+                    child = copy.deepcopy(child)
+                    etree.SubElement(child, children_tag)
+                else:
+                    child = copy.deepcopy(child)
+                new_resource.append(child)
+            resources.append(new_resource)
+        return resources
@@ -1,17 +1,28 @@
 from src.ra_pst_py.instance import Instance
 from src.ra_pst_py.core import Branch, RA_PST
-from src.ra_pst_py.cp_docplex import cp_solver, cp_solver_scheduling_only
+from src.ra_pst_py.cp_docplex import cp_solver, cp_solver_scheduling_only, CPSession
 from src.ra_pst_py.cp_docplex_decomposed import cp_solver_decomposed_strengthened_cuts, cp_subproblem
 from src.ra_pst_py.ilp import configuration_ilp
+from src.ra_pst_py.timeline import ResourceTimeline
+from src.ra_pst_py.heuristic import BeamSearch
+from src.ra_pst_py.cache import dump_ra_pst, load_ra_pst
+from src.ra_pst_py.checkpoint import CheckpointJournal
+from src.ra_pst_py import xpaths, utils
 
 from enum import Enum, StrEnum
 from collections import defaultdict
 import numpy as np
 from lxml import etree
 import json
+import copy
 import os
 import time
+import signal
+import heapq
 import itertools
+import random
+import tempfile
+import multiprocessing as mp
 
 
 class AllocationTypeEnum(StrEnum):
@@ -24,6 +35,13 @@ class AllocationTypeEnum(StrEnum):
     SINGLE_INSTANCE_CP_REPLAN = "single_instance_replan"
     SINGLE_INSTANCE_ILP = "single_instance_ilp"
     ALL_INSTANCE_ILP = "all_instance_ilp"
+    BEAM_HEURISTIC = "beam_heuristic"
+    MULTISTART_HEURISTIC = "multistart_heuristic"
+
+
+# Online allocation types that simulate_stream supports
+STREAM_ALLOCATION_TYPES = (AllocationTypeEnum.HEURISTIC, AllocationTypeEnum.SINGLE_INSTANCE_HEURISTIC, AllocationTypeEnum.BEAM_HEURISTIC,
+                           AllocationTypeEnum.SINGLE_INSTANCE_CP, AllocationTypeEnum.SINGLE_INSTANCE_CP_DECOMPOSED)
 
 
 class QueueObject():
@@ -34,22 +52,144 @@ class QueueObject():
         self.task = task
         self.release_time = release_time
 
+class EventQueue():
+    """
+    Priority queue (heapq) of QueueObjects ordered by release time.
+    Equal release times keep their insertion order, as the previous append + stable sort did:
+    instances added at the start come out in schedule_idx order, re-inserted
+    queue objects go behind queued objects with the same release time.
+    The release time is read when an object is pushed.
+    rng: equal release times come out in random order instead (perturbed order of the multistart heuristic)
+    """
+    def __init__(self, queue_objects:list[QueueObject] = (), rng:random.Random = None):
+        self._heap: list[tuple[float, int, QueueObject]] = []
+        self._counter = itertools.count()
+        self.rng = rng
+        self.push_many(queue_objects)
+
+    def _tie_breaker(self) -> float:
+        return self.rng.random() if self.rng is not None else next(self._counter)
+
+    def push(self, queue_object:QueueObject):
+        heapq.heappush(self._heap, (queue_object.release_time, self._tie_breaker(), queue_object))
+
+    def push_many(self, queue_objects:list[QueueObject]):
+        """ Bulk insert in O(n) """
+        for queue_object in queue_objects:
+            self._heap.append((queue_object.release_time, self._tie_breaker(), queue_object))
+        heapq.heapify(self._heap)
+
+    def pop(self) -> QueueObject:
+        """ Removes and returns the queue object with the earliest release time """
+        return heapq.heappop(self._heap)[-1]
+
+    def peek(self) -> QueueObject:
+        """ Returns the queue object with the earliest release time without removing it """
+        return self._heap[0][-1]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __iter__(self):
+        """ Iterates in queue order without removing """
+        return (entry[-1] for entry in sorted(self._heap, key=lambda entry: entry[:2]))
+
+
+class PersistencePolicy():
+    """
+    When the heuristics and the online CP write their live schedule to the schedule file.
+    The schedule is always written once at the end of a run and when the checkpoint journal is compacted, additionally
+        - every_n_tasks: after every n allocated tasks (solves of the online CP)
+        - on_signal: when the signal (e.g. signal.SIGUSR1) is received, after the current task
+    """
+    def __init__(self, every_n_tasks:int = None, on_signal:int = None):
+        if every_n_tasks is not None and every_n_tasks < 1:
+            raise ValueError("every_n_tasks must be at least 1")
+        self.every_n_tasks = every_n_tasks
+        self.on_signal = on_signal
+        self.tasks_since_save = 0
+        self.save_requested = False
+        self._previous_handler = None
+        self._installed = False
+
+    def install(self):
+        if self.on_signal is not None and not self._installed:
+            self._previous_handler = signal.signal(self.on_signal, self.request_save)
+            self._installed = True
+
+    def uninstall(self):
+        """ Restores the previous handler, SIG_DFL if it was not installed from Python (None) """
+        if self._installed:
+            signal.signal(self.on_signal, self._previous_handler if self._previous_handler is not None else signal.SIG_DFL)
+            self._previous_handler = None
+            self._installed = False
+
+    def request_save(self, *args):
+        self.save_requested = True
+
+    def task_done(self) -> bool:
+        """ Counts an allocated task, returns True if the schedule should be written now """
+        self.tasks_since_save += 1
+        if self.save_requested or (self.every_n_tasks is not None and self.tasks_since_save >= self.every_n_tasks):
+            self.saved()
+            return True
+        return False
+
+    def saved(self):
+        self.tasks_since_save = 0
+        self.save_requested = False
+
+
 class Simulator():
-    def __init__(self, schedule_filepath:str, sigma:int, time_limit:int) -> None:
+    def __init__(self, schedule_filepath:str, sigma:int, time_limit:int, persistence:PersistencePolicy = None,
+                 checkpoint:CheckpointJournal = None, batch_window:float = None, incremental_cp:bool = False, beam_width:int = 4, beam_time_budget:float = 0.05,
+                 multistart_runs:int = 4, multistart_seed:int = 0, multistart_workers:int = None, tie_tolerance:float = 0.1,
+                 break_symmetries:bool = False, rolling_horizon:bool = True, branch_formulation:str = "grouped") -> None:
         self.schedule_filepath = schedule_filepath
-        # List of [{instance:RA_PST_instance, allocation_type:str(allocation_type)}]
-        self.task_queue: list[QueueObject] = []  # List of QueueObject
-        self.expected_instances_queue: list[QueueObject] = [] # List of Queu objects only for online allocation.
+        self.task_queue: EventQueue = EventQueue()
+        self.expected_instances_queue: EventQueue = EventQueue() # Queue objects only for online allocation.
         self.allocation_type: AllocationTypeEnum = None
         self.ns = None
         self.is_warmstart:bool = None
         self.sigma = sigma
         self.time_limit:int = time_limit
+        self.timeline: ResourceTimeline = None   # busy intervals of the schedule, maintained by the heuristics
+        self.schedule: dict = None  # live schedule of the heuristics and the online CP, written according to self.persistence
+        self.dirty_instances: set[int] = set()  # schedule indices changed since the last commit_step
+        self.persistence: PersistencePolicy = persistence if persistence is not None else PersistencePolicy()
+        self.checkpoint: CheckpointJournal = checkpoint   # journal of the committed arrivals, see resume
+        self.resumed: bool = False
+        self.batch_window: float = batch_window   # online CP: arrivals within batch_window after the first one are solved together (None: one solve per arrival)
+        self.incremental_cp: bool = incremental_cp  # online CP: one CPSession keeps the model across arrivals
+        self.cp_session: CPSession = None
+        self.beam_width: int = beam_width   # partial schedules kept per task step by the beam heuristic
+        self.beam_time_budget: float = beam_time_budget   # seconds of beam search per instance
+        self.multistart_runs: int = multistart_runs     # runs of the multistart heuristic, run 0 is deterministic
+        self.multistart_seed: int = multistart_seed     # the seeds of the runs are derived from it
+        self.multistart_workers: int = multistart_workers  # worker processes (None: cpu count)
+        self.tie_tolerance: float = tie_tolerance       # near-equal branches: within tie_tolerance * duration of the best one
+        self.break_symmetries: bool = break_symmetries  # CP: order identical instances (e.g. same release time)
+        self.rolling_horizon: bool = rolling_horizon    # online CP: jobs behind the arrivals leave the model (see get_frozen_jobs)
+        self.branch_formulation: str = branch_formulation  # CP: constraints of the branch selection (see add_branch_constraints)
 
     def add_instance(self, instance: Instance, allocation_type: AllocationTypeEnum, expected_instance:bool=False):  # TODO
         """ 
         Adds a new instance that needs allocation
         """
+        queue = self.expected_instances_queue if expected_instance else self.task_queue
+        queue.push(self.get_queue_object(instance, allocation_type, expected_instance))
+
+    def add_instances(self, instances: list[Instance], allocation_type: AllocationTypeEnum, expected_instance:bool=False):
+        """ 
+        Adds several instances at once (bulk insert into the queue)
+        """
+        queue = self.expected_instances_queue if expected_instance else self.task_queue
+        queue_objects = []
+        for instance in instances:
+            queue_objects.append(self.get_queue_object(instance, allocation_type, expected_instance, offset=len(queue_objects)))
+        queue.push_many(queue_objects)
+
+    def get_queue_object(self, instance: Instance, allocation_type: AllocationTypeEnum, expected_instance:bool=False, offset:int=0) -> QueueObject:
         if self.allocation_type is None:
             if isinstance(allocation_type, AllocationTypeEnum):
                 self.allocation_type = allocation_type
@@ -62,25 +202,20 @@ class Simulator():
             schedule_idx = instance.id
         else:
             if expected_instance:
-                schedule_idx = len(self.expected_instances_queue)
+                schedule_idx = len(self.expected_instances_queue) + offset
             else:    
-                schedule_idx = len(self.task_queue)
-        if expected_instance is False:
-            self.update_task_queue(self.task_queue, QueueObject(
-                instance, schedule_idx, allocation_type, instance.current_task, instance.release_time))
-        else:
-            self.update_task_queue(self.expected_instances_queue, QueueObject(
-                instance, schedule_idx, allocation_type, instance.current_task, instance.release_time))
+                schedule_idx = len(self.task_queue) + offset
+        return QueueObject(instance, schedule_idx, allocation_type, instance.current_task, instance.release_time)
 
 
     def set_namespace(self):
         """ Sets the namespaces if it is not set yet """
-        if not self.ns:
-            self.ns = self.task_queue[0].instance.ns
+        if not self.ns and self.task_queue:
+            self.ns = self.task_queue.peek().instance.ns
     
     def set_schedule_file(self):
         # Check/create schedule file:
-        if not self.is_warmstart:
+        if not self.is_warmstart and not self.resumed:
             os.makedirs(os.path.dirname(self.schedule_filepath), exist_ok=True)
             with open(self.schedule_filepath, "w"): pass
 
@@ -91,32 +226,176 @@ class Simulator():
         # Prelims
         self.set_namespace()
         self.set_schedule_file()
+        if self.checkpoint is not None and not self.resumed:
+            self.checkpoint.reset()
+
+        try:
+            if self.allocation_type == AllocationTypeEnum.HEURISTIC:
+                #Start taskwise allocation with process tree heuristic
+                self.single_task_processing()
+            elif self.allocation_type == AllocationTypeEnum.SINGLE_INSTANCE_CP:
+                # Create ra_psts for next instance in task_queue
+                self.single_instance_processing()
+            elif self.allocation_type == AllocationTypeEnum.SINGLE_INSTANCE_CP_DECOMPOSED:
+                # Create ra_psts for next instance in task_queue
+                self.single_instance_processing(decomposed=True)
+            elif self.allocation_type == AllocationTypeEnum.ALL_INSTANCE_CP:
+                self.all_instance_processing()
+            elif self.allocation_type == AllocationTypeEnum.ALL_INSTANCE_CP_DECOMPOSED:
+                self.all_instance_processing(warmstart=False, decomposed=True)
+            elif self.allocation_type == AllocationTypeEnum.SINGLE_INSTANCE_CP_REPLAN:
+                self.single_instance_replan()
+            elif self.allocation_type == AllocationTypeEnum.SINGLE_INSTANCE_HEURISTIC:
+                self.single_instance_heuristic()
+            elif self.allocation_type == AllocationTypeEnum.BEAM_HEURISTIC:
+                self.single_instance_heuristic(beam=True)
+            elif self.allocation_type == AllocationTypeEnum.MULTISTART_HEURISTIC:
+                self.multistart_heuristic()
+            elif self.allocation_type == AllocationTypeEnum.SINGLE_INSTANCE_ILP:
+                self.single_instance_ilp(different_instances=different_instances)
+            elif self.allocation_type == AllocationTypeEnum.ALL_INSTANCE_ILP:
+                self.all_instance_ilp(different_instances=different_instances)
+            else:
+                raise NotImplementedError(
+                    f"Allocation_type {self.allocation_type} has not been implemented yet")
+        finally:
+            # an exception must not leave the signal handler on this run
+            self.persistence.uninstall()
+
+    def simulate_stream(self, arrivals, allocation_type:AllocationTypeEnum):
+        """
+        Discrete-event online simulation of a stream of arrivals: an iterable of (arrival time, Instance)
+        in ascending arrival time, consumed lazily instead of adding all instances up front.
+        The simulated clock jumps from event to event. An arrival is allocated at once by the
+        single instance modes, the task-wise heuristic allocates the first task on arrival and each
+        further task on the completion of the previous one (same order as simulate()).
+        Completed instances are only kept as ilp_rep in the schedule and busy intervals that end
+        before the clock are released from the timeline. Once the jobs of a completed instance end
+        (plus sigma) before the clock, its ilp_rep is cut down to the selected jobs (utils.compact_ilp_rep),
+        so the schedule file of a stream holds the compacted instances.
+        """
+        self.allocation_type = AllocationTypeEnum(allocation_type)
+        if self.allocation_type not in STREAM_ALLOCATION_TYPES:
+            raise NotImplementedError(f"Allocation_type {self.allocation_type} can not be simulated on a stream")
+        arrivals = self.get_arrival_queue_objects(arrivals)
+        self.set_schedule_file()
+        if self.checkpoint is not None and not self.resumed:
+            self.checkpoint.reset()
+        live_schedule = self.allocation_type not in (AllocationTypeEnum.SINGLE_INSTANCE_CP, AllocationTypeEnum.SINGLE_INSTANCE_CP_DECOMPOSED)
+
+        try:
+            start = time.time()
+            if live_schedule:
+                self.start_live_schedule()
+            else:
+                self.persistence.install()
+            completions = EventQueue()  # task completions of the task-wise heuristic
+            finished = []   # heap (end, schedule idx) of the completed instances that are not compacted yet
+            arrival = next(arrivals, None)
+            while arrival is not None or completions:
+                if arrival is not None and (not completions or arrival.release_time <= completions.peek().release_time):
+                    queue_object, arrival = arrival, next(arrivals, None)
+                    self.ns = self.ns or queue_object.instance.ns
+                    if self.timeline is not None:
+                        self.timeline.release(queue_object.release_time)
+                    self.compact_finished_instances(finished, queue_object.release_time)
+                else:
+                    queue_object = completions.pop()
+
+                if self.allocation_type == AllocationTypeEnum.HEURISTIC:
+                    self.allocate_task(queue_object)
+                    if queue_object.instance.current_task != "end":
+                        self.update_task_queue(completions, queue_object)
+                    else:
+                        self.push_finished_instance(finished, queue_object)
+                elif not live_schedule:
+                    batch = [queue_object]
+                    while self.batch_window is not None and arrival is not None and arrival.release_time <= queue_object.release_time + self.batch_window:
+                        batch.append(arrival)
+                        arrival = next(arrivals, None)
+                    self.allocate_instances_cp(batch, decomposed=self.allocation_type == AllocationTypeEnum.SINGLE_INSTANCE_CP_DECOMPOSED)
+                    for batch_object in batch:
+                        self.push_finished_instance(finished, batch_object)
+                else:
+                    self.allocate_instance_heuristic(queue_object, beam=self.allocation_type == AllocationTypeEnum.BEAM_HEURISTIC)
+                    self.push_finished_instance(finished, queue_object)
+            self.compact_finished_instances(finished, np.inf)
+            if live_schedule:
+                self.finish_live_schedule(float(time.time() - start))
+            else:
+                self.finish_cp_schedule()
+        finally:
+            self.persistence.uninstall()
+
+    def get_instance_end(self, schedule_idx:int) -> float:
+        """ Latest end of the selected jobs of a scheduled instance """
+        jobs = self.schedule["instances"][schedule_idx]["jobs"].values()
+        return max((job["start"] + job["cost"] for job in jobs if job["selected"] and job["start"] is not None), default=0)
+
+    def push_finished_instance(self, finished:list, queue_object:QueueObject):
+        heapq.heappush(finished, (self.get_instance_end(queue_object.schedule_idx), queue_object.schedule_idx))
+
+    def compact_finished_instances(self, finished:list, clock:float):
+        """
+        Compacts the completed instances of the heap finished whose jobs end, plus sigma, before clock:
+        no later solve or allocation can move them or needs their unselected alternatives.
+        """
+        while finished and finished[0][0] + self.sigma <= clock:
+            _, schedule_idx = heapq.heappop(finished)
+            end = self.get_instance_end(schedule_idx)
+            if end + self.sigma > clock:
+                # moved later by a rescheduling (sigma > 0)
+                heapq.heappush(finished, (end, schedule_idx))
+                continue
+            utils.compact_ilp_rep(self.schedule["instances"][schedule_idx])
+            self.dirty_instances.add(schedule_idx)
+
+    def get_arrival_queue_objects(self, arrivals):
+        """ Queue objects of the (arrival time, Instance) stream, numbered in arrival order """
+        previous_arrival = -np.inf
+        for schedule_idx, (arrival_time, instance) in enumerate(arrivals):
+            if arrival_time < previous_arrival:
+                raise ValueError(f"Arrival time {arrival_time} of instance {instance.id} is before the previous arrival {previous_arrival}")
+            if instance.release_time != arrival_time:
+                raise ValueError(f"Release time {instance.release_time} of instance {instance.id} does not match its arrival time {arrival_time}")
+            previous_arrival = arrival_time
+            yield QueueObject(instance, schedule_idx, self.allocation_type, instance.current_task, arrival_time)
+
+    def resume(self, path:str = None, different_instances:bool=False):
+        """
+        Continues an interrupted run from its checkpoint (self.checkpoint, or the one at path).
+        The instances have to be added as for the interrupted run: the ones of committed arrivals
+        are dropped from the queue, the schedule file is restored and simulate() continues with the rest.
+        Without a checkpoint on disk the run starts from scratch.
+        """
+        if path is not None:
+            self.checkpoint = CheckpointJournal(path)
+        if self.checkpoint is None:
+            raise ValueError("No checkpoint to resume from")
+        schedule = self.checkpoint.load()
+        if schedule is None:
+            return self.simulate(different_instances=different_instances)
+        self.task_queue = EventQueue([queue_object for queue_object in self.task_queue
+                                      if queue_object.schedule_idx not in self.checkpoint.arrivals])
+        os.makedirs(os.path.dirname(self.schedule_filepath), exist_ok=True)
+        self.save_schedule(schedule)
+        self.resumed = True
+        if not self.task_queue and "solution" in schedule:
+            return
+        self.simulate(different_instances=different_instances)
+
+    def commit_step(self, schedule:dict, arrivals, dirty=()):
+        """
+        Journals the schedule after the arrivals (schedule indices) are allocated for good.
+        dirty: further changed instances besides the ones written through add_ilp_rep_to_schedule.
+        The schedule file is written when the journal is compacted.
+        """
+        dirty = self.dirty_instances | set(dirty)
+        self.dirty_instances = set()
+        if self.checkpoint is not None and self.checkpoint.commit(schedule, arrivals, dirty):
+            self.save_schedule(schedule)
+            self.persistence.saved()
 
-        if self.allocation_type == AllocationTypeEnum.HEURISTIC:
-            #Start taskwise allocation with process tree heuristic
-            self.single_task_processing()
-        elif self.allocation_type == AllocationTypeEnum.SINGLE_INSTANCE_CP:
-            # Create ra_psts for next instance in task_queue
-            self.single_instance_processing()
-        elif self.allocation_type == AllocationTypeEnum.SINGLE_INSTANCE_CP_DECOMPOSED:
-            # Create ra_psts for next instance in task_queue
-            self.single_instance_processing(decomposed=True)
-        elif self.allocation_type == AllocationTypeEnum.ALL_INSTANCE_CP:
-            self.all_instance_processing()
-        elif self.allocation_type == AllocationTypeEnum.ALL_INSTANCE_CP_DECOMPOSED:
-            self.all_instance_processing(warmstart=False, decomposed=True)
-        elif self.allocation_type == AllocationTypeEnum.SINGLE_INSTANCE_CP_REPLAN:
-            self.single_instance_replan()
-        elif self.allocation_type == AllocationTypeEnum.SINGLE_INSTANCE_HEURISTIC:
-            self.single_instance_heuristic()
-        elif self.allocation_type == AllocationTypeEnum.SINGLE_INSTANCE_ILP:
-            self.single_instance_ilp(different_instances=different_instances)
-        elif self.allocation_type == AllocationTypeEnum.ALL_INSTANCE_ILP:
-            self.all_instance_ilp(different_instances=different_instances)
-        else:
-            raise NotImplementedError(
-                f"Allocation_type {self.allocation_type} has not been implemented yet")
-        
     def get_current_instance_ilp_rep(self, schedule:dict, queue_object:QueueObject, expected_instance:bool=False):
         if len(schedule["instances"]) > queue_object.schedule_idx and expected_instance is False:
             return schedule["instances"][queue_object.schedule_idx]
@@ -124,6 +403,8 @@ class Simulator():
             return queue_object.instance.get_ilp_rep()
 
     def add_ilp_rep_to_schedule(self, ilp_rep:dict, schedule:dict, queue_object:QueueObject, expected_instance:bool=False):
+        if not expected_instance:
+            self.dirty_instances.add(queue_object.schedule_idx)
         if len(schedule["instances"]) > queue_object.schedule_idx and expected_instance is False:
             schedule["instances"][queue_object.schedule_idx] = ilp_rep
         else:
@@ -155,15 +436,15 @@ class Simulator():
             #    if resource != ilp_rep["jobs"][jobId]["resource"]:
             #        raise ValueError(f"Resource <{resource}> != <{ilp_rep["jobs"][jobId]["resource"]}>")
             task = branch_ra_pst_tasks[i]
-            start_time = float(task.xpath(
-                "cpee1:expected_start", namespaces=self.ns)[0].text)
-            end_time = float(task.xpath("cpee1:expected_end",
-                             namespaces=self.ns)[0].text)
+            start_time = float(xpaths.EXPECTED_START(task)[0].text)
+            end_time = float(xpaths.EXPECTED_END(task)[0].text)
             duration = float(end_time) - float(start_time)
 
             ilp_rep["jobs"][jobId]["start"] = start_time
             ilp_rep["jobs"][jobId]["cost"] = duration
             ilp_rep["jobs"][jobId]["selected"] = True
+            if self.timeline is not None:
+                self.timeline.add(ilp_rep["jobs"][jobId]["resource"], start_time, start_time + duration)
 
         return ilp_rep
     
@@ -183,55 +464,141 @@ class Simulator():
         Calls the heuristic allocation one task at a time. The queue object holds the current task. 
         """
         start = time.time()
+        self.start_live_schedule()
         while self.task_queue:
-            queue_object = self.task_queue.pop(0)
-            best_branch = queue_object.instance.allocate_next_task(self.schedule_filepath)
-            if not best_branch.check_validity():
-                raise ValueError("Invalid Branch chosen")
-
-            schedule = self.get_current_schedule_dict()
-            instance_ilp_rep = self.get_current_instance_ilp_rep(schedule, queue_object)
-            instance_ilp_rep = self.add_branch_to_ilp_rep(best_branch, instance_ilp_rep, queue_object)
-            schedule = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule, queue_object)
-            queue_object.release_time = sum(queue_object.instance.times[-1])
-            if queue_object.release_time > schedule["objective"]:
-                schedule["objective"] = queue_object.release_time
-            schedule["resources"] = list(set(schedule["resources"]).union(instance_ilp_rep["resources"]))
-            self.save_schedule(schedule)
+            queue_object = self.task_queue.pop()
+            self.allocate_task(queue_object)
             if queue_object.instance.current_task != "end":
                 self.update_task_queue(self.task_queue, queue_object)
 
         end = time.time()
-        self.add_allocation_metadata(float(end-start))
-
-    def single_instance_heuristic(self):
+        self.finish_live_schedule(float(end-start))
+
+    def allocate_task(self, queue_object:QueueObject):
+        """ Allocates the current task of the queue object's instance into the live schedule """
+        best_branch = queue_object.instance.allocate_next_task(self.schedule_filepath, timeline=self.timeline)
+        if not best_branch.check_validity():
+            raise ValueError("Invalid Branch chosen")
+
+        schedule = self.schedule
+        instance_ilp_rep = self.get_current_instance_ilp_rep(schedule, queue_object)
+        instance_ilp_rep = self.add_branch_to_ilp_rep(best_branch, instance_ilp_rep, queue_object)
+        schedule = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule, queue_object)
+        queue_object.release_time = sum(queue_object.instance.times[-1])
+        if queue_object.release_time > schedule["objective"]:
+            schedule["objective"] = queue_object.release_time
+        schedule["resources"] = list(set(schedule["resources"]).union(instance_ilp_rep["resources"]))
+        self.task_done()
+
+    def single_instance_heuristic(self, beam:bool = False):
         """
         Calls heuristic allocation for each task in an instance before going over to the next instance
+        beam: the branches of an instance are chosen by a BeamSearch on its arrival
         """
         # TODO single_instance_heuristic()
         # like single task process but do not update process until the end. 
         # Make sure the deletion of a previous task is also prossible! 
         start = time.time()
+        self.start_live_schedule()
         while self.task_queue:
-            queue_object = self.task_queue.pop(0)
-            while queue_object.instance.current_task != "end":
-                best_branch = queue_object.instance.allocate_next_task(self.schedule_filepath)
-                queue_object.release_time = sum(queue_object.instance.times[-1])
-                if not best_branch.check_validity():
-                    raise ValueError("Invalid Branch chosen")
-                schedule = self.get_current_schedule_dict()
-                instance_ilp_rep = self.get_current_instance_ilp_rep(schedule, queue_object)
-                instance_ilp_rep = self.add_branch_to_ilp_rep(best_branch, instance_ilp_rep, queue_object)
-                schedule = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule, queue_object)
-                #self.update_task_queue(self.task_queue, queue_object)
-
-                schedule["resources"] = list(set(schedule["resources"]).union(instance_ilp_rep["resources"]))
-                
-                if queue_object.release_time > schedule["objective"]:
-                    schedule["objective"] = queue_object.release_time          
-                self.save_schedule(schedule)    
+            queue_object = self.task_queue.pop()
+            self.allocate_instance_heuristic(queue_object, beam=beam)
         end = time.time()
-        self.add_allocation_metadata(float(end-start))
+        self.finish_live_schedule(float(end-start))
+
+    def allocate_instance_heuristic(self, queue_object:QueueObject, beam:bool = False):
+        """ Allocates all tasks of the queue object's instance into the live schedule """
+        branch_choices = self.get_beam_choices(queue_object.instance) if beam else {}
+        while queue_object.instance.current_task != "end":
+            branch_no = branch_choices.get(queue_object.instance.current_task.attrib["id"])
+            best_branch = queue_object.instance.allocate_next_task(self.schedule_filepath, timeline=self.timeline, branch_no=branch_no)
+            queue_object.release_time = sum(queue_object.instance.times[-1])
+            if not best_branch.check_validity():
+                raise ValueError("Invalid Branch chosen")
+            schedule = self.schedule
+            instance_ilp_rep = self.get_current_instance_ilp_rep(schedule, queue_object)
+            instance_ilp_rep = self.add_branch_to_ilp_rep(best_branch, instance_ilp_rep, queue_object)
+            schedule = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule, queue_object)
+            #self.update_task_queue(self.task_queue, queue_object)
+
+            schedule["resources"] = list(set(schedule["resources"]).union(instance_ilp_rep["resources"]))
+            
+            if queue_object.release_time > schedule["objective"]:
+                schedule["objective"] = queue_object.release_time          
+            self.task_done()
+        self.commit_step(self.schedule, [queue_object.schedule_idx])
+
+    def get_beam_choices(self, instance:Instance) -> dict[str, int]:
+        """ Branch choices of a BeamSearch over the remaining tasks of instance on the live timeline """
+        tasks = instance.get_remaining_tasks()
+        if not tasks:
+            return {}
+        beam_search = BeamSearch(instance.allocator, width=self.beam_width, time_budget=self.beam_time_budget)
+        return beam_search.search(tasks, float(xpaths.RELEASE_TIME(tasks[0])[0].text), self.timeline)
+
+    def multistart_heuristic(self):
+        """
+        Runs self.multistart_runs variants of the task-wise heuristic (single_task_processing) in a pool
+        of worker processes and keeps the schedule with the best makespan.
+        Run 0 is the deterministic heuristic, the other runs choose at random among near-equal branches
+        and perturb the order of instances with the same release time, seeded from self.multistart_seed.
+        The workers allocate copies of the instances, the instances of this simulator stay unallocated.
+        The allocator settings of each instance (MULTISTART_ALLOCATOR_SETTINGS) are passed to its copies.
+        """
+        start = time.time()
+        templates = {}
+        instances = []
+        for queue_object in sorted(self.task_queue, key=lambda queue_object: queue_object.schedule_idx):
+            ra_pst = queue_object.instance.ra_pst
+            template = getattr(ra_pst, "template", None) or ra_pst
+            if id(template) not in templates:
+                templates[id(template)] = dump_ra_pst(template)
+            settings = {name: getattr(queue_object.instance.allocator, name) for name in MULTISTART_ALLOCATOR_SETTINGS}
+            instances.append((id(template), queue_object.instance.id, queue_object.instance.release_time, settings))
+        self.task_queue = EventQueue()
+
+        seeds = [None] + [int(seed.generate_state(1)[0]) for seed in np.random.SeedSequence(self.multistart_seed).spawn(self.multistart_runs - 1)]
+        runs = [(run, seed, templates, instances, self.tie_tolerance) for run, seed in enumerate(seeds)]
+        workers = min(self.multistart_workers or os.cpu_count() or 1, len(runs))
+        if workers > 1:
+            with mp.Pool(processes=workers) as pool:
+                results = pool.map(_multistart_worker, runs, chunksize=1)
+        else:
+            results = [_multistart_worker(run) for run in runs]
+
+        best = min(results, key=lambda result: (result["objective"], result["run"]))
+        self.schedule = best.pop("schedule")
+        for result in results:
+            result.pop("schedule", None)
+        self.schedule["solution"]["computing time"] = float(time.time() - start)
+        self.schedule["solution"]["multistart"] = {"best run": best["run"], "workers": workers, "runs": results}
+        self.save_schedule(self.schedule)
+
+    def start_live_schedule(self):
+        """ Loads the schedule once into memory for a heuristic run and builds its timeline """
+        self.schedule = self.get_current_schedule_dict()
+        self.timeline = ResourceTimeline.from_schedule(self.schedule)
+        self.persistence.saved()
+        self.persistence.install()
+
+    def task_done(self):
+        """ Writes the live schedule if the persistence policy asks for it """
+        if self.persistence.task_done():
+            self.save_schedule(self.schedule)
+
+    def finish_live_schedule(self, computing_time:float):
+        """ Adds the allocation metadata and writes the live schedule """
+        self.persistence.uninstall()
+        self.add_allocation_metadata(computing_time, schedule=self.schedule)
+        self.persistence.saved()
+        self.commit_step(self.schedule, range(len(self.schedule["instances"])))
+
+    def finish_cp_schedule(self):
+        """ Writes the live schedule of the online CP at the end of a run """
+        self.persistence.uninstall()
+        if self.schedule is not None:
+            self.save_schedule(self.schedule)
+        self.persistence.saved()
     
 
     def single_instance_processing(self, decomposed:bool=False):
@@ -239,22 +606,56 @@ class Simulator():
         Allocates each instance on arrival. 
         Already scheduled instances are in the schedule and are added to the cp as fixed. 
         Allowance for rescheduling can be set through self.sigma.
+        With self.batch_window, arrivals within the window are configured and scheduled in one solver call.
         """
+        self.persistence.install()
         while self.task_queue:
-            queue_object = self.task_queue.pop(0)
-            schedule_dict = self.get_current_schedule_dict()
+            self.allocate_instances_cp(self.pop_arrival_batch(self.task_queue), decomposed=decomposed)
+        self.finish_cp_schedule()
+
+    def pop_arrival_batch(self, queue:EventQueue) -> list[QueueObject]:
+        """ Pops the next queue object and the queued ones that arrive within self.batch_window after it """
+        batch = [queue.pop()]
+        while self.batch_window is not None and queue and queue.peek().release_time <= batch[0].release_time + self.batch_window:
+            batch.append(queue.pop())
+        return batch
+
+    def allocate_instances_cp(self, queue_objects:list[QueueObject], decomposed:bool=False):
+        """
+        Adds the queue objects' instances to the schedule and solves them together with the already scheduled instances fixed.
+        The solver gets the live schedule (self.schedule) and its result becomes the live schedule,
+        the schedule file is written according to self.persistence.
+        A batch is decided at its latest arrival, no job of the batch starts before that.
+        """
+        schedule_dict = self.schedule if self.schedule is not None else self.get_current_schedule_dict()
+        decision_time = max(queue_object.release_time for queue_object in queue_objects)
+        for queue_object in queue_objects:
             instance_ilp_rep = self.get_current_instance_ilp_rep(schedule_dict, queue_object)
+            for job in instance_ilp_rep["jobs"].values():
+                job["release_time"] = max(job["release_time"] or 0, decision_time)
             schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
             schedule_dict["resources"] = list(set(schedule_dict["resources"]).union(instance_ilp_rep["resources"]))
-            #if warmstart:
-            #    self.create_warmstart_file(schedule_dict, [queue_object])
-            self.save_schedule(schedule_dict)
-
-            if decomposed:
-                result = cp_solver_decomposed_strengthened_cuts(self.schedule_filepath, TimeLimit=self.time_limit, sigma=self.sigma)
-            else:
-                result = cp_solver(self.schedule_filepath, log_file=f"{self.schedule_filepath}.log", sigma=self.sigma, timeout=self.time_limit)
-            self.save_schedule(result)
+        solver_calls = schedule_dict.get("solution", {}).get("solver calls", 0)
+        #if warmstart:
+        #    self.create_warmstart_file(schedule_dict, [queue_object])
+
+        if decomposed:
+            result = cp_solver_decomposed_strengthened_cuts(schedule_dict, TimeLimit=self.time_limit, sigma=self.sigma, break_symmetries=self.break_symmetries)
+        elif self.incremental_cp:
+            if self.cp_session is None:
+                self.cp_session = CPSession(sigma=self.sigma, timeout=self.time_limit, log_file=f"{self.schedule_filepath}.log",
+                                            rolling_horizon=self.rolling_horizon, branch_formulation=self.branch_formulation,
+                                            break_symmetries=self.break_symmetries)
+            result = self.cp_session.solve(schedule_dict)
+        else:
+            result = cp_solver(schedule_dict, log_file=f"{self.schedule_filepath}.log", sigma=self.sigma, timeout=self.time_limit,
+                               break_symmetries=self.break_symmetries, rolling_horizon=self.rolling_horizon, branch_formulation=self.branch_formulation)
+        result["solution"]["solver calls"] = solver_calls + 1
+        self.schedule = result
+        # with sigma > 0 the solver may move the jobs of every instance
+        self.commit_step(result, [queue_object.schedule_idx for queue_object in queue_objects],
+                         dirty=range(len(result["instances"])) if self.sigma > 0 else ())
+        self.task_done()
 
 
     def single_instance_ilp(self, different_instances:bool=False):
@@ -262,36 +663,30 @@ class Simulator():
         Allocates an instance that was previously configured through the ILP
         ILP configuration and scheduling is done in this method
         """
-        queue_object = self.task_queue.pop(0)
+        queue_object = self.task_queue.pop()
         schedule_dict = self.get_current_schedule_dict()
         instance_ilp_rep = self.get_current_instance_ilp_rep(schedule_dict, queue_object)
         schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
-        self.save_schedule(schedule_dict)
 
-        # Get optimal configuration through ILP
-        result = configuration_ilp(self.schedule_filepath)
+        # Get optimal configuration through ILP (on a copy, the ILP writes its variables into the ilp_rep)
+        result = configuration_ilp(copy.deepcopy(schedule_dict["instances"][0]))
         with open("tmp/ilp_rep.json", "w") as f:
             json.dump(result, f, indent=2)
 
         schedule_dict = self.ilp_to_schedule_file(result, schedule_dict, queue_object.instance.id)
-        self.save_schedule(schedule_dict)
-        schedule_dict = cp_solver_scheduling_only(self.schedule_filepath, timeout=self.time_limit, sigma=self.sigma)
+        schedule_dict = cp_solver_scheduling_only(schedule_dict, timeout=self.time_limit, sigma=self.sigma)
         schedule_dict["ilp_objective"] = result["objective"]
         schedule_dict["ilp_runtime"] = result["runtime"]
         self.save_schedule(schedule_dict)
 
         while self.task_queue:
-            queue_object = self.task_queue.pop(0)
-            schedule_dict = self.get_current_schedule_dict()
+            queue_object = self.task_queue.pop()
             instance_ilp_rep = self.get_current_instance_ilp_rep(schedule_dict, queue_object)
             schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
             if different_instances:
-                with open("tmp/ilp_rep.json", "w") as f:
-                    json.dump(instance_ilp_rep, f, indent=2)
-                result = configuration_ilp("tmp/ilp_rep.json")
+                result = configuration_ilp(copy.deepcopy(instance_ilp_rep))
             schedule_dict = self.ilp_to_schedule_file(result, schedule_dict, queue_object.instance.id)
-            self.save_schedule(schedule_dict)
-            schedule_dict = cp_solver_scheduling_only(self.schedule_filepath, timeout=self.time_limit, sigma=self.sigma)
+            schedule_dict = cp_solver_scheduling_only(schedule_dict, timeout=self.time_limit, sigma=self.sigma)
             self.save_schedule(schedule_dict)
     
 
@@ -299,32 +694,26 @@ class Simulator():
         """
         Schedules all instances simultaneously based on the optimal configuration found with ILP
         """
-        queue_object = self.task_queue.pop(0)
+        queue_object = self.task_queue.pop()
         schedule_dict = self.get_current_schedule_dict()
         instance_ilp_rep = self.get_current_instance_ilp_rep(schedule_dict, queue_object)
         schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
-        self.save_schedule(schedule_dict)
-        result = configuration_ilp(self.schedule_filepath)
+        result = configuration_ilp(copy.deepcopy(schedule_dict["instances"][0]))
         with open("tmp/ilp_rep.json", "w") as f:
             json.dump(result, f, indent=2)
         schedule_dict = self.ilp_to_schedule_file(result, schedule_dict, queue_object.instance.id)
         schedule_dict["ilp_objective"] = result["objective"]
         schedule_dict["ilp_runtime"] = result["runtime"]
-        self.save_schedule(schedule_dict)
 
         while self.task_queue:
-            queue_object = self.task_queue.pop(0)
-            schedule_dict = self.get_current_schedule_dict()
+            queue_object = self.task_queue.pop()
             instance_ilp_rep = self.get_current_instance_ilp_rep(schedule_dict, queue_object)
             schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
             if different_instances:
-                with open("tmp/ilp_rep.json", "w") as f:
-                    json.dump(instance_ilp_rep, f, indent=2)
-                result = configuration_ilp("tmp/ilp_rep.json")
+                result = configuration_ilp(copy.deepcopy(instance_ilp_rep))
             schedule_dict = self.ilp_to_schedule_file(result, schedule_dict, queue_object.instance.id)
-            self.save_schedule(schedule_dict)
 
-        schedule_dict = cp_solver_scheduling_only(self.schedule_filepath, timeout=self.time_limit, sigma=self.sigma)
+        schedule_dict = cp_solver_scheduling_only(schedule_dict, timeout=self.time_limit, sigma=self.sigma)
         self.save_schedule(schedule_dict)
         
     def all_instance_processing(self, warmstart:bool = False, decomposed:bool=False):
@@ -333,23 +722,24 @@ class Simulator():
         Integrated CP for scheduling.
         """
         # Generate dict needed for cp_solver
+        schedule_dict = self.get_current_schedule_dict()
         for queue_object in self.task_queue:
-            schedule_dict = self.get_current_schedule_dict()
             instance_ilp_rep = self.get_current_instance_ilp_rep(schedule_dict, queue_object)
             schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
-            self.save_schedule(schedule_dict)
         
         if warmstart:
             self.create_warmstart_file(schedule_dict, self.task_queue)
-            result = cp_solver(self.schedule_filepath, "tmp/warmstart.json")
+            result = cp_solver(schedule_dict, "tmp/warmstart.json")
         elif decomposed:
-            result = cp_solver_decomposed_strengthened_cuts(self.schedule_filepath, TimeLimit=self.time_limit)
+            result = cp_solver_decomposed_strengthened_cuts(schedule_dict, TimeLimit=self.time_limit, break_symmetries=self.break_symmetries)
         else:
             _, logfile = os.path.split(os.path.basename(self.schedule_filepath))
-            result = cp_solver(self.schedule_filepath, log_file=f"{self.schedule_filepath}.log", timeout=self.time_limit, break_symmetries=False)
+            result = cp_solver(schedule_dict, log_file=f"{self.schedule_filepath}.log", timeout=self.time_limit, break_symmetries=self.break_symmetries,
+                               branch_formulation=self.branch_formulation)
         self.save_schedule(result)
+        self.commit_step(result, range(len(result["instances"])), dirty=range(len(result["instances"])))
             
-    def create_warmstart_file(self, ra_psts:dict, queue_objects:list[QueueObject]):
+    def create_warmstart_file(self, ra_psts:dict, queue_objects:EventQueue):
         with open("tmp/warmstart.json", "w") as f:
             ra_psts.setdefault("objective", 0)
             json.dump(ra_psts, f, indent=2)
@@ -362,35 +752,30 @@ class Simulator():
         print("Warmstart file created")
 
 
-    def update_task_queue(self, queue:list[QueueObject], queue_object: QueueObject):
-        # instance, allocation_type, task, release_time = task
-        queue.append(queue_object)
-        queue.sort(key=lambda object: object.release_time)
-
-
-    def add_allocation_metadata(self, computing_time: float):
-        with open(self.schedule_filepath, "r+") as f:
-            ra_psts = json.load(f)
-            intervals = []
-            for ra_pst in ra_psts["instances"]:
-                for jobId, job in ra_pst["jobs"].items():
-                    if job["selected"]:
-                        intervals.append({
-                            "jobId": jobId,
-                            "start": job["start"],
-                            "duration": job["cost"]
-                        })
-            total_interval_length = sum(
-                [element["duration"] for element in intervals])
-            ra_psts["solution"] = {
-                "objective": ra_psts["objective"],
-                "computing time": computing_time,
-                "total interval length": total_interval_length
-            }
-            # Save back to file
-            f.seek(0)  # Reset file pointer to the beginning
-            json.dump(ra_psts, f, indent=2)
-            f.truncate()
+    def update_task_queue(self, queue:EventQueue, queue_object: QueueObject):
+        queue.push(queue_object)
+
+
+    def add_allocation_metadata(self, computing_time: float, schedule: dict = None):
+        """ Adds the solution info to the schedule (read from the schedule file if not given) and saves it """
+        ra_psts = schedule if schedule is not None else self.get_current_schedule_dict()
+        intervals = []
+        for ra_pst in ra_psts["instances"]:
+            for jobId, job in ra_pst["jobs"].items():
+                if job["selected"]:
+                    intervals.append({
+                        "jobId": jobId,
+                        "start": job["start"],
+                        "duration": job["cost"]
+                    })
+        total_interval_length = sum(
+            [element["duration"] for element in intervals])
+        ra_psts["solution"] = {
+            "objective": ra_psts["objective"],
+            "computing time": computing_time,
+            "total interval length": total_interval_length
+        }
+        self.save_schedule(ra_psts)
     
     
     def ilp_to_schedule_file(self, ilp_rep, schedule_dict, instance_id):
@@ -411,5 +796,38 @@ class Simulator():
         return schedule_dict
 
 
+# Per-instance TaskAllocator attributes that multistart_heuristic hands to the workers
+MULTISTART_ALLOCATOR_SETTINGS = ("batch",)
+
+
+def _multistart_worker(args) -> dict:
+    """ One run of Simulator.multistart_heuristic on instances rebuilt from the serialized templates """
+    run, seed, templates, instances, tie_tolerance = args
+    worker_start = time.perf_counter()
+    ra_psts = {key: load_ra_pst(data) for key, data in templates.items()}
+    rng = random.Random(seed) if seed is not None else None
+    with tempfile.TemporaryDirectory() as directory:
+        sim = Simulator(schedule_filepath=os.path.join(directory, "schedule.json"), sigma=0, time_limit=0)
+        sim.task_queue = EventQueue(rng=rng)
+        run_instances = [Instance.from_template(ra_psts[key], id=instance_id, release_time=release_time)
+                         for key, instance_id, release_time, _ in instances]
+        for instance, (_, _, _, settings) in zip(run_instances, instances):
+            for name, value in settings.items():
+                setattr(instance.allocator, name, value)
+            instance.allocator.rng = rng
+            instance.allocator.tie_tolerance = tie_tolerance
+        sim.add_instances(run_instances, AllocationTypeEnum.HEURISTIC)
+        sim.set_namespace()
+        # All instances are in the schedule from the start, a perturbed order can not append them out of order
+        schedule = {"instances": [instance.get_ilp_rep() for instance in run_instances], "resources": [], "objective": 0}
+        schedule["resources"] = sorted({resource for ilp_rep in schedule["instances"] for resource in ilp_rep["resources"]})
+        sim.save_schedule(schedule)
+        start = time.perf_counter()
+        sim.single_task_processing()
+        computing_time = time.perf_counter() - start
+    return {"run": run, "seed": seed, "objective": sim.schedule["objective"], "computing time": computing_time,
+            "worker time": time.perf_counter() - worker_start, "pid": os.getpid(), "schedule": sim.schedule}
+
+
 if __name__ == "__main__":
     pass
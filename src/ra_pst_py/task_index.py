@@ -0,0 +1,77 @@
+from . import utils
+from . import xpaths
+
+from lxml import etree
+from collections import defaultdict
+import weakref
+
+
+class TaskIndex:
+    """
+    Id- and label-indexed lookup of the process tasks of one tree
+    (call/manipulate elements that are not part of a resource allocation or change pattern).
+    The index is bound to self.root, change operations keep it up to date through
+    add/remove/replace. A miss is authoritative (e.g. a deleted task), lookups only drop
+    elements that are no longer part of the tree. After modifications the index was not
+    notified of, call rebuild().
+    Owners of a tree share its index through TaskIndex.for_tree, so every owner sees the
+    changes another one made.
+    """
+    EXCLUDED_ANCESTORS = {f"{{{xpaths.CPEE1}}}children", f"{{{xpaths.CPEE1}}}allocation",
+                          f"{{{xpaths.CPEE1}}}changepattern", "RA_RPST"}
+
+    def __init__(self, root: etree._Element):
+        self.root: etree._Element = root
+        self.by_id: dict[str, list[etree._Element]] = defaultdict(list)
+        self.by_label: dict[str, list[etree._Element]] = defaultdict(list)
+        self.rebuild()
+
+    @classmethod
+    def for_tree(cls, root: etree._Element) -> "TaskIndex":
+        """ Returns the index of root, built on first use and kept as long as an owner holds it """
+        index = _TREE_INDICES.get(id(root))
+        if index is None or index.root is not root:
+            index = _TREE_INDICES[id(root)] = cls(root)
+        return index
+
+    def rebuild(self):
+        self.by_id.clear()
+        self.by_label.clear()
+        for task in xpaths.PROCESS_TASKS(self.root):
+            self.add(task)
+
+    def add(self, task: etree._Element):
+        for index, key in ((self.by_id, task.attrib["id"]), (self.by_label, utils.get_label(task))):
+            if not any(element is task for element in index[key]):
+                index[key].append(task)
+
+    def remove(self, task: etree._Element):
+        for index, key in ((self.by_id, task.attrib.get("id")), (self.by_label, utils.get_label(task))):
+            index[key] = [element for element in index.get(key, []) if element is not task]
+            if not index[key]:
+                del index[key]
+
+    def replace(self, old: etree._Element, new: etree._Element):
+        self.remove(old)
+        self.add(new)
+
+    def is_process_task(self, task: etree._Element) -> bool:
+        """ True if task is (still) a process task of self.root """
+        if task is self.root:
+            return True
+        for ancestor in task.iterancestors():
+            if ancestor.tag in self.EXCLUDED_ANCESTORS:
+                return False
+            if ancestor is self.root:
+                return True
+        return False
+
+    def get_by_id(self, task_id: str) -> list[etree._Element]:
+        return [task for task in self.by_id.get(task_id, []) if task.attrib.get("id") == task_id and self.is_process_task(task)]
+
+    def get_by_label(self, label: str) -> list[etree._Element]:
+        return [task for task in self.by_label.get(label, []) if self.is_process_task(task)]
+
+
+# id(root) -> index of the tree, the index holds its root so the id is not reused while the entry exists
+_TREE_INDICES: "weakref.WeakValueDictionary[int, TaskIndex]" = weakref.WeakValueDictionary()
@@ -0,0 +1,124 @@
+import numpy as np
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+
+class ResourceTimeline:
+    """
+    Busy intervals of the selected jobs per resource, kept sorted by (start, end).
+    Replaces the scan over every job of every instance in the schedule dict for
+    each slot query: jobs are added once when they are committed and the
+    earliest fit is found through bisect on the interval ends.
+
+    Slot semantics are the ones of the previous timeslot matrix: only intervals
+    ending at or after the release time are considered, the gaps between them
+    start at 0, and a task is placed into the first gap that starts at or after
+    its release time and is long enough, otherwise after the last interval.
+    """
+
+    def __init__(self):
+        self.intervals: dict[str, list[tuple[float, float]]] = defaultdict(list)
+        self.ends: dict[str, list[float]] = defaultdict(list)
+        # Resources with overlapping intervals, the ends are not sorted and bisect can not be used
+        self.unsorted_ends: set[str] = set()
+        self._gaps: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+
+    @classmethod
+    def from_schedule(cls, schedule_dict: dict) -> "ResourceTimeline":
+        """ Builds the timeline from the selected jobs of a schedule dict """
+        timeline = cls()
+        for instance in (schedule_dict or {}).get("instances", []):
+            for job in instance["jobs"].values():
+                if job["selected"]:
+                    timeline.add(job["resource"], job["start"], job["start"] + job["cost"])
+        return timeline
+
+    def copy(self) -> "ResourceTimeline":
+        timeline = ResourceTimeline()
+        for resource in self.intervals:
+            timeline.intervals[resource] = list(self.intervals[resource])
+            timeline.ends[resource] = list(self.ends[resource])
+        timeline.unsorted_ends = set(self.unsorted_ends)
+        return timeline
+
+    def add(self, resource: str, start: float, end: float) -> None:
+        intervals, ends = self.intervals[resource], self.ends[resource]
+        i = bisect_right(intervals, (start, end))
+        intervals.insert(i, (start, end))
+        ends.insert(i, end)
+        self._gaps.pop(resource, None)
+        if (i > 0 and ends[i - 1] > end) or (i + 1 < len(ends) and ends[i + 1] < end):
+            self.unsorted_ends.add(resource)
+
+    def release(self, before: float) -> None:
+        """ Drops the intervals that end before `before`, queries with release times at or after it never see them """
+        for resource, intervals in self.intervals.items():
+            if resource in self.unsorted_ends:
+                self.intervals[resource] = [interval for interval in intervals if interval[1] >= before]
+                self.ends[resource] = [end for _, end in self.intervals[resource]]
+            else:
+                del intervals[:bisect_left(self.ends[resource], before)]
+                del self.ends[resource][:len(self.ends[resource]) - len(intervals)]
+            self._gaps.pop(resource, None)
+
+    def get_intervals(self, resource: str, release_time: float) -> list[tuple[float, float]]:
+        """ Sorted intervals of resource that end at or after release_time """
+        intervals = self.intervals.get(resource, [])
+        if resource in self.unsorted_ends:
+            return [interval for interval in intervals if interval[1] >= release_time]
+        return intervals[bisect_left(self.ends[resource], release_time):]
+
+    def earliest_start(self, resource: str, release_time: float, duration: float) -> float:
+        """ Earliest start of a job of duration on resource at or after release_time """
+        if resource in self.unsorted_ends:
+            return self._earliest_start_unsorted(resource, release_time, duration)
+        intervals = self.intervals.get(resource, [])
+        ends = self.ends.get(resource, [])
+        gap_start = 0
+        for start, end in intervals[bisect_left(ends, release_time):]:
+            if gap_start >= release_time and start - gap_start >= duration:
+                return float(gap_start)
+            gap_start = end
+        return float(gap_start) if gap_start >= release_time else float(release_time)
+
+    def _earliest_start_unsorted(self, resource: str, release_time: float, duration: float) -> float:
+        # gap starts are not ascending, take the smallest fitting one
+        intervals = self.get_intervals(resource, release_time)
+        gap_starts = [0] + [end for _, end in intervals]
+        gap_ends = [start for start, _ in intervals] + [np.inf]
+        fitting = [gap_start for gap_start, gap_end in zip(gap_starts, gap_ends)
+                   if gap_start >= release_time and gap_end - gap_start >= duration]
+        return float(min(fitting)) if fitting else float(release_time)
+
+    def get_gaps(self, resource: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gap starts and ends of resource as arrays (first gap starts at 0, last gap ends at inf),
+        for resources with sorted ends. Cached until the next add on the resource.
+        """
+        if resource not in self._gaps:
+            intervals = self.intervals.get(resource, [])
+            gap_starts = np.array([0] + [end for _, end in intervals], dtype=np.float64)
+            gap_ends = np.array([start for start, _ in intervals] + [np.inf], dtype=np.float64)
+            self._gaps[resource] = (gap_starts, gap_ends)
+        return self._gaps[resource]
+
+    def earliest_starts(self, resource: str, release_times: np.ndarray, durations: np.ndarray) -> np.ndarray:
+        """ Vectorized earliest_start for several (release time, duration) queries on one resource """
+        if resource in self.unsorted_ends:
+            return np.array([self.earliest_start(resource, release_time, duration)
+                             for release_time, duration in zip(release_times.tolist(), durations.tolist())])
+        gap_starts, gap_ends = self.get_gaps(resource)
+        # Gap starts are ascending, the first fitting gap at or after the release time wins
+        first_gap = np.searchsorted(gap_starts, release_times.min())
+        if first_gap == len(gap_starts):
+            return release_times.astype(np.float64)
+        gap_starts, gap_ends = gap_starts[first_gap:], gap_ends[first_gap:]
+        fits = (gap_starts[None, :] >= release_times[:, None]) & ((gap_ends - gap_starts)[None, :] >= durations[:, None])
+        first = fits.argmax(axis=1)
+        return np.where(fits[np.arange(len(first)), first], gap_starts[first], release_times)
+
+    def get_timeslot_matrix(self, resource: str, release_time: float) -> np.ndarray:
+        """ Free slots [[gap start, gap end], ...] of resource as in the previous matrix format """
+        matrix = [list(interval) for interval in self.get_intervals(resource, release_time)]
+        matrix.append([np.inf, 0])
+        return np.roll(np.array(matrix), 1)
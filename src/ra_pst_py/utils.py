@@ -1,4 +1,7 @@
+from . import xpaths
+
 from lxml import etree
+import json
 
 def get_label(element):
 
@@ -7,18 +10,16 @@ def get_label(element):
     if elem_etree.tag == f"{{{ns['cpee1']}}}manipulate":
         return elem_etree.attrib["label"]
     elif elem_etree.tag == f"{{{ns['cpee1']}}}call":
-        return elem_etree.xpath("cpee1:parameters/cpee1:label", namespaces=ns)[0].text
+        return xpaths.LABEL(elem_etree)[0].text
     else:
         raise TypeError("Wrong Element Type: No Task element Given. Type is: ", elem_etree.tag)
     
 def get_allowed_roles(element):
     elem_et = etree.fromstring(element)
-    ns = {"cpee1" : list(elem_et.nsmap.values())[0]}
-    return [role.text for role in elem_et.xpath("cpee1:resources/cpee1:resource", namespaces=ns)]
+    return [role.text for role in xpaths.ROLES(elem_et)]
 
 def get_next_task(tasks_iter, instance=None):
-    if instance:
-        ns = instance.ra_pst.ns
+    task_index = instance.get_task_index() if instance else None
     while True:
         task = next(tasks_iter, "end")
         if task == "end":
@@ -27,7 +28,7 @@ def get_next_task(tasks_iter, instance=None):
         
         # check that next task was not deleted:
         elif instance: 
-            if not instance.ra_pst.process.xpath(f"//*[@id='{task.attrib['id']}'][not(ancestor::cpee1:children) and not(ancestor::cpee1:allocation) and not(ancestor::RA_RPST)]", namespaces=ns):
+            if not task_index.get_by_id(task.attrib['id']):
                 pass
             else:
                 break
@@ -36,14 +37,41 @@ def get_next_task(tasks_iter, instance=None):
     return task
 
 
-def get_process_task(ra_pst:etree._Element, task:etree._Element, ns=None):
+def get_process_task(ra_pst:etree._Element, task:etree._Element, ns=None, task_index=None):
     task_id = task.attrib["id"]
-    tasks = ra_pst.xpath(f"//cpee1:manipulate[@id='{task_id}'][not(ancestor::cpee1:children) and not(ancestor::cpee1:allocation)] |" 
-                         f"//cpee1:call[@id='{task_id}'][not(ancestor::cpee1:children) and not(ancestor::cpee1:allocation)]", 
-                        namespaces=ns)
+    if task_index is not None and task_index.root is ra_pst:
+        tasks = task_index.get_by_id(task_id)
+    else:
+        tasks = xpaths.PROCESS_TASK_BY_ID(ra_pst, id=task_id)
     task_label = get_label(task)
     tasks = [task for task in tasks if get_label(task) == task_label]
     if len(tasks) > 1:
         raise ValueError ("More than one task with same ID and label")
     return tasks[0]
-    
\ No newline at end of file
+    
+
+def load_schedule(source) -> dict:
+    """
+    Solver input given as path of a schedule/ilp_rep JSON file or as the already loaded dict.
+    A dict is used in place, the solvers add their results to it.
+    """
+    if isinstance(source, dict):
+        return source
+    with open(source, "r") as f:
+        return json.load(f)
+
+
+def compact_ilp_rep(ilp_rep:dict) -> dict:
+    """
+    Cuts the ilp_rep of a scheduled instance down in place to its selected jobs and their branches.
+    A fixed instance needs no more in the solvers and the solution info, the alternatives are dropped.
+    """
+    jobs = {jobId: job for jobId, job in ilp_rep["jobs"].items() if job["selected"]}
+    for job in jobs.values():
+        job["after"] = [jobId for jobId in job["after"] if jobId in jobs]
+    branches = {job["branch"] for job in jobs.values()}
+    ilp_rep["jobs"] = jobs
+    ilp_rep["branches"] = {branchId: branch for branchId, branch in ilp_rep["branches"].items() if branchId in branches}
+    for task in ilp_rep["tasks"].values():
+        task["branches"] = [branchId for branchId in task["branches"] if branchId in branches]
+    return ilp_rep
@@ -0,0 +1,72 @@
+from lxml import etree
+
+from functools import lru_cache
+
+# Registry of precompiled XPath expressions.
+# lxml parses a string expression again on every element.xpath(...) call, the objects below
+# are compiled once and can be evaluated on any element: XPATH(element, id="a1").
+# Ids are passed as XPath variables ($id) instead of f-strings so the expression stays reusable.
+
+CPEE1 = "http://cpee.org/ns/description/1.0"
+NS = {"cpee1": CPEE1}
+
+
+@lru_cache(maxsize=None)
+def compiled(expression: str, namespace: str = CPEE1) -> etree.XPath:
+    """
+    Returns the compiled XPath for expression bound to the cpee1 prefix.
+    Use for expressions that are built at runtime (e.g. a measure name),
+    the compiled object is cached per expression.
+    """
+    return etree.XPath(expression, namespaces={"cpee1": namespace})
+
+
+# Process level
+TASKLIST = compiled("(//cpee1:call|//cpee1:manipulate)[not (ancestor::cpee1:children|ancestor::cpee1:allocation)]")
+BRANCH_TASKLIST = compiled("(//cpee1:call|//cpee1:manipulate)[not(ancestor::cpee1:changepattern|ancestor::cpee1:allocation)]")
+PROCESS_TASKS = compiled("(//cpee1:call|//cpee1:manipulate)[not(ancestor::cpee1:children|ancestor::cpee1:allocation|ancestor::cpee1:changepattern)]")
+ALL_TASKS = compiled("//*[self::cpee1:call or self::cpee1:manipulate]")
+ACTIVE_TASK_BY_ID = compiled("//*[@id=$id][not(ancestor::cpee1:children) and not(ancestor::cpee1:allocation) and not(ancestor::RA_RPST)]")
+PROCESS_TASK_BY_ID = compiled(
+    "//cpee1:manipulate[@id=$id][not(ancestor::cpee1:children) and not(ancestor::cpee1:allocation)] |"
+    "//cpee1:call[@id=$id][not(ancestor::cpee1:children) and not(ancestor::cpee1:allocation)]")
+RESOURCES_WITHOUT_CHANGEPATTERN = compiled("//resource[not(descendant::cpee1:changepattern)]")
+DELETE_TYPE = compiled("//*[@type='delete']")
+
+# Task level
+LABEL = compiled("cpee1:parameters/cpee1:label")
+RELEASE_TIME = compiled("cpee1:release_time")
+RELEASE_TIME_DESCENDANT = compiled("descendant::cpee1:release_time")
+EXPECTED_START = compiled("cpee1:expected_start")
+EXPECTED_END = compiled("cpee1:expected_end")
+ALLOCATION_CHILDREN = compiled("cpee1:allocation/*")
+ROLES = compiled("cpee1:resources/cpee1:resource")
+TASK_RESOURCE = compiled("cpee1:children/cpee1:resource")
+TASK_RESPROFILE = compiled("cpee1:children/cpee1:resource/cpee1:resprofile")
+TASK_RESPROFILE_CHILDREN = compiled("cpee1:children/cpee1:resource/cpee1:resprofile/cpee1:children/*")
+TASK_CHANGEPATTERNS = compiled("cpee1:children/cpee1:resource/cpee1:resprofile/cpee1:changepattern")
+TASK_CHANGEPATTERN_DESCENDANTS = compiled("cpee1:children/descendant::cpee1:changepattern")
+CHANGEPATTERN_TYPES = compiled("descendant::cpee1:changepattern/@type")
+EMPTY_CHILDREN = compiled("descendant::cpee1:children[not(child::*)]")
+FIRST_RESOURCE = compiled("descendant::cpee1:resource[not(parent::cpee1:resources)][1]")
+FIRST_COST = compiled("descendant::cpee1:cost[1]")
+
+# Schedule level (evaluated on any element of a scheduled process)
+ALL_EXPECTED_STARTS = compiled("//cpee1:expected_start/text()")
+ALL_EXPECTED_ENDS = compiled("//cpee1:expected_end/text()")
+ALL_EXPECTED_DELETES = compiled("//cpee1:expected_delete/parent::*")
+EXPECTED_DELETE_TEXT = compiled("cpee1:expected_delete/text()")
+
+
+def measure(attribute: str) -> etree.XPath:
+    """ Measure (e.g. cost) of the resource profile of a branch task """
+    return compiled(f"cpee1:children/cpee1:resource/cpee1:resprofile/cpee1:measures/cpee1:{attribute}")
+
+
+@lru_cache(maxsize=None)
+def branch_measures(attribute: str) -> etree.XPath:
+    """ All measures (e.g. cost) of the resource profiles in the tree of a branch """
+    return compiled(f"//cpee1:resprofile/cpee1:measures/cpee1:{attribute}")
+
+
+BRANCH_COSTS = branch_measures("cost")
@@ -1,5 +1,7 @@
 from src.ra_pst_py.builder import build_rapst, show_tree_as_graph
 import unittest
+import tempfile
+import os
 from lxml import etree
 
 class BuilderTest(unittest.TestCase):
@@ -23,6 +25,38 @@ class BuilderTest(unittest.TestCase):
 
         self.assertEqual(etree.tostring(created), etree.tostring(target))
 
+    def test_build_rapst_cache(self):
+        process_file = "test_instances/paper_process_short.xml"
+        resource_file = "test_instances/offer_resources_many_invalid_branches.xml"
+        with tempfile.TemporaryDirectory() as cache_dir:
+            built = build_rapst(process_file, resource_file, compile_branches=True, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            cached = build_rapst(process_file, resource_file, compile_branches=True, cache_dir=cache_dir)
+            self.assertEqual(etree.tostring(cached.ra_pst), etree.tostring(built.ra_pst))
+            self.assertEqual(etree.tostring(cached.process), etree.tostring(built.process))
+            self.assertEqual(cached.get_ilp_rep(), built.get_ilp_rep())
+            self.assertEqual([branch.check_validity() for branch in cached.branches["a1"]],
+                             [branch.check_validity() for branch in built.branches["a1"]])
+            self.assertIsNotNone(cached.branch_table)
+
+            # a changed input leads to a new entry, a small cap evicts the older one
+            changed_resource = os.path.join(cache_dir, "resource.xml")
+            with open(resource_file) as f, open(changed_resource, "w") as g:
+                g.write(f.read().replace("<cost>", "<cost>1"))
+            changed = build_rapst(process_file, changed_resource, cache_dir=cache_dir, cache_max_bytes=1)
+            self.assertNotEqual(changed.get_ilp_rep(), built.get_ilp_rep())
+            self.assertEqual(len([f for f in os.listdir(cache_dir) if f.endswith(".rapst")]), 0)
+
+    def test_build_rapst_workers(self):
+        process_file = "tests/test_data/test_instance_data/BPM_TestSet_10.xml"
+        resource_file = "tests/test_data/test_instance_data/(0.6, 0.4, 0.0)-random-3-uniform-resource_based-2-1-10.xml"
+        serial = build_rapst(process_file, resource_file)
+        parallel = build_rapst(process_file, resource_file, workers=2)
+        self.assertEqual(etree.tostring(parallel.ra_pst), etree.tostring(serial.ra_pst))
+        self.assertEqual(
+            [etree.tostring(branch.node) for branches in parallel.branches.values() for branch in branches],
+            [etree.tostring(branch.node) for branches in serial.branches.values() for branch in branches])
+
     def test_get_ilp_branches(self):
         ra_pst = build_rapst(process_file="tests/test_data/test_process.xml", resource_file="tests/test_data/test_resource.xml")
 
@@ -1,11 +1,16 @@
-from src.ra_pst_py.core import RA_PST, ResourceError
+from src.ra_pst_py.core import RA_PST, Branch, ResourceError
+from src.ra_pst_py.metrics import RA_PSTMetrics
 from src.ra_pst_py.file_parser import parse_process_file, parse_resource_file
 from src.ra_pst_py.instance import Instance
+from src.ra_pst_py.heuristic import get_deletion_savings
+from src.ra_pst_py import utils
 
 import unittest
 from lxml import etree
 from collections import defaultdict
 import warnings
+import copy
+import math
 
 
 class CoreTest(unittest.TestCase):
@@ -94,3 +99,141 @@ class CoreTest(unittest.TestCase):
 
 
 
+
+    def test_branch_table(self):
+        process = parse_process_file("test_instances/paper_process_short.xml")
+        resources = parse_resource_file("test_instances/offer_resources_many_invalid_branches.xml")
+        ra_pst = RA_PST(process, resources)
+        ilp_rep = ra_pst.get_ilp_rep()
+        problem_size = ra_pst.get_problem_size()
+        flex_factor = ra_pst.get_flex_factor()
+
+        compiled = RA_PST(process, resources)
+        table = compiled.compile_branch_table()
+        self.assertEqual(table.num_branches, sum(len(branches) for branches in ra_pst.branches.values()))
+        self.assertEqual(list(table.get_branch_costs("a3")), [branch.get_branch_costs() for branch in ra_pst.branches["a3"]])
+        self.assertEqual(compiled.get_problem_size(), problem_size)
+        self.assertAlmostEqual(compiled.get_flex_factor(), flex_factor)
+        compiled_rep = compiled.get_ilp_rep()
+        self.assertEqual(compiled_rep["tasks"], ilp_rep["tasks"])
+        self.assertEqual(compiled_rep["resources"], ilp_rep["resources"])
+        self.assertEqual(compiled_rep["jobs"], ilp_rep["jobs"])
+        for branchId, branch in ilp_rep["branches"].items():
+            self.assertEqual(sorted(compiled_rep["branches"][branchId].pop("deletes")), sorted(branch.pop("deletes")))
+            self.assertEqual(compiled_rep["branches"][branchId], branch)
+
+    def test_metrics(self):
+        process = parse_process_file("test_instances/paper_process_short.xml")
+        resources = parse_resource_file("test_instances/offer_resources_many_invalid_branches.xml")
+        ra_pst = RA_PST(process, resources)
+        metrics = ra_pst.get_metrics()
+        # reading the metrics does not switch the RA_PST onto the branch table
+        self.assertIsNone(ra_pst.branch_table)
+        # values of the previous per metric implementations
+        self.assertAlmostEqual(metrics.flex_factor, 1.0336735048112144)
+        self.assertAlmostEqual(metrics.entropy, 0.8720596306110906)
+        self.assertAlmostEqual(metrics.avg_cost, 25.333333333333332)
+
+        # resource tightness from the resource file: cost uniformity * normalized entropy of the offered task labels
+        resourcelist = ra_pst.get_resourcelist()
+        costs, offered_labels = defaultdict(list), defaultdict(set)
+        for resource in ra_pst.resource_data.iterchildren("resource"):
+            if resource.attrib.get("id") not in resourcelist:
+                continue
+            for profile in resource.iterchildren("resprofile"):
+                offered_labels[resource.attrib["id"]].add(profile.attrib["task"])
+                costs[resource.attrib["id"]].extend(float(cost) for cost in profile.xpath("measures/cost/text()"))
+        mean_costs = [sum(costs[resource]) / len(costs[resource]) for resource in dict.fromkeys(resourcelist)]
+        mean_of_means = sum(mean_costs) / len(mean_costs)
+        cost_uniform = 1 - math.sqrt(sum((cost - mean_of_means) ** 2 for cost in mean_costs) / len(mean_costs)) / mean_of_means
+        available_labels = {utils.get_label(task) for branches in ra_pst.branches.values() for branch in branches for task in branch.get_tasklist()}
+        shares = [len(offered_labels[resource]) / len(available_labels) for resource in dict.fromkeys(resourcelist) if offered_labels[resource]]
+        usage_distribution = -sum(share * math.log(share) for share in shares) / math.log(len(resourcelist))
+        self.assertAlmostEqual(metrics.resource_tightness, cost_uniform * usage_distribution)
+        self.assertIs(ra_pst.get_metrics(), metrics)
+        self.assertEqual(ra_pst.get_enthropy(), metrics.entropy)
+        self.assertEqual(ra_pst.get_avg_cost(), metrics.avg_cost)
+
+        batch = RA_PSTMetrics.batch("test_instances/paper_process_short.xml",
+                                    ["test_instances/offer_resources_many_invalid_branches.xml"])
+        self.assertEqual(batch["test_instances/offer_resources_many_invalid_branches.xml"].as_dict(), metrics.as_dict())
+
+    def test_ilp_rep_precedence(self):
+        process = parse_process_file("test_instances/paper_process_short.xml")
+        resources = parse_resource_file("test_instances/offer_resources_many_invalid_branches.xml")
+        ra_pst = RA_PST(process, resources)
+        compact = ra_pst.get_ilp_rep()
+        dense = ra_pst.get_ilp_rep(dense_precedence=True)
+        self.assertEqual(compact["jobs"].keys(), dense["jobs"].keys())
+        self.assertLessEqual(sum(len(job["after"]) for job in compact["jobs"].values()),
+                             sum(len(job["after"]) for job in dense["jobs"].values()))
+
+        # every job of an earlier task must still be reachable through the compact edges
+        task_order = list(compact["tasks"].keys())
+        for jobId, job in compact["jobs"].items():
+            self.assertTrue(set(job["after"]) <= set(dense["jobs"][jobId]["after"]))
+            reachable, stack = set(), list(job["after"])
+            while stack:
+                previous = stack.pop()
+                if previous not in reachable:
+                    reachable.add(previous)
+                    stack.extend(compact["jobs"][previous]["after"])
+            task = compact["branches"][job["branch"]]["task"]
+            for previous in dense["jobs"][jobId]["after"]:
+                previous_task = compact["branches"][compact["jobs"][previous]["branch"]]["task"]
+                if task_order.index(previous_task) < task_order.index(task):
+                    self.assertIn(previous, reachable)
+        for branch in compact["branches"].values():
+            self.assertTrue(branch["chain"])
+        self.assertEqual(compact["tasks"][task_order[0]]["after"], [])
+
+    def test_branch_validity_cache(self):
+        process = parse_process_file("test_instances/paper_process_short.xml")
+        resources = parse_resource_file("test_instances/offer_resources_many_invalid_branches.xml")
+        ra_pst = RA_PST(process, resources)
+        branches = [branch for task_branches in ra_pst.branches.values() for branch in task_branches]
+        # the validity is computed when the branches are built
+        Branch.reset_validity_stats()
+        validity = [branch.check_validity() for branch in branches]
+        self.assertEqual(Branch.get_validity_stats(), {"hits": len(branches), "misses": 0})
+        copies = [branch.shared_copy() for branch in branches]
+        self.assertEqual([branch.check_validity() for branch in copies], validity)
+        self.assertEqual(Branch.get_validity_stats(), {"hits": 2 * len(branches), "misses": 0})
+
+        # replacing the node recomputes the validity
+        invalid_branch = branches[validity.index(False)]
+        valid_branch = branches[validity.index(True)]
+        invalid_branch.node = copy.deepcopy(valid_branch.node)
+        self.assertTrue(invalid_branch.check_validity())
+        self.assertEqual(Branch.get_validity_stats()["misses"], 1)
+
+        # an assigned node is private, get_node_for_update does not copy it again
+        branch_copy = copies[0]
+        node = copy.deepcopy(branch_copy.node)
+        branch_copy.node = node
+        self.assertIs(branch_copy.get_node_for_update(), node)
+
+    def test_deletion_savings_table(self):
+        process = parse_process_file("test_instances/paper_process_short.xml")
+        resources = parse_resource_file("test_instances/offer_resources_many_invalid_branches.xml")
+        ra_pst = RA_PST(process, resources)
+        table = ra_pst.get_deletion_savings_table()
+        for task in ra_pst.get_tasklist():
+            min_cost = sorted([branch.get_branch_costs() for branch in ra_pst.branches[task.attrib["id"]]])[0]
+            self.assertEqual(table.get_min_cost(task.attrib["id"]), min_cost)
+            self.assertEqual(get_deletion_savings(ra_pst, utils.get_label(task)), -min_cost)
+        self.assertIs(ra_pst.get_instance_copy().get_deletion_savings_table(), table)
+
+        # a task deleted from the process of one instance drops out of the table for that instance only
+        first, second = Instance.from_template(ra_pst, id=1), Instance.from_template(ra_pst, id=2)
+        branch, task = [(branch, task) for branches in ra_pst.branches.values() for branch in branches
+                        for task in branch.node.xpath("cpee1:children/descendant::*[self::cpee1:manipulate or self::cpee1:call][@type='delete']",
+                                                      namespaces=ra_pst.ns)][0]
+        label = utils.get_label(task)
+        savings = get_deletion_savings(first.ra_pst, label)
+        self.assertLess(savings, 0)
+        anchor = task.xpath("ancestor::cpee1:manipulate | ancestor::cpee1:call", namespaces=ra_pst.ns)[-1]
+        _, invalid = first.change_op.ChangeOperationFactory(first.ra_pst.process, anchor, task, branch.node, cptype="delete")
+        self.assertFalse(invalid)
+        self.assertEqual(get_deletion_savings(first.ra_pst, label), 0)
+        self.assertEqual(get_deletion_savings(second.ra_pst, label), savings)
@@ -1,13 +1,15 @@
 from src.ra_pst_py.builder import build_rapst, show_tree_as_graph
 from src.ra_pst_py.instance import transform_ilp_to_branches, Instance
 from src.ra_pst_py.brute_force import BruteForceSearch
-from src.ra_pst_py.cp_docplex import cp_solver
+from src.ra_pst_py.cp_docplex import cp_solver, CPSession, get_frozen_jobs, get_symmetry_classes, add_unfixed_instance, add_branch_constraints, BRANCH_FORMULATIONS
 from src.ra_pst_py.cp_docplex_decomposed import cp_solver_decomposed_monotone_cuts, cp_solver_decomposed_strengthened_cuts
 from src.ra_pst_py.ilp import configuration_ilp
 
+from docplex.cp.model import CpoModel
 from lxml import etree
 import unittest
 import json
+import copy
 
 
 class DocplexTest(unittest.TestCase):
@@ -88,3 +90,120 @@ class DocplexTest(unittest.TestCase):
         with open("test.json", "w") as f:
             json.dump(result, f, indent=2)
 
+
+    def test_solver_input_dict(self):
+        with open("tests/test_data/ilp_rep.json", "r") as f:
+            ilp_dict = json.load(f)
+        from_file = configuration_ilp("tests/test_data/ilp_rep.json")
+        from_dict = configuration_ilp(ilp_dict)
+        # a dict is solved in place
+        self.assertIs(from_dict, ilp_dict["instances"][0])
+        from_file.pop("runtime"), from_dict.pop("runtime")
+        self.assertEqual(from_dict, from_file)
+
+    def test_failed_solve_leaves_no_intervals(self):
+        with open("tests/test_data/ilp_rep.json", "r") as f:
+            ilp_dict = json.load(f)
+        # infeasible: all jobs of the fixed instance at 0, an unfixed copy of it follows
+        fixed = ilp_dict["instances"][0]
+        ilp_dict["instances"].append(copy.deepcopy(fixed))
+        fixed["fixed"] = True
+        for job in fixed["jobs"].values():
+            job["selected"], job["start"] = True, 0
+        for solve in (lambda schedule: cp_solver(schedule, timeout=1, sigma=1), CPSession(sigma=1, timeout=1).solve):
+            schedule = copy.deepcopy(ilp_dict)
+            with self.assertRaises(Exception):
+                solve(schedule)
+            self.assertFalse(any("interval" in job for ilp_rep in schedule["instances"] for job in ilp_rep["jobs"].values()))
+            json.dumps(schedule)
+
+    def test_session_retries_failed_arrival(self):
+        with open("tests/test_data/ilp_rep.json", "r") as f:
+            ilp_dict = json.load(f)
+        ilp_dict["instances"] = ilp_dict["instances"][:1]
+        # infeasible: every job has to end before it starts
+        infeasible = copy.deepcopy(ilp_dict)
+        for jobId, job in infeasible["instances"][0]["jobs"].items():
+            job["after"] = [jobId]
+        session = CPSession(timeout=1)
+        expressions = len(session.model.get_all_expressions())
+        with self.assertRaises(Exception):
+            session.solve(infeasible)
+        self.assertEqual(session.known_instances, 0)
+        self.assertEqual(session.instance_constraints, {})
+        self.assertEqual(session.resource_constraints, [])
+        self.assertEqual(len(session.model.get_all_expressions()), expressions)
+
+        # the same arrival is scheduled again by the next solve
+        schedule = session.solve(ilp_dict)
+        self.assertEqual(session.known_instances, 1)
+        self.assertTrue(schedule["instances"][0]["fixed"])
+        self.assertTrue(any(job["selected"] for job in schedule["instances"][0]["jobs"].values()))
+
+    def test_rolling_horizon(self):
+        # First instance configured and scheduled one job after the other, the second one arrives after it
+        first = configuration_ilp(self.ra_pst.get_ilp_rep(instance_id='i1'))
+        end = 0
+        for job in first["jobs"].values():
+            job["selected"] = bool(first["branches"][job["branch"]]["selected"])
+            if job["selected"]:
+                job["start"] = end
+                end += int(job["cost"])
+        first["fixed"] = True
+        second = self.ra_pst.get_ilp_rep(instance_id='i2')
+        for job in second["jobs"].values():
+            job["release_time"] = end
+        ra_psts = {"instances": [first, second], "resources": second["resources"]}
+
+        selected = {jobId for jobId, job in first["jobs"].items() if job["selected"]}
+        self.assertEqual(get_frozen_jobs(ra_psts), (selected, end))
+        self.assertEqual(get_frozen_jobs(ra_psts, sigma=1)[0], {jobId for jobId in selected if first["jobs"][jobId]["start"] + first["jobs"][jobId]["cost"] < end})
+        second["fixed"] = True
+        self.assertEqual(get_frozen_jobs(ra_psts), (set(), 0))
+        second["fixed"] = False
+
+        # an incremental session folds the frozen fixed intervals into its busy profiles
+        session = CPSession(sigma=1)
+        session.add_fixed_instance(0, first)
+        frozen_jobs = get_frozen_jobs(ra_psts, sigma=1)[0]
+        session.freeze_jobs(ra_psts)
+        self.assertEqual({jobId for _, jobId in session.fixed_intervals}, selected - frozen_jobs)
+        self.assertEqual(session.fixed_end, max(first["jobs"][jobId]["start"] + int(first["jobs"][jobId]["cost"]) for jobId in frozen_jobs))
+        self.assertFalse(any(jobId in frozen_jobs for _, jobId in session.fixed_constraints))
+
+        frozen = cp_solver(copy.deepcopy(ra_psts), timeout=10)
+        full = cp_solver(copy.deepcopy(ra_psts), timeout=10, rolling_horizon=False)
+        self.assertEqual(frozen["solution"]["objective"], full["solution"]["objective"])
+        self.assertEqual(frozen["instances"][0]["jobs"], full["instances"][0]["jobs"])
+
+    def test_branch_formulations(self):
+        ilp_rep = self.ra_pst.get_ilp_rep()
+        constraints = {}
+        for formulation in BRANCH_FORMULATIONS:
+            ra_pst = copy.deepcopy(ilp_rep)
+            model = CpoModel()
+            add_unfixed_instance(model, ra_pst)
+            constraints[formulation] = [str(constraint) for constraint in add_branch_constraints(model, ra_pst, formulation)]
+        # every exclusivity constraint once
+        self.assertEqual(constraints["grouped"], list(dict.fromkeys(constraints["pairwise"])))
+        with self.assertRaises(ValueError):
+            add_branch_constraints(CpoModel(), copy.deepcopy(ilp_rep), "unknown")
+
+        ra_psts = {"instances": [self.ra_pst.get_ilp_rep(instance_id=f'i{i+1}') for i in range(3)], "resources": ilp_rep["resources"]}
+        objectives = [cp_solver(copy.deepcopy(ra_psts), timeout=10, branch_formulation=formulation)["solution"]["objective"]
+                      for formulation in BRANCH_FORMULATIONS]
+        self.assertEqual(len(set(objectives)), 1)
+
+    def test_symmetry_breaking(self):
+        instances = [Instance.from_template(self.ra_pst, id=i, release_time=release_time).get_ilp_rep() for i, release_time in enumerate([0, 0, 5, 0])]
+        ra_psts = {"instances": instances, "resources": instances[0]["resources"]}
+        self.assertEqual(get_symmetry_classes(ra_psts), [[0, 1, 3]])
+        instances[1]["fixed"] = True
+        self.assertEqual(get_symmetry_classes(ra_psts), [[0, 3]])
+        instances[1]["fixed"] = False
+
+        broken = cp_solver(copy.deepcopy(ra_psts), timeout=10, break_symmetries=True)
+        full = cp_solver(copy.deepcopy(ra_psts), timeout=10)
+        self.assertEqual(broken["solution"]["symmetry classes"], 1)
+        self.assertNotIn("symmetry classes", full["solution"])
+        self.assertEqual(broken["solution"]["objective"], full["solution"]["objective"])
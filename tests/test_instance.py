@@ -1,6 +1,8 @@
 from src.ra_pst_py.builder import build_rapst, show_tree_as_graph
 from src.ra_pst_py.instance import transform_ilp_to_branches, Instance
+from src.ra_pst_py.change_operations import ChangeOperation
 from src.ra_pst_py.simulator import Simulator, AllocationTypeEnum
+from src.ra_pst_py import utils
 
 from lxml import etree
 import unittest
@@ -61,6 +63,89 @@ class InstanceTest(unittest.TestCase):
             )
             self.assertEqual(len(tasks), len(jobs))
 
+    def test_task_index(self):
+        ra_pst = build_rapst(
+            process_file="tests/test_data/test_instance_data/BPM_TestSet_10.xml",
+            resource_file="tests/test_data/test_instance_data/(0.6, 0.4, 0.0)-random-3-uniform-resource_based-2-1-10.xml",
+        )
+        instance = Instance(copy.deepcopy(ra_pst), {}, id=1)
+        schedule_file = "tests/test_data/test_instance_data/(0.6, 0.4, 0.0)-random-3-uniform-resource_based-2-1-10.json"
+        optimal_instance = instance.get_optimal_instance_from_schedule(schedule_file=schedule_file)
+        # index of the changed process must match a full document lookup
+        task_index = instance.get_task_index()
+        self.assertIs(task_index.root, optimal_instance)
+        ns = instance.ns
+        for task_id in set(optimal_instance.xpath("//@id")):
+            expected = optimal_instance.xpath(
+                f"//*[@id='{task_id}'][not(ancestor::cpee1:children) and not(ancestor::cpee1:allocation)]", namespaces=ns)
+            self.assertEqual(task_index.get_by_id(task_id), expected)
+        for task_id in ra_pst.get_tasklist(attribute="id"):
+            if task_id not in task_index.by_id:
+                self.assertEqual(task_index.get_by_id(task_id), [])
+        for task in instance.ra_pst.get_tasklist():
+            self.assertEqual(instance.ra_pst.get_task_index().get_by_label(utils.get_label(task)),
+                             [element for element in instance.ra_pst.get_tasklist() if utils.get_label(element) == utils.get_label(task)])
+        # a miss is authoritative, only rebuild scans the tree
+        task = task_index.get_by_id(next(iter(task_index.by_id)))[0]
+        task_index.remove(task)
+        self.assertEqual(task_index.get_by_id(task.attrib["id"]), [])
+        task_index.rebuild()
+        self.assertEqual(task_index.get_by_id(task.attrib["id"]), [task])
+
+    def test_shared_task_index(self):
+        ra_pst = build_rapst(
+            process_file="test_instances/instance_generator_process_short.xml",
+            resource_file="test_instances/instance_generator_resources.xml",
+        )
+        instance = Instance.from_template(ra_pst, id=1)
+        task_index = instance.get_task_index()
+        inserts = [(branch, task) for branches in ra_pst.branches.values() for branch in branches
+                   for task in branch.node.xpath("cpee1:children/descendant::*[self::cpee1:manipulate or self::cpee1:call][@type='insert']",
+                                                 namespaces=instance.ns)]
+        branch, task = inserts[0]
+        anchor = task.xpath("ancestor::cpee1:manipulate | ancestor::cpee1:call", namespaces=instance.ns)[-1]
+        # insert through another change operation on the same process, look up through the instance
+        other = ChangeOperation(ra_pst=instance.ra_pst.process)
+        other.ChangeOperationFactory(instance.ra_pst.process, anchor, task, branch.node, cptype="insert")
+        self.assertIs(other.get_task_index(instance.ra_pst.process), task_index)
+        self.assertEqual(len(task_index.get_by_id(task.attrib["id"])), 1)
+        self.assertIs(ChangeOperation(ra_pst=instance.ra_pst.ra_pst).get_task_index(instance.ra_pst.ra_pst),
+                      instance.ra_pst.get_task_index())
+
+    def test_from_template(self):
+        ra_pst = build_rapst(
+            process_file="test_instances/instance_generator_process_short.xml",
+            resource_file="test_instances/instance_generator_resources.xml",
+        )
+        template_state = (etree.tostring(ra_pst.ra_pst), etree.tostring(ra_pst.process),
+                          {task_id: [etree.tostring(branch.node) for branch in branches] for task_id, branches in ra_pst.branches.items()})
+        results = []
+        for from_template in (False, True):
+            file = f"out/schedule_from_template_{from_template}.json"
+            sim = Simulator(schedule_filepath=file, sigma=0, time_limit=10)
+            for i, release_time in enumerate([0, 1, 2]):
+                if from_template:
+                    instance = Instance.from_template(ra_pst, id=i, release_time=release_time)
+                else:
+                    instance = Instance(copy.deepcopy(ra_pst), {}, id=i, release_time=release_time)
+                sim.add_instance(instance, AllocationTypeEnum.HEURISTIC)
+            sim.simulate()
+            with open(file, "r") as f:
+                data = json.load(f)
+            for instance in data["instances"]:
+                instance.pop("times", None)
+            results.append((data["solution"]["objective"], data["instances"]))
+        self.assertEqual(results[0], results[1])
+        # the template is shared, not modified
+        self.assertEqual(template_state, (etree.tostring(ra_pst.ra_pst), etree.tostring(ra_pst.process),
+                          {task_id: [etree.tostring(branch.node) for branch in branches] for task_id, branches in ra_pst.branches.items()}))
+        instance = Instance.from_template(ra_pst, id=0, release_time=0)
+        self.assertIs(instance.ra_pst.get_allocation_tree(), ra_pst.ra_pst)
+        # the accessors of a copy return the full tree, not the task skeleton
+        self.assertIs(instance.ra_pst.get_ra_pst_etree(), ra_pst.ra_pst)
+        self.assertEqual(instance.ra_pst.get_ra_pst_str(), ra_pst.get_ra_pst_str())
+        self.assertEqual(instance.get_ilp_rep(), Instance(copy.deepcopy(ra_pst), {}, id=0, release_time=0).get_ilp_rep())
+
 
 def compare_task_w_jobs(ra_pst, ilp, instance_id):
     tree = etree.parse(ra_pst)
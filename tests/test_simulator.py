@@ -1,15 +1,23 @@
 from src.ra_pst_py.builder import build_rapst, show_tree_as_graph
-from src.ra_pst_py.simulator import Simulator, AllocationTypeEnum
-from src.ra_pst_py.heuristic import TaskAllocator
+from src.ra_pst_py.simulator import Simulator, AllocationTypeEnum, PersistencePolicy, EventQueue, QueueObject
+from src.ra_pst_py.heuristic import TaskAllocator, BeamSearch
+from src.ra_pst_py.timeline import ResourceTimeline
+from src.ra_pst_py.checkpoint import CheckpointJournal
 from src.ra_pst_py.instance import Instance
 from src.ra_pst_py.cp_docplex import cp_solver_scheduling_only
 from src.ra_pst_py.cp_docplex_decomposed import cp_subproblem
+from src.ra_pst_py import utils
 
 from lxml import etree
+import numpy as np
 import unittest
 import json
 import copy
 import time
+import signal
+import os
+import gc
+import weakref
 
 class ScheduleTest(unittest.TestCase):
 
@@ -40,6 +48,295 @@ class ScheduleTest(unittest.TestCase):
         target = 72
         self.assertEqual(objective, target, "HEURISTIC: The found objective does not match the target value")
 
+    def test_resource_timeline(self):
+        schedule = {"instances": [
+            {"jobs": {"0-a1-0-0": {"resource": "r1", "start": 10, "cost": 5, "selected": True},
+                      "0-a1-0-1": {"resource": "r1", "start": 0, "cost": 4, "selected": True},
+                      "0-a1-1-0": {"resource": "r1", "start": 4, "cost": 9, "selected": False}}},
+            {"jobs": {"1-a1-0-0": {"resource": "r1", "start": 20, "cost": 2, "selected": True},
+                      "1-a1-0-1": {"resource": "r2", "start": 3, "cost": 3, "selected": True}}}]}
+        timeline = ResourceTimeline.from_schedule(schedule)
+        self.assertEqual(timeline.get_intervals("r1", 0), [(0, 4), (10, 15), (20, 22)])
+        self.assertEqual(timeline.earliest_start("r1", 0, 4), 4.0)      # gap 4-10
+        self.assertEqual(timeline.earliest_start("r1", 0, 7), 22.0)     # after the last job
+        self.assertEqual(timeline.earliest_start("r1", 5, 4), 15.0)     # gaps are only used from their start
+        self.assertEqual(timeline.earliest_start("r1", 30, 4), 30.0)
+        self.assertEqual(timeline.earliest_start("r3", 2, 4), 2.0)      # unused resource
+        self.assertEqual(timeline.get_timeslot_matrix("r1", 5).tolist(), [[0, 10], [15, 20], [22, np.inf]])
+        self.assertEqual(timeline.earliest_starts("r1", np.array([0., 0., 5., 30.]), np.array([4., 7., 4., 4.])).tolist(),
+                         [4.0, 22.0, 15.0, 30.0])
+
+        # incremental insertion equals building from the schedule
+        incremental = ResourceTimeline()
+        for start, end in [(20, 22), (10, 15), (0, 4)]:
+            incremental.add("r1", start, end)
+        self.assertEqual(incremental.intervals["r1"], timeline.intervals["r1"])
+        # overlapping intervals fall back to a full scan over the gaps of the timeslot matrix
+        incremental.add("r1", 1, 30)
+        self.assertIn("r1", incremental.unsorted_ends)
+        self.assertEqual(incremental.get_timeslot_matrix("r1", 0).tolist(), [[0, 0], [4, 1], [30, 10], [15, 20], [22, np.inf]])
+        self.assertEqual(incremental.earliest_start("r1", 0, 3), 15.0)
+
+        # released intervals end before any later release time
+        timeline.release(5)
+        self.assertEqual(timeline.intervals["r1"], [(10, 15), (20, 22)])
+        self.assertEqual(timeline.earliest_start("r1", 5, 4), 15.0)
+        self.assertEqual(timeline.earliest_starts("r1", np.array([5., 30.]), np.array([4., 4.])).tolist(), [15.0, 30.0])
+        incremental.release(16)
+        self.assertEqual(incremental.intervals["r1"], [(1, 30), (20, 22)])
+
+    def test_batch_allocation(self):
+        ra_pst = self.ra_pst
+        results = []
+        for batch in (False, True):
+            file = f"out/schedule_batch_{batch}.json"
+            sim = Simulator(schedule_filepath=file, sigma=0, time_limit=10)
+            for i, release_time in enumerate([0, 1, 2, 5]):
+                instance = Instance.from_template(ra_pst, id=i, release_time=release_time)
+                instance.allocator.batch = batch
+                instance.allocator.MIN_VECTORIZED_BRANCHES = 1 if i % 2 else 100 # NumPy and scalar evaluation
+                sim.add_instance(instance, AllocationTypeEnum.HEURISTIC)
+            sim.simulate()
+            with open(file, "r") as f:
+                data = json.load(f)
+            for instance in data["instances"]:
+                instance.pop("times", None)
+            results.append((data["solution"]["objective"], data["instances"]))
+        self.assertEqual(results[0], results[1])
+
+        # only the selected branch gets its times written
+        instance = Instance.from_template(ra_pst, id=0, release_time=0)
+        task = instance.ra_pst.get_tasklist()[0]
+        branch, interval = instance.allocator.allocate_task(task, None, ResourceTimeline())
+        for other in instance.ra_pst.branches[task.attrib["id"]]:
+            self.assertEqual(bool(other.node.xpath("//cpee1:expected_start", namespaces=instance.ns)), other is branch)
+
+    def test_beam_heuristic(self):
+        results = {}
+        for allocation_type, beam_width in [(AllocationTypeEnum.SINGLE_INSTANCE_HEURISTIC, None),
+                                            (AllocationTypeEnum.BEAM_HEURISTIC, 1), (AllocationTypeEnum.BEAM_HEURISTIC, 4)]:
+            file = f"out/schedule_{str(allocation_type)}_{beam_width}.json"
+            sim = Simulator(schedule_filepath=file, sigma=0, time_limit=10, beam_width=beam_width, beam_time_budget=10)
+            for i, release_time in enumerate([0, 1, 2]):
+                sim.add_instance(Instance.from_template(self.ra_pst, id=i, release_time=release_time), allocation_type)
+            sim.simulate()
+            with open(file, "r") as f:
+                data = json.load(f)
+            for instance in data["instances"]:
+                instance.pop("times", None)
+            results[beam_width] = (data["solution"]["objective"], data["instances"])
+        # a beam of width 1 is the single instance heuristic
+        self.assertEqual(results[1], results[None])
+        self.assertLessEqual(results[4][0], results[None][0])
+
+    def test_beam_search_without_plans(self):
+        choices = []
+        for plans in (True, False):
+            instance = Instance.from_template(self.ra_pst, id=0, release_time=0)
+            if not plans:
+                # branches without a plan (parallel, replace) are propagated through a TaskNode
+                instance.allocator.get_branch_plan = lambda *args: None
+            tasks = instance.get_remaining_tasks()
+            beam_search = BeamSearch(instance.allocator, width=4, time_budget=10)
+            choices.append(beam_search.search(tasks, 0.0, ResourceTimeline.from_schedule({})))
+        self.assertEqual(choices[0], choices[1])
+        self.assertTrue(choices[0])
+        # the budget is checked per candidate
+        beam_search = BeamSearch(instance.allocator, width=4, time_budget=0)
+        self.assertEqual(beam_search.search(tasks, 0.0, ResourceTimeline.from_schedule({})), {})
+
+    def test_multistart_heuristic(self):
+        file = "out/schedule_multistart_single.json"
+        sim = Simulator(schedule_filepath=file, sigma=0, time_limit=10)
+        for i, release_time in enumerate([0, 1, 2]):
+            instance = Instance.from_template(self.ra_pst, id=i, release_time=release_time)
+            instance.allocator.batch = i != 0
+            sim.add_instance(instance, AllocationTypeEnum.HEURISTIC)
+        sim.simulate()
+        with open(file, "r") as f:
+            single_objective = json.load(f)["solution"]["objective"]
+
+        results = []
+        for workers in (1, 2):
+            file = f"out/schedule_multistart_{workers}.json"
+            sim = Simulator(schedule_filepath=file, sigma=0, time_limit=10, multistart_runs=3, multistart_workers=workers)
+            for i, release_time in enumerate([0, 1, 2]):
+                instance = Instance.from_template(self.ra_pst, id=i, release_time=release_time)
+                instance.allocator.batch = i != 0
+                sim.add_instance(instance, AllocationTypeEnum.MULTISTART_HEURISTIC)
+            sim.simulate()
+            with open(file, "r") as f:
+                data = json.load(f)
+            runs = data["solution"]["multistart"]["runs"]
+            self.assertEqual([run["run"] for run in runs], [0, 1, 2])
+            self.assertTrue(all(run["computing time"] > 0 for run in runs))
+            # run 0 is the deterministic heuristic
+            self.assertEqual(runs[0]["objective"], single_objective)
+            self.assertEqual(data["objective"], min(run["objective"] for run in runs))
+            self.assertLessEqual(data["solution"]["objective"], single_objective)
+            for instance in data["instances"]:
+                instance.pop("times", None)
+            results.append(([(run["seed"], run["objective"]) for run in runs], data["instances"]))
+        # seeded runs do not depend on the number of workers
+        self.assertEqual(results[0], results[1])
+
+    def test_event_queue(self):
+        queue = EventQueue()
+        objects = [QueueObject(None, i, AllocationTypeEnum.HEURISTIC, None, release_time) for i, release_time in enumerate([3, 1, 3, 0])]
+        queue.push_many(objects[:3])
+        queue.push(objects[3])
+        self.assertEqual(len(queue), 4)
+        self.assertIs(queue.peek(), objects[3])
+        self.assertEqual([queue_object.schedule_idx for queue_object in queue], [3, 1, 0, 2])
+        self.assertIs(queue.pop(), objects[3])
+        self.assertIs(queue.pop(), objects[1])
+        # a re-inserted object goes behind queued objects with the same release time
+        objects[1].release_time = 3
+        queue.push(objects[1])
+        self.assertEqual([queue.pop().schedule_idx for _ in range(len(queue))], [0, 2, 1])
+        self.assertFalse(queue)
+
+    def test_arrival_batches(self):
+        release_times = [0, 0, 1, 3, 3.5, 10]
+        batches = {}
+        for batch_window in (None, 0, 1):
+            sim = Simulator(schedule_filepath="out/schedule_batches.json", sigma=0, time_limit=10, batch_window=batch_window)
+            sim.add_instances([Instance.from_template(self.ra_pst, id=i, release_time=release_time)
+                               for i, release_time in enumerate(release_times)], AllocationTypeEnum.SINGLE_INSTANCE_CP)
+            batches[batch_window] = []
+            while sim.task_queue:
+                batches[batch_window].append([queue_object.schedule_idx for queue_object in sim.pop_arrival_batch(sim.task_queue)])
+        self.assertEqual(batches[None], [[0], [1], [2], [3], [4], [5]])
+        self.assertEqual(batches[0], [[0, 1], [2], [3], [4], [5]])
+        self.assertEqual(batches[1], [[0, 1, 2], [3, 4], [5]])
+
+    def test_arrival_batches_cp(self):
+        release_times = [0, 1, 3, 4]
+        file = "out/schedule_batches_cp.json"
+        sim = Simulator(schedule_filepath=file, sigma=0, time_limit=10, batch_window=1)
+        sim.add_instances([Instance.from_template(self.ra_pst, id=i, release_time=release_time)
+                           for i, release_time in enumerate(release_times)], AllocationTypeEnum.SINGLE_INSTANCE_CP)
+        sim.simulate()
+        with open(file, "r") as f:
+            data = json.load(f)
+        # batches [0, 1] and [3, 4] are decided at their latest arrival
+        for ilp_rep, decision_time in zip(data["instances"], [1, 1, 4, 4]):
+            for job in ilp_rep["jobs"].values():
+                if job["selected"]:
+                    self.assertGreaterEqual(job["start"], decision_time)
+
+    def test_persistence_policy(self):
+        file = "out/schedule_persistence.json"
+        saves = {}
+        for every_n_tasks in (None, 1, 4):
+            sim = Simulator(schedule_filepath=file, sigma=0, time_limit=10, persistence=PersistencePolicy(every_n_tasks=every_n_tasks))
+            instances = [Instance(copy.deepcopy(self.ra_pst), {}, id=i, release_time=release_time) for i, release_time in enumerate([0, 1, 2])]
+            for instance in instances:
+                sim.add_instance(instance, AllocationTypeEnum.HEURISTIC)
+            save_schedule = sim.save_schedule
+            saves[every_n_tasks] = []
+            sim.save_schedule = lambda schedule, saves=saves[every_n_tasks]: (saves.append(1), save_schedule(schedule))
+            sim.simulate()
+            tasks = sum(len(instance.times) for instance in instances)
+            with open(file, "r") as f:
+                self.assertEqual(json.load(f)["solution"]["objective"], 72)
+        self.assertEqual(len(saves[None]), 1)
+        self.assertEqual(len(saves[1]), tasks + 1)
+        self.assertEqual(len(saves[4]), tasks // 4 + 1)
+
+        policy = PersistencePolicy(on_signal=signal.SIGUSR1)
+        policy.install()
+        self.assertFalse(policy.task_done())
+        os.kill(os.getpid(), signal.SIGUSR1)
+        self.assertTrue(policy.task_done())
+        self.assertFalse(policy.task_done())
+        policy.uninstall()
+        self.assertIs(signal.getsignal(signal.SIGUSR1), signal.SIG_DFL)
+
+        # the handler is restored even if the run raises
+        sim = Simulator(schedule_filepath=file, sigma=0, time_limit=10, persistence=PersistencePolicy(on_signal=signal.SIGUSR1))
+        sim.add_instance(Instance.from_template(self.ra_pst, id=0, release_time=0), AllocationTypeEnum.SINGLE_INSTANCE_HEURISTIC)
+        sim.allocate_instance_heuristic = None
+        with self.assertRaises(TypeError):
+            sim.simulate()
+        self.assertIs(signal.getsignal(signal.SIGUSR1), signal.SIG_DFL)
+
+    def test_checkpoint_resume(self):
+        allocation_type = AllocationTypeEnum.SINGLE_INSTANCE_HEURISTIC
+        file = "out/schedule_checkpoint.json"
+        release_times = [0, 1, 2, 3]
+        sim = Simulator(schedule_filepath=file, sigma=0, time_limit=10)
+        for i, release_time in enumerate(release_times):
+            sim.add_instance(Instance.from_template(self.ra_pst, id=i, release_time=release_time), allocation_type)
+        sim.simulate()
+        with open(file, "r") as f:
+            target = json.load(f)
+
+        # the run is killed after the third instance: snapshot after two steps, one journal line and a torn one
+        checkpoint = CheckpointJournal("out/checkpoint", compact_every=2)
+        sim = Simulator(schedule_filepath=file, sigma=0, time_limit=10, checkpoint=checkpoint)
+        for i, release_time in enumerate(release_times):
+            sim.add_instance(Instance.from_template(self.ra_pst, id=i, release_time=release_time), allocation_type)
+        commit = checkpoint.commit
+        def killing_commit(schedule, arrivals=(), dirty=None):
+            compacted = commit(schedule, arrivals, dirty)
+            if checkpoint.step == 3:
+                raise KeyboardInterrupt
+            return compacted
+        checkpoint.commit = killing_commit
+        with self.assertRaises(KeyboardInterrupt):
+            sim.simulate()
+        # a journal line only holds the instances changed by its step
+        with open(checkpoint.journal_path, "r") as f:
+            self.assertEqual(list(json.loads(f.readline())["instances"]), ["2"])
+        with open(checkpoint.journal_path, "a") as f:
+            f.write('{"step": 4, "arriv')
+
+        sim = Simulator(schedule_filepath=file, sigma=0, time_limit=10)
+        instances = [Instance.from_template(self.ra_pst, id=i, release_time=release_time) for i, release_time in enumerate(release_times)]
+        sim.add_instances(instances, allocation_type)
+        sim.resume("out/checkpoint")
+        # only the last instance is allocated again
+        self.assertEqual([bool(instance.times) for instance in instances], [False, False, False, True])
+        with open(file, "r") as f:
+            data = json.load(f)
+        self.assertEqual(data["solution"]["objective"], target["solution"]["objective"])
+        self.assertEqual(data["instances"], target["instances"])
+        self.assertEqual(sim.checkpoint.arrivals, {0, 1, 2, 3})
+
+    def test_simulate_stream(self):
+        release_times = [0, 0, 1, 2, 5, 9]
+        for allocation_type in (AllocationTypeEnum.HEURISTIC, AllocationTypeEnum.SINGLE_INSTANCE_HEURISTIC):
+            file = f"out/schedule_{str(allocation_type)}_stream.json"
+            sim = Simulator(schedule_filepath=file, sigma=0, time_limit=10)
+            sim.add_instances([Instance.from_template(self.ra_pst, id=i, release_time=release_time)
+                               for i, release_time in enumerate(release_times)], allocation_type)
+            sim.simulate()
+            with open(file, "r") as f:
+                target = json.load(f)
+
+            released = []
+            def arrivals():
+                for i, release_time in enumerate(release_times):
+                    instance = Instance.from_template(self.ra_pst, id=i, release_time=release_time)
+                    released.append(weakref.ref(instance))
+                    yield release_time, instance
+            sim = Simulator(schedule_filepath=file, sigma=0, time_limit=10)
+            sim.simulate_stream(arrivals(), allocation_type)
+            with open(file, "r") as f:
+                data = json.load(f)
+            # the completed instances of a stream are cut down to their selected jobs
+            self.assertEqual(data["instances"], [utils.compact_ilp_rep(ilp_rep) for ilp_rep in target["instances"]])
+            self.assertTrue(all(job["selected"] for ilp_rep in data["instances"] for job in ilp_rep["jobs"].values()))
+            self.assertEqual(data["solution"]["objective"], target["solution"]["objective"])
+            gc.collect()
+            self.assertTrue(all(instance() is None for instance in released))
+
+        sim = Simulator(schedule_filepath="out/schedule_stream.json", sigma=0, time_limit=10)
+        with self.assertRaises(ValueError):
+            sim.simulate_stream([(release_time, Instance.from_template(self.ra_pst, id=i, release_time=release_time))
+                                 for i, release_time in enumerate([1, 0])], AllocationTypeEnum.HEURISTIC)
+
     def test_single_instance_heuristic(self):
         release_times = [0,1,2]
         # Heuristic Single Task allocation
@@ -101,6 +398,20 @@ class ScheduleTest(unittest.TestCase):
         self.assertEqual(objective, target, "SINGLE_INSTANCE_CP: The found objective does not match the target value")
 
 
+    def test_single_instance_sim_incremental(self):
+        release_times = [0, 0, 0]
+        allocation_type = AllocationTypeEnum.SINGLE_INSTANCE_CP
+        file = f"out/schedule_{str(allocation_type)}_incremental.json"
+        sim = Simulator(schedule_filepath=file, sigma=0, time_limit=10, incremental_cp=True)
+        for i, release_time in enumerate(release_times):
+            sim.add_instance(Instance.from_template(self.ra_pst, id=i, release_time=release_time), allocation_type)
+        sim.simulate()
+        with open(file, "r") as f:
+            data = json.load(f)
+        self.assertEqual(data["solution"]["objective"], 70, "SINGLE_INSTANCE_CP: The incremental session does not match the target value")
+        self.assertEqual(sim.cp_session.known_instances, len(release_times))
+        self.assertFalse(sim.cp_session.instance_constraints)
+
     def test_ilp_sched(self):
         release_times = [0,1]
         # Heuristic Single Task allocation
@@ -28,17 +28,18 @@ class EvalPipeline:
         schedule_dir: os.PathLike | str = "out/sim_schedule.json",
         sigma: int = 0,
         time_limit: int = 100,
+        break_symmetries: bool = False,
     ) -> None:
         # Check for replace pattern:
         for instance in instances:
-            if "replace" in instance.ra_pst.get_ra_pst_etree().xpath("//@type"):
+            if "replace" in instance.ra_pst.get_allocation_tree().xpath("//@type"):
                 raise NotImplementedError(
                     "Replace pattern not implemented for allocation"
                 )
 
         # Instantiate simulator
         self.sim = Simulator(
-            schedule_filepath=schedule_dir, sigma=sigma, time_limit=time_limit
+            schedule_filepath=schedule_dir, sigma=sigma, time_limit=time_limit, break_symmetries=break_symmetries
         )
         
         # Add instances to simulator
@@ -94,11 +95,12 @@ class EvalPipeline:
             ra_pst.get_problem_size() if ra_pst is not None else None
         )
         metadata["metadata"]["release_times"] = self.release_times
+        metrics = ra_pst.get_metrics() if ra_pst is not None else None
         metadata["metadata"]["flex_factor"] = (
-            ra_pst.get_flex_factor() if ra_pst is not None else None
+            metrics.flex_factor if metrics is not None else None
         )
         metadata["metadata"]["enthropy"] = (
-            ra_pst.get_enthropy() if ra_pst is not None else None
+            metrics.entropy if metrics is not None else None
         )
 
         # Parallelity measure
@@ -176,6 +178,7 @@ class EvalPipeline:
 
     def run_same_release(
         self, dirpath: os.PathLike, allocation_types: list = [], num_instances:int=10, time_limit:int=100, sigma:int = None, suffix:str="", add_metadata:bool=True,
+        break_symmetries:bool=False,
     ):
         """
         Executes various solution approaches for all subdirectories within `dirpath`.
@@ -194,6 +197,7 @@ class EvalPipeline:
             time_limit (int): Timeout for the allocation approach.
             sigma (Optional[int]): Sigma value for online allocation.  
                 If `None`, it defaults to 1 times the average task size.
+            break_symmetries (bool): Order the identical instances in the all instance CP solvers.
         """
 
         if not allocation_types:
@@ -219,7 +223,7 @@ class EvalPipeline:
 
                 # Build rapst instances:
                 instances = [
-                    Instance(copy.deepcopy(ra_pst), {}, id=i, release_time=0)
+                    Instance.from_template(ra_pst, id=i, release_time=0)
                     for i in range(num_instances)
                 ]
 
@@ -239,7 +243,8 @@ class EvalPipeline:
                         sigma=sigma,
                         time_limit=time_limit,
                         suffix=suffix,
-                        add_metadata=add_metadata
+                        add_metadata=add_metadata,
+                        break_symmetries=break_symmetries
                     )
 
                 print("==============")
@@ -296,7 +301,7 @@ class EvalPipeline:
                 release_times = self.generate_release_times(num_instances, spread) if not fixed_release_times else fixed_release_times(dirpath, resource_file)
                 # Build rapst instances:
                 instances = [
-                    Instance(copy.deepcopy(ra_pst), {}, id=i, release_time=release_time)
+                    Instance.from_template(ra_pst, id=i, release_time=release_time)
                     for i, release_time in enumerate(release_times)
                 ]
 
@@ -403,7 +408,7 @@ class EvalPipeline:
             for i in range(num_instances):
                 # Build rapst instances:
                 #instances.append(Instance(copy.deepcopy(ra_pst), {}, id=i, release_time=release_times[i]))
-                instances.append(Instance(copy.deepcopy(ra_psts[i]), {}, id=i, release_time=release_times[i]))
+                instances.append(Instance.from_template(ra_psts[i], id=i, release_time=release_times[i]))
 
                 # Print problem size of ra_pst
             print(f"{i} instances generated")
@@ -482,7 +487,8 @@ class EvalPipeline:
         suffix: str = "",
         add_metadata:bool = True, 
         different_instances:bool = False,
-        res_file_suffix:str = ""
+        res_file_suffix:str = "",
+        break_symmetries:bool = False
     ):
         """Setup and run simulation for a given allocation type."""
         schedule_path = (
@@ -501,6 +507,7 @@ class EvalPipeline:
             schedule_dir=schedule_path,
             sigma=sigma,
             time_limit=time_limit,
+            break_symmetries=break_symmetries,
         )
 
         # Run the simulation